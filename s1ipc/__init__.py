@@ -1,4 +1,14 @@
 __author__ = 'matheus2740'
 
-from server import BaseIPCServer, IPCAvailable
-from client import BaseIPCClient
\ No newline at end of file
+from .server import BaseIPCServer, IPCAvailable, publish
+from .client import BaseIPCClient, Subscription, execute_all
+from .protocol import BaseIPCProtocol, BinaryIPCProtocol
+from .eventloop import EventLoopMixIn, EventLoopIPCServer
+from .pool import ClientPool
+from .transport import AuthenticationError
+
+try:
+    from .aioclient import AsyncIPCClient
+except ImportError:
+    # asyncio is only available on python 3
+    pass
@@ -0,0 +1,269 @@
+import asyncio
+import itertools
+
+from .client import Caller, IPCCLientException, hello_message, parse_hello
+from .protocol import BinaryIPCProtocol
+from .transport import (AuthenticationError, TOKEN_FLAGS, answer_challenge, check_proof, get_authkey, is_tcp,
+                        is_token, tune_tcp)
+
+__author__ = 'matheus2740'
+
+
+def then(future, func):
+    """
+    Chains a function to the result of a future.
+    If `func` returns an awaitable, the returned future is resolved with its result instead.
+    Exceptions raised by the future or by `func` are propagated to the returned future.
+    :param future: an asyncio future.
+    :param func: a function receiving the result of `future`.
+    :return: a new future, resolved with the result of `func`.
+    """
+    loop = future.get_loop() if hasattr(future, 'get_loop') else future._loop
+    chained = loop.create_future()
+
+    def propagate(inner):
+        if chained.cancelled():
+            return
+        if inner.cancelled():
+            chained.cancel()
+        elif inner.exception() is not None:
+            chained.set_exception(inner.exception())
+        else:
+            chained.set_result(inner.result())
+
+    def done(f):
+        if chained.cancelled():
+            return
+        if f.cancelled():
+            chained.cancel()
+            return
+        if f.exception() is not None:
+            chained.set_exception(f.exception())
+            return
+        try:
+            result = func(f.result())
+        except Exception as e:
+            chained.set_exception(e)
+            return
+        if asyncio.isfuture(result) or asyncio.iscoroutine(result):
+            asyncio.ensure_future(result, loop=loop).add_done_callback(propagate)
+        else:
+            chained.set_result(result)
+
+    future.add_done_callback(done)
+    return chained
+
+
+class _FrameReader(asyncio.Protocol):
+    """
+    asyncio protocol which splits the incoming byte stream into frames and hands
+    every decoded reply to its `AsyncIPCClient`.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.client._transport = transport
+
+    def data_received(self, data):
+        self.buffer.extend(data)
+        protocol = self.client.protocol
+        header_size = protocol.HEADER_SIZE
+        start = 0
+        while len(self.buffer) - start >= header_size:
+            length, flags = protocol.HEADER.unpack_from(self.buffer, start)
+            end = start + header_size + length
+            if self.client._handshake is not None and not is_token(length, flags):
+                self.client._token_received(None)
+                return
+            if len(self.buffer) < end:
+                break
+            if self.client._handshake is not None:
+                if not self.client._token_received(bytes(self.buffer[start + header_size:end])):
+                    return
+            else:
+                self.client._reply_received(protocol.loads(flags, self.buffer[start + header_size:end]))
+            start = end
+        if start:
+            del self.buffer[:start]
+
+    def connection_lost(self, exc):
+        self.client._connection_lost(exc)
+
+
+class AsyncCaller(Caller):
+    """
+    Caller which sends the call without waiting for the reply, returning a future instead.
+    """
+
+    def __call__(self, *args, **kwargs):
+        return self.client._send(self, self.request(args, kwargs))
+
+
+class AsyncIPCClient(object):
+    """
+    asyncio client to an IPC server.
+    Like `BaseIPCClient`, any method called on an AsyncIPCClient instance is called on the server, but instead of
+    blocking it returns a future which is resolved with the result. Any number of calls may be in flight on the same
+    connection at once; replies are matched to their calls by request id.
+
+        client = AsyncIPCClient(address)
+        await client.connect()
+        results = await asyncio.gather(*[client.get(namespace, key) for key in keys])
+
+    The notable exceptions are the object methods and 'connect', 'disconnect' and 'shutdown'.
+    """
+
+    protocol = BinaryIPCProtocol
+
+    def __init__(self, address='/tmp/BaseIPCServer.sock', loop=None, serializer=None, compression=None, authkey=None):
+        """
+        Initializes a client. The connection is only opened by `connect`.
+        :param address: The UNIX socket path, or a (host, port) tuple to connect through TCP
+        :param loop: (optional) the event loop to use, defaults to the current event loop.
+        :param serializer: (optional) name of the serializer to use, or list of names in order of preference,
+         negotiated with the server on connection (refer to `BaseIPCClient`).
+        :param compression: (optional) name of the codec compressing large calls and replies, or list of names in
+         order of preference, negotiated with the serializer.
+        :param authkey: (optional) shared secret of TCP connections, defaults to the S1IPC_AUTHKEY environment
+         variable (refer to `BaseIPCClient`).
+        """
+        self._address = address
+        self._authkey = get_authkey(authkey) if is_tcp(address) else None
+        # (future, challenge sent) while the handshake of a TCP connection runs
+        self._handshake = None
+        self._preferred = (serializer, compression)
+        self.serializer = None
+        self.codec = None
+        self._loop = loop or asyncio.get_event_loop()
+        self._transport = None
+        self._pending = {}
+        self._request_ids = itertools.count()
+        self.connected = False
+
+    def connect(self):
+        """
+        Connects to the server.
+        :return: a future resolved with this client once the connection is made.
+        :raise AuthenticationError: if no authkey is set for a TCP address. The future fails with it if the handshake
+         fails.
+        """
+        if is_tcp(self._address):
+            if self._authkey is None:
+                raise AuthenticationError('TCP connections need an authkey '
+                                          '(or the S1IPC_AUTHKEY environment variable).')
+            self._handshake = (self._loop.create_future(), None)
+            connection = self._loop.create_task(
+                self._loop.create_connection(lambda: _FrameReader(self), *self._address))
+        else:
+            connection = self._loop.create_task(
+                self._loop.create_unix_connection(lambda: _FrameReader(self), self._address))
+
+        def connected(result):
+            if is_tcp(self._address):
+                tune_tcp(self._transport.get_extra_info('socket'))
+                return then(self._handshake[0], authenticated)
+            return authenticated(None)
+
+        def authenticated(result):
+            self.connected = True
+            if self._preferred == (None, None):
+                return self
+            hello = self._loop.create_future()
+            self._pending['__!hello__'] = (None, hello)
+            self._transport.writelines(self.protocol.pack_frames(hello_message(*self._preferred)))
+            return then(hello, negotiated)
+
+        def negotiated(reply):
+            self.serializer, self.codec = parse_hello(reply)
+            return self
+
+        return then(connection, connected)
+
+    def disconnect(self):
+        """
+        Sends a goodbye message to the server and closes the connection.
+        """
+        self._close('__!goodbye__')
+
+    def shutdown(self):
+        """
+        Requests the server to shutdown itself (harakiri request).
+        """
+        self._close('__!shutdown__')
+
+    def _close(self, message):
+        self.connected = False
+        if self._transport is not None and not self._transport.is_closing():
+            self._transport.writelines(self.protocol.pack_frames(message))
+            self._transport.close()
+
+    def _send(self, caller, data):
+        future = self._loop.create_future()
+        if self._transport is None or self._transport.is_closing():
+            future.set_exception(IPCCLientException('Not connected to the IPC server.'))
+            return future
+        self._pending[data['id']] = (caller, future)
+        self._transport.writelines(self.protocol.pack_frames(data, serializer=self.serializer, codec=self.codec))
+        return future
+
+    def _send_token(self, token):
+        self._transport.writelines([self.protocol.HEADER.pack(len(token), TOKEN_FLAGS), token])
+
+    def _token_received(self, token):
+        # handshake of a TCP connection (refer to `s1ipc.transport.authenticate`): the first token is the challenge of
+        # the server, the second one its proof; None if the server sent anything else. Returns False if the handshake
+        # failed, in which case the connection is closed and nothing more must be read from it
+        future, challenge = self._handshake
+        try:
+            if token is None and challenge is None:
+                raise AuthenticationError('The IPC server did not send a challenge.')
+            if challenge is None:
+                answer, challenge = answer_challenge(self._authkey, token)
+                self._handshake = (future, challenge)
+                self._send_token(answer)
+                return True
+            check_proof(self._authkey, challenge, token)
+        except AuthenticationError as e:
+            self._handshake = None
+            if not future.done():
+                future.set_exception(e)
+            self._transport.close()
+            return False
+        self._handshake = None
+        if not future.done():
+            future.set_result(None)
+        return True
+
+    def _reply_received(self, reply):
+        if isinstance(reply, tuple) and reply[0] == '__!hello__':
+            caller, future = self._pending.pop('__!hello__', (None, None))
+            if future is not None and not future.done():
+                future.set_result(reply)
+            return
+        caller, future = self._pending.pop(reply[1], (None, None))
+        if future is not None and not future.done():
+            future.set_result(caller.parse(reply))
+
+    def _connection_lost(self, exc):
+        self.connected = False
+        self._transport = None
+        if self._handshake is not None:
+            future, self._handshake = self._handshake[0], None
+            if not future.done():
+                future.set_exception(AuthenticationError('The IPC server refused the authkey.'))
+        pending, self._pending = self._pending, {}
+        for caller, future in pending.values():
+            if not future.done():
+                future.set_exception(IPCCLientException('Connection to the IPC server lost.'))
+
+    def __getattr__(self, item):
+        """
+        Any method (with exception of the above defined and the object methods) called on an instance
+        of AsyncIPCClient returns an `AsyncCaller` for the function of that name on the server.
+        """
+        if item.startswith('__'):
+            raise AttributeError(item)
+        return AsyncCaller(self, item)
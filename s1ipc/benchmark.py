@@ -0,0 +1,294 @@
+"""
+Load generator and benchmark suite for s1ipc servers and the SharedCache system.
+
+Every run starts a fresh server, then `clients` processes calling it as fast as they can for `duration` seconds,
+each through its own connection, and reports the throughput and the latency percentiles of the calls as JSON,
+so runs can be compared across protocol, transport and server engine changes:
+
+    python -m s1ipc.benchmark --workloads echo,get,put,memoize --clients 1,8 --payloads 100,10000 \\
+        --distributions uniform,zipf --engines threaded,eventloop --transports unix,tcp --output results.json
+
+Workloads:
+ - echo: a functor returning its argument, the payload.
+ - get, put: `SharedCache` reads of keys set beforehand, and writes of the payload.
+ - memoize: calls of a `Memoize` decorated function returning the payload, whose misses and hits are reported.
+Keys are drawn from `keys` keys, uniformly or following a Zipf distribution (a few keys are most of the calls).
+Transports are 'unix' (the default), 'tcp' and 'shm'; the shared-memory rings are experimental (refer to
+`ShmChannel`), so they are only benchmarked when requested.
+"""
+from __future__ import print_function
+import argparse
+import bisect
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+from .client import BaseIPCClient
+from .metrics import Histogram, clock
+from .pool import ClientPool
+from .server import BaseIPCServer
+from .sharedcache import SharedCache, SharedCacheServer, EventLoopSharedCacheServer, Memoize
+
+__author__ = 'matheus2740'
+
+WORKLOADS = ('echo', 'get', 'put', 'memoize')
+DISTRIBUTIONS = ('uniform', 'zipf')
+ENGINES = {'threaded': SharedCacheServer, 'eventloop': EventLoopSharedCacheServer}
+TRANSPORTS = ('unix', 'shm', 'tcp')
+NAMESPACE = 'benchmark'
+
+
+class ShmSharedCacheServer(SharedCacheServer):
+    """
+    SharedCacheServer letting its clients move to the experimental shared-memory transport.
+    """
+    shm_transport = True
+
+
+def echo(payload):
+    return payload
+
+
+BaseIPCServer.register_functor(echo, 'benchmark_echo')
+
+
+class KeyChooser(object):
+    """
+    Draws key numbers from 0 to `keys` - 1, uniformly or following a Zipf distribution of exponent `s`, where key
+    number k is drawn with a probability proportional to 1 / (k + 1) ** s.
+    """
+
+    def __init__(self, keys, distribution='uniform', s=1.1, seed=None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError('Unknown key distribution: %r' % (distribution,))
+        self.keys = keys
+        self.random = random.Random(seed)
+        self.cdf = None
+        if distribution == 'zipf':
+            total = 0.0
+            self.cdf = []
+            for k in range(keys):
+                total += 1.0 / (k + 1) ** s
+                self.cdf.append(total)
+            self.cdf = [c / total for c in self.cdf]
+
+    def __call__(self):
+        if self.cdf is None:
+            return self.random.randrange(self.keys)
+        return min(bisect.bisect_left(self.cdf, self.random.random()), self.keys - 1)
+
+
+def _address(transport):
+    if transport == 'tcp':
+        return '127.0.0.1', 0
+    return '/tmp/s1ipc-benchmark-%d.sock' % os.getpid()
+
+
+def _client_kwargs(config):
+    kwargs = {'serializer': config['serializer'], 'compression': config['compression'], 'authkey': config['authkey']}
+    if config['transport'] == 'shm':
+        kwargs['transport'] = 'shm'
+    return kwargs
+
+
+def _operation(config, address):
+    """
+    :return: a tuple (operation, misses, close), where operation calls the server once with a key, misses returns
+    the number of calls of the memoized function (None for the other workloads), and close releases the connection.
+    The cache workloads reach the server through a `ClientPool`, so they may use any transport.
+    """
+    workload = config['workload']
+    payload = os.urandom(config['payload'])
+    if workload == 'echo':
+        client = BaseIPCClient(address, **_client_kwargs(config))
+        return lambda key: client.benchmark_echo(payload), lambda: None, client.disconnect
+    pool = ClientPool(address, max_size=1, **_client_kwargs(config))
+    if workload in ('get', 'put'):
+        cache = SharedCache(NAMESPACE, max_items=0, pool=pool)
+        if workload == 'get':
+            return cache.get, lambda: None, pool.close
+        return lambda key: cache.__setitem__(key, payload), lambda: None, pool.close
+    computed = [0]
+
+    @Memoize(NAMESPACE, 60 * 60, pool=pool)
+    def compute(key):
+        computed[0] += 1
+        return payload
+
+    return compute, lambda: computed[0], pool.close
+
+
+def _worker(config, address, start, results):
+    try:
+        operation, misses, close = _operation(config, address)
+        choose = KeyChooser(config['keys'], config['distribution'], config['zipf_s'], seed=os.getpid())
+        histogram = Histogram()
+        start.wait()
+        deadline = time.time() + config['duration']
+        operations = 0
+        while True:
+            key = 'k%d' % choose()
+            begin = clock()
+            operation(key)
+            histogram.record(int((clock() - begin) * 1e6))
+            operations += 1
+            # the deadline is checked every 16 calls, which keeps the cost of the loop negligible
+            if operations % 16 == 0 and time.time() >= deadline:
+                break
+        close()
+        results.put((histogram.counts, histogram.total, histogram.max, misses(), None))
+    except Exception as e:
+        results.put(({}, 0, 0, None, repr(e)))
+
+
+def _prepare(config, address):
+    """
+    Sets the keys read by the get workload, and empties the namespace of the memoize workload.
+    """
+    pool = ClientPool(address, max_size=1, **_client_kwargs(config))
+    cache = SharedCache(NAMESPACE, max_items=0, pool=pool)
+    if config['workload'] == 'get':
+        payload = os.urandom(config['payload'])
+        for i in range(0, config['keys'], 1000):
+            cache.set_many(dict(('k%d' % k, payload) for k in range(i, min(i + 1000, config['keys']))))
+    pool.reset_stats(NAMESPACE)
+    cache.disconnect()
+    pool.close()
+
+
+def run(workload, clients=4, payload=100, keys=10000, distribution='uniform', zipf_s=1.1, duration=2.0,
+        engine='threaded', transport='unix', serializer=None, compression=None):
+    """
+    Runs one benchmark against a fresh server.
+    :param workload: (str) one of `WORKLOADS`.
+    :param clients: (int) number of client processes.
+    :param payload: (int) size in bytes of the values (random bytes, so they do not compress).
+    :param keys: (int) number of distinct keys.
+    :param distribution: (str) 'uniform' or 'zipf' (refer to `KeyChooser`).
+    :param zipf_s: (float) exponent of the Zipf distribution.
+    :param duration: (float) seconds during which the clients call the server.
+    :param engine: (str) 'threaded' (SharedCacheServer) or 'eventloop' (EventLoopSharedCacheServer).
+    :param transport: (str) 'unix', 'shm' (experimental shared-memory rings, on the threaded engine) or 'tcp'
+    (loopback).
+    :param serializer: (optional) serializer name of the clients (refer to `BaseIPCClient`).
+    :param compression: (optional) compression codec name of the clients.
+    :return: a dictionary of the parameters and results: operations, throughput (operations per second),
+    latency in seconds (refer to `Histogram.summary`, without buckets), errors of the clients, and the hit
+    ratio of the memoize workload.
+    """
+    if workload not in WORKLOADS:
+        raise ValueError('Unknown workload: %r' % (workload,))
+    if transport not in TRANSPORTS:
+        raise ValueError('Unknown transport: %r' % (transport,))
+    config = {'workload': workload, 'clients': clients, 'payload': payload, 'keys': keys,
+              'distribution': distribution, 'zipf_s': zipf_s, 'duration': duration, 'engine': engine,
+              'transport': transport, 'serializer': serializer, 'compression': compression,
+              'authkey': os.urandom(16) if transport == 'tcp' else None}
+    server_class = ShmSharedCacheServer if transport == 'shm' and engine == 'threaded' else ENGINES[engine]
+    server = server_class(_address(transport), authkey=config['authkey'])
+    try:
+        _prepare(config, server.address)
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_worker, args=(config, server.address, start, results))
+                     for i in range(clients)]
+        for process in processes:
+            process.start()
+        began = time.time()
+        start.set()
+        reports = [results.get() for process in processes]
+        elapsed = time.time() - began
+        for process in processes:
+            process.join()
+    finally:
+        server.shutdown()
+
+    histogram = Histogram()
+    misses = 0
+    errors = []
+    for counts, total, maximum, worker_misses, error in reports:
+        partial = Histogram()
+        partial.counts, partial.total, partial.max = counts, total, maximum
+        partial.count = sum(counts.values())
+        histogram.merge(partial)
+        misses += worker_misses or 0
+        if error is not None:
+            errors.append(error)
+    latency = histogram.summary()
+    del latency['buckets']
+    result = dict(config)
+    del result['authkey']
+    result.update({'operations': histogram.count, 'elapsed': elapsed,
+                   'throughput': histogram.count / config['duration'] if histogram.count else 0.0,
+                   'latency': latency, 'errors': errors})
+    if workload == 'memoize':
+        result['misses'] = misses
+        result['hit_ratio'] = 1 - float(misses) / histogram.count if histogram.count else 0.0
+    return result
+
+
+def run_matrix(workloads=WORKLOADS, clients=(4,), payloads=(100,), distributions=('uniform',),
+               engines=('threaded',), transports=('unix',), report=None, **kwargs):
+    """
+    Runs a benchmark for every combination of the given parameters (refer to `run`).
+    :param report: (optional) function called with the result of every run as soon as it is done.
+    :return: a dictionary with the description of the environment and the list of the results.
+    """
+    results = []
+    for workload, engine, transport, count, payload, distribution in itertools.product(
+            workloads, engines, transports, clients, payloads, distributions):
+        if transport == 'shm' and engine != 'threaded':
+            # the event loop keeps its connections on the socket
+            continue
+        result = run(workload, count, payload, distribution=distribution, engine=engine, transport=transport,
+                     **kwargs)
+        if report is not None:
+            report(result)
+        results.append(result)
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'platform': platform.platform(), 'cpus': multiprocessing.cpu_count(), 'time': time.time(),
+            'results': results}
+
+
+def _list(type_):
+    return lambda value: [type_(item) for item in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks s1ipc servers and the SharedCache system.')
+    parser.add_argument('--workloads', type=_list(str), default=list(WORKLOADS))
+    parser.add_argument('--clients', type=_list(int), default=[1, 4])
+    parser.add_argument('--payloads', type=_list(int), default=[100, 10000])
+    parser.add_argument('--distributions', type=_list(str), default=['uniform', 'zipf'])
+    parser.add_argument('--engines', type=_list(str), default=['threaded'])
+    parser.add_argument('--transports', type=_list(str), default=['unix'])
+    parser.add_argument('--keys', type=int, default=10000)
+    parser.add_argument('--zipf-s', type=float, default=1.1)
+    parser.add_argument('--duration', type=float, default=2.0)
+    parser.add_argument('--serializer', default=None)
+    parser.add_argument('--compression', default=None)
+    parser.add_argument('--output', default=None, help='file to write the JSON results to, instead of stdout')
+    args = parser.parse_args(argv)
+
+    def report(result):
+        print('%(workload)s engine=%(engine)s transport=%(transport)s clients=%(clients)d payload=%(payload)d '
+              'keys=%(distribution)s: %(throughput).0f ops/s' % result,
+              'p50=%(p50).6fs p99=%(p99).6fs' % result['latency'], file=sys.stderr)
+
+    document = run_matrix(args.workloads, args.clients, args.payloads, args.distributions, args.engines,
+                          args.transports, report=report, keys=args.keys, zipf_s=args.zipf_s,
+                          duration=args.duration, serializer=args.serializer, compression=args.compression)
+    text = json.dumps(document, indent=2, sort_keys=True)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
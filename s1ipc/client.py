@@ -1,6 +1,13 @@
+import errno
+import itertools
 import socket
+import threading
 import time
-from protocol import BaseIPCProtocol
+from .compression import get_codec
+from .protocol import BinaryIPCProtocol
+from .serializers import get_serializer
+from .shm import ShmChannel
+from .transport import AuthenticationError, authenticate, get_authkey, is_tcp, tune_tcp
 import os.path
 
 __author__ = 'matheus2740'
@@ -25,12 +32,67 @@ def retry_on_refuse(f, *args, **kwargs):
             f(*args, **kwargs)
             break
         except (OSError, socket.error) as e:
-            if e.args[0] != socket.errno.ECONNREFUSED or i > 10000:
+            if e.args[0] != errno.ECONNREFUSED or i > 10000:
                 raise
             else:
                 time.sleep(0.001)
 
 
+def connect(address, timeout=None, authkey=None, protocol=BinaryIPCProtocol):
+    """
+    Opens a connection to an IPC server.
+    :param address: a UNIX socket path, or a TCP (host, port) tuple.
+    :param timeout: (optional) seconds to wait for connecting, then for every send and receive on the socket.
+    :param authkey: (optional) shared secret of TCP connections, defaults to the S1IPC_AUTHKEY environment variable
+     (refer to `s1ipc.transport.get_authkey`). Ignored for UNIX sockets.
+    :param protocol: the protocol of the server, framing the handshake of TCP connections.
+    :return: the connected socket.
+    :raise IPCCLientException: if the UNIX socket does not exist.
+    :raise AuthenticationError: if no authkey is set for a TCP address, or the handshake failed.
+    :raise socket.error: if the connection failed.
+    """
+    if is_tcp(address):
+        authkey = get_authkey(authkey)
+        if authkey is None:
+            raise AuthenticationError('TCP connections need an authkey (or the S1IPC_AUTHKEY environment variable).')
+        sock = socket.create_connection(address, timeout)
+        tune_tcp(sock)
+        try:
+            authenticate(protocol, sock, authkey)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+    if not os.path.exists(address):
+        raise IPCCLientException('Cannot connect to IPC server: Socket does not exist.')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    retry_on_refuse(sock.connect, address)
+    return sock
+
+
+def hello_message(serializer, compression):
+    """
+    Builds the handshake message negotiating the serializer and compression codec of a connection.
+    :param serializer: a serializer name, list of names in order of preference, or None for pickle.
+    :param compression: a codec name, list of names in order of preference, or None for no compression.
+    """
+    def names(preferred):
+        if preferred is None:
+            return []
+        return list(preferred) if isinstance(preferred, (list, tuple)) else [preferred]
+
+    return '__!hello__', names(serializer), names(compression)
+
+
+def parse_hello(reply):
+    """
+    :param reply: the server reply to a handshake message.
+    :return: a tuple (serializer, codec or None) chosen by the server.
+    """
+    return get_serializer(reply[1]), get_codec(reply[2]) if len(reply) > 2 else None
+
+
 class Caller(object):
     """
     Caller is a functor which calls foreign functions on the IPC server.
@@ -44,17 +106,26 @@ class Caller(object):
         self.client = client
         self.function = function
 
-    def __call__(self, *args, **kwargs):
-        data = {
+    def request(self, args, kwargs):
+        """
+        Builds the call request sent to the server, tagged with a new request id.
+        """
+        return {
             'f': self.function,
             'a': args,
-            'kw': kwargs
+            'kw': kwargs,
+            'id': next(self.client._request_ids)
         }
 
+    def __call__(self, *args, **kwargs):
+        data = self.request(args, kwargs)
+
         # sockf = sock.makefile()
-        self.client.protocol.send_message(self.client.sock, data)
+        self.client.protocol.send_message(self.client.sock, data, self.client.serializer, self.client.codec)
         result = self.client.protocol.recover_message(self.client.sock)
         # sock.shutdown(socket.SHUT_RDWR)
+        if result is None:
+            raise IPCCLientException('Connection closed by the IPC server.')
 
         return self.parse(result)
 
@@ -62,30 +133,218 @@ class Caller(object):
         return result[0]
 
 
+class PipelinedCaller(Caller):
+    """
+    Caller which, instead of calling the server right away, queues the call in a `Pipeline`.
+    """
+
+    def __init__(self, pipeline, function):
+        super(PipelinedCaller, self).__init__(pipeline.client, function)
+        self.pipeline = pipeline
+
+    def __call__(self, *args, **kwargs):
+        data = self.request(args, kwargs)
+        self.pipeline.calls.append((self, data))
+        return data['id']
+
+
+class Pipeline(object):
+    """
+    Queues foreign function calls and sends them to the server all at once, in a single message.
+    The server processes the whole batch in one pass and replies with a single message, whose
+    results are matched to the calls by request id.
+    Pipelines are created through `BaseIPCClient.pipeline`, and are usually used as context managers:
+
+        with client.pipeline() as pipe:
+            for key in keys:
+                pipe.get(namespace, key)
+        values = pipe.results
+
+    Calls on a pipeline return the request id instead of the result. The results, in call order,
+    are returned by `execute`, which is called automatically when the `with` block exits cleanly.
+    `execute` may also be split in `send` and `receive`, e.g. to have several servers work at once
+    (refer to `execute_all`).
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+        self.results = None
+        self._sent = []
+
+    def execute(self):
+        """
+        Sends the queued calls and waits for their results.
+        :return: A list with the result of every queued call, in the order they were made.
+        """
+        self.send()
+        return self.receive()
+
+    def send(self):
+        """
+        Sends the queued calls without waiting for their results, which must then be read by `receive`.
+        """
+        self._sent, self.calls = self.calls, []
+        if self._sent:
+            self.client.protocol.send_message(self.client.sock, [data for caller, data in self._sent],
+                                              self.client.serializer, self.client.codec)
+
+    def receive(self):
+        """
+        Waits for the results of the calls sent by `send`.
+        :return: A list with the result of every call sent, in the order they were made.
+        """
+        calls, self._sent = self._sent, []
+        if not calls:
+            self.results = []
+            return self.results
+
+        replies = self.client.protocol.recover_message(self.client.sock)
+        if replies is None:
+            raise IPCCLientException('Connection closed by the IPC server.')
+
+        by_id = dict((reply[1], reply) for reply in replies)
+        self.results = [caller.parse(by_id[data['id']]) for caller, data in calls]
+        return self.results
+
+    def __getattr__(self, item):
+        return PipelinedCaller(self, item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+        else:
+            self.calls = []
+        return False
+
+
+def execute_all(pipelines):
+    """
+    Executes pipelines of different connections (usually to different servers) in parallel: all the calls are sent
+    before any result is awaited, so the servers process them at the same time.
+    :param pipelines: iterable of `Pipeline`.
+    :return: A list with the results of every pipeline (refer to `Pipeline.execute`).
+    """
+    pipelines = list(pipelines)
+    for pipeline in pipelines:
+        pipeline.send()
+    return [pipeline.receive() for pipeline in pipelines]
+
+
 class BaseIPCClient(object):
     """
     A client to an IPC server.
     The client connects on inialization and raises IPCCLientException if the socket does not exist.
     This client is highly dynamic, since it overrides '__getattr__'. Any methods called on an
     BaseIPCClient instance will be serialized and called on the server, with the notable exception
-    of the object methods and 'disconnect' which disconnects the client and 'shutdown' which
-    shuts down the server (harakiri request).
+    of the object methods, 'pipeline' which batches calls, 'ping' which checks the connection,
+    'telemetry' which retrieves the telemetry of the server, 'profiling' which controls its profiler,
+    'disconnect' which disconnects the client
+    and 'shutdown' which shuts down the server (harakiri request).
     """
 
-    protocol = BaseIPCProtocol
+    protocol = BinaryIPCProtocol
 
-    def __init__(self, address='/tmp/BaseIPCServer.sock'):
+    def __init__(self, address='/tmp/BaseIPCServer.sock', transport='socket', shm_capacity=1 << 20,
+                 serializer=None, compression=None, socket_timeout=None, authkey=None):
         """
         Initializes a client and connect to the server, throught the given address.
-        :param address: The UNIX socket path
+        :param address: The UNIX socket path, or a (host, port) tuple to connect through TCP
+        :param transport: (str) 'socket' talks through the socket, 'shm' asks the server to move the connection
+         to shared-memory rings (experimental, refer to `ShmChannel`), staying on the socket unless the server enabled
+         its `shm_transport`.
+        :param shm_capacity: (int) size in bytes of each shared-memory ring.
+        :param serializer: (optional) name of the serializer to use for calls and replies, or list of names in order
+         of preference, negotiated with the server in a handshake (refer to `s1ipc.serializers`). Defaults to pickle.
+        :param compression: (optional) name of the codec compressing large calls and replies, or list of names in order
+         of preference, negotiated in the same handshake (refer to `s1ipc.compression`). Defaults to no compression.
+        :param socket_timeout: (optional) seconds to wait for connecting and for every reply, after which
+         socket.timeout is raised (and the connection must be discarded). Defaults to waiting forever.
+        :param authkey: (optional) shared secret authenticating TCP connections, which the server must have been given
+         too. Defaults to the S1IPC_AUTHKEY environment variable.
         :return:
         """
-        if not os.path.exists(address):
-            raise IPCCLientException('Cannot connect to IPC server: Socket does not exist.')
-        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        retry_on_refuse(self.sock.connect, address)
+        # so that a client which failed to connect is not disconnected when collected
+        self.connected = False
+        self.sock = connect(address, socket_timeout, authkey, self.protocol)
         self._address = address
+        self._request_ids = itertools.count()
+        self.serializer = None
+        self.codec = None
         self.connected = True
+        if transport == 'shm':
+            self._upgrade_shm(shm_capacity)
+        elif transport != 'socket':
+            raise IPCCLientException('Unknown transport: %r' % (transport,))
+        if serializer is not None or compression is not None:
+            self._negotiate(serializer, compression)
+
+    def _negotiate(self, serializer, compression):
+        self.protocol.send_message(self.sock, hello_message(serializer, compression))
+        reply = self.protocol.recover_message(self.sock)
+        if reply is None:
+            raise IPCCLientException('Connection closed by the IPC server.')
+        self.serializer, self.codec = parse_hello(reply)
+
+    def _upgrade_shm(self, capacity):
+        self.protocol.send_message(self.sock, ('__!shm__', capacity))
+        reply = self.protocol.recover_message(self.sock)
+        if reply is not None:
+            self.sock = ShmChannel.attach(self.sock, reply[1], reply[2], capacity)
+
+    def pipeline(self):
+        """
+        Creates a `Pipeline` on this client, which sends many calls to the server in a single message.
+        :return: a new `Pipeline`.
+        """
+        return Pipeline(self)
+
+    def ping(self):
+        """
+        Checks if the connection to the server is alive.
+        :return: True if the server answered.
+        """
+        self.protocol.send_message(self.sock, '__!ping__')
+        return self.protocol.recover_message(self.sock) == '__!pong__'
+
+    def telemetry(self, prometheus=False):
+        """
+        Retrieves the telemetry of the server process (refer to `BaseIPCServer.stats`).
+        :param prometheus: (bool) Flag indicating that the telemetry must be formatted in the Prometheus text
+         exposition format, e.g. to be written where a Prometheus exporter collects it.
+        :return: a dictionary, or a string if `prometheus` is True.
+        """
+        self.protocol.send_message(self.sock, ('__!stats__', 'prometheus') if prometheus else '__!stats__')
+        reply = self.protocol.recover_message(self.sock)
+        if reply is None:
+            raise IPCCLientException('Connection closed by the IPC server.')
+        return reply
+
+    def profiling(self, command, **options):
+        """
+        Controls the profiler of the server process, which keeps serving meanwhile (refer to `Profiler`):
+
+            client.profiling('start', mode='sample', fraction=0.5)
+            ...
+            print(client.profiling('stop', path='/tmp/server.stacks')['text'])
+
+        :param command: (str) 'start' discards the data of the previous run and starts profiling (options `mode`,
+         `fraction` and `interval`, refer to `Profiler.start`), 'stop' stops it and 'report' only reads the data
+         gathered so far (options `path`, `limit` and `sort`, refer to `Profiler.report`). Files are written by the
+         server process, on its host.
+        :return: the report of the profiler (refer to `Profiler.report`).
+        :raise IPCCLientException: if the server refused the command.
+        """
+        self.protocol.send_message(self.sock, ('__!profile__', command, options))
+        reply = self.protocol.recover_message(self.sock)
+        if reply is None:
+            raise IPCCLientException('Connection closed by the IPC server.')
+        if 'error' in reply:
+            raise IPCCLientException(reply['error'])
+        return reply
 
     def disconnect(self):
         """
@@ -127,3 +386,58 @@ class BaseIPCClient(object):
     def __del__(self):
         if self.connected:
             self.disconnect()
+
+
+class Subscription(object):
+    """
+    Connection receiving the events published by the server on a channel (refer to `s1ipc.server.publish`).
+    Events are read on a daemon thread, which hands each of them to `callback`, and finally calls it with None
+    when the subscription ends: closed by this side, by the server (e.g. it restarted, or this side did not
+    keep up with the events) or broken. Any event may have been missed after that.
+    """
+
+    def __init__(self, address, channel, callback, serializer=None, authkey=None):
+        """
+        Connects and subscribes.
+        :param address: The UNIX socket path, or a (host, port) tuple to connect through TCP
+        :param channel: the name of the channel.
+        :param callback: function receiving each event, then None; called on the reader thread.
+        :param serializer: (optional) serializer of the events (refer to `BaseIPCClient`).
+        :param authkey: (bytes) shared secret of a TCP server (refer to `BaseIPCClient`).
+        """
+        self.client = BaseIPCClient(address, serializer=serializer, authkey=authkey)
+        self.channel = channel
+        self.callback = callback
+        self.client.protocol.send_message(self.client.sock, ('__!subscribe__', channel))
+        if self.client.protocol.recover_message(self.client.sock) is None:
+            raise IPCCLientException('Subscription refused by the IPC server.')
+        self.thread = threading.Thread(target=self._listen)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _listen(self):
+        try:
+            while True:
+                event = self.client.protocol.recover_message(self.client.sock)
+                if event is None:
+                    break
+                self.callback(event)
+        except (socket.error, ValueError):
+            pass
+        finally:
+            self.client.connected = False
+            self.client.sock.close()
+            self.callback(None)
+
+    def close(self):
+        """
+        Ends the subscription. The reader thread calls the callback with None and exits.
+        """
+        sock = self.client.sock
+        self.client.connected = False
+        try:
+            self.client.protocol.send_message(sock, '__!goodbye__')
+            # wakes the reader thread up
+            sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
@@ -0,0 +1,146 @@
+import zlib
+
+__author__ = 'matheus2740'
+
+
+class Codec(object):
+    """
+    Base class of the payload compression codecs.
+    Every codec has a unique `id` (1 to 15, 0 meaning uncompressed), stored in the flags of the frames it compressed,
+    so any frame can be decompressed whatever codec the peer chose, and a unique `name`, used to choose it.
+    """
+
+    id = None
+    name = None
+
+    def compress(self, data):
+        """
+        :param data: a string (or bytearray).
+        :return: the compressed string.
+        """
+        raise NotImplementedError
+
+    def decompress(self, data):
+        """
+        :param data: a string (or bytearray) returned by `compress`.
+        :return: the original string.
+        """
+        raise NotImplementedError
+
+
+class ZlibCodec(Codec):
+    """
+    zlib (deflate), from the standard library. The default level favours speed: cached fragments and documents
+    are very redundant and compress well even at level 1.
+    """
+    id = 1
+    name = 'zlib'
+
+    def __init__(self, level=1):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(bytes(data), self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(bytes(data))
+
+
+class Compressed(object):
+    """
+    A value compressed by the client before being stored, so that it stays compressed at rest in the server,
+    which handles it as an opaque string. Clients turn it back into the original value with `unpack_value`.
+    """
+
+    __slots__ = ('codec', 'data')
+
+    def __init__(self, codec, data):
+        self.codec = codec
+        self.data = data
+
+    def __getstate__(self):
+        return self.codec, self.data
+
+    def __setstate__(self, state):
+        self.codec, self.data = state
+
+
+_by_id = {}
+_by_name = {}
+
+
+def register_codec(codec):
+    """
+    Makes a codec available to the protocol and to the negotiation of clients and servers.
+    :param codec: a `Codec` instance, whose id (1 to 15) and name are not in use.
+    """
+    if not 1 <= codec.id <= 15:
+        raise ValueError('Codec ids must be between 1 and 15.')
+    _by_id[codec.id] = codec
+    _by_name[codec.name] = codec
+
+
+def get_codec(key):
+    """
+    :param key: a codec id, name or instance, or None for no compression.
+    :return: the registered `Codec`, or None.
+    :raise KeyError: if no such codec is registered.
+    """
+    if key is None or isinstance(key, Codec):
+        return key
+    if isinstance(key, int):
+        return _by_id[key]
+    return _by_name[key]
+
+
+def negotiate_codec(preferred):
+    """
+    Chooses the first codec of a list which is registered in this process.
+    :param preferred: a list of codec names, in order of preference.
+    :return: the chosen `Codec`, or None (no compression) if none is available.
+    """
+    for name in preferred:
+        if name in _by_name:
+            return _by_name[name]
+    return None
+
+
+def available_codecs():
+    """
+    :return: the names of the registered codecs.
+    """
+    return sorted(_by_name)
+
+
+def pack_value(value, codec, threshold, dumps):
+    """
+    Compresses a value to be stored compressed at rest, if its serialized form is at least `threshold` bytes long
+    and compression makes it smaller.
+    :param value: any object.
+    :param codec: a codec name, id or instance.
+    :param threshold: (int) minimum serialized size to compress.
+    :param dumps: function serializing the value.
+    :return: a `Compressed` instance, or the value itself.
+    """
+    codec = get_codec(codec)
+    data = dumps(value)
+    if len(data) < threshold:
+        return value
+    compressed = codec.compress(data)
+    if len(compressed) >= len(data):
+        return value
+    return Compressed(codec.id, compressed)
+
+
+def unpack_value(value, loads):
+    """
+    Reverts `pack_value`: values which are not `Compressed` are returned as they are.
+    :param loads: function deserializing the decompressed string.
+    """
+    if isinstance(value, Compressed):
+        return loads(get_codec(value.codec).decompress(value.data))
+    return value
+
+
+DEFAULT_CODEC = ZlibCodec()
+register_codec(DEFAULT_CODEC)
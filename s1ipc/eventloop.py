@@ -0,0 +1,461 @@
+from collections import deque, namedtuple
+import errno
+import fcntl
+import os
+import select
+import socket
+import threading
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+from .metrics import clock
+from .server import BaseIPCServer, _eintr_retry, _hello, subscribe, unsubscribe
+from .transport import TOKEN_FLAGS, check_answer, is_token, new_challenge
+
+__author__ = 'matheus2740'
+
+
+try:
+    from selectors import DefaultSelector, EVENT_READ, EVENT_WRITE
+except ImportError:
+    # python 2 has no selectors module: this is the subset of it the event loop needs, over epoll (or poll).
+    EVENT_READ = 1
+    EVENT_WRITE = 2
+
+    SelectorKey = namedtuple('SelectorKey', ['fileobj', 'fd', 'events', 'data'])
+
+    class DefaultSelector(object):
+
+        def __init__(self):
+            if hasattr(select, 'epoll'):
+                self._poller = select.epoll()
+                self._in, self._out, self._scale = select.EPOLLIN, select.EPOLLOUT, 1
+                self._err = select.EPOLLERR | select.EPOLLHUP
+            else:
+                self._poller = select.poll()
+                self._in, self._out, self._scale = select.POLLIN, select.POLLOUT, 1000
+                self._err = select.POLLERR | select.POLLHUP
+            self._keys = {}
+
+        def _mask(self, events):
+            return (self._in if events & EVENT_READ else 0) | (self._out if events & EVENT_WRITE else 0)
+
+        def register(self, fileobj, events, data=None):
+            fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+            self._keys[fd] = SelectorKey(fileobj, fd, events, data)
+            self._poller.register(fd, self._mask(events))
+
+        def modify(self, fileobj, events, data=None):
+            fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+            self._keys[fd] = SelectorKey(fileobj, fd, events, data)
+            self._poller.modify(fd, self._mask(events))
+
+        def unregister(self, fileobj):
+            fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+            del self._keys[fd]
+            self._poller.unregister(fd)
+
+        def select(self, timeout=None):
+            ready = []
+            for fd, mask in self._poller.poll(-1 if timeout is None else timeout * self._scale):
+                key = self._keys.get(fd)
+                if key is None:
+                    continue
+                events = (EVENT_READ if mask & (self._in | self._err) else 0) | \
+                         (EVENT_WRITE if mask & (self._out | self._err) else 0)
+                ready.append((key, events & key.events))
+            return ready
+
+        def close(self):
+            if hasattr(self._poller, 'close'):
+                self._poller.close()
+
+
+class _Connection(object):
+    """
+    State of one client connection in the event loop: the bytes read but not yet parsed
+    and the replies not yet written.
+    """
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.inbuf = bytearray()
+        self.outbuf = deque()
+        self.writing = False
+        self.closed = False
+        self.serializer = None
+        self.codec = None
+        self.subscriptions = []
+        # events published to the connection but not yet written to `outbuf`
+        self.events = deque()
+        self.overflowed = False
+        # challenge sent to the client of a TCP connection, until the client answers it
+        self.challenge = None
+
+
+class _WorkerPool(object):
+    """
+    Fixed number of daemon threads running dispatches for the event loop.
+    At most `max_queued` dispatches wait for a free worker; beyond that, submitting blocks
+    the event loop, which stops reading new requests (backpressure).
+    """
+
+    def __init__(self, size, max_queued):
+        self.tasks = Queue(max_queued)
+        self.threads = []
+        for i in range(size):
+            t = threading.Thread(target=self.work)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def submit(self, func, *args):
+        self.tasks.put((func, args))
+
+    def depth(self):
+        """
+        :return: the number of dispatches waiting for a worker.
+        """
+        return self.tasks.qsize()
+
+    def work(self):
+        while True:
+            func, args = self.tasks.get()
+            func(*args)
+
+
+class EventLoopMixIn:
+    """
+    Mix-in class which replaces the thread-per-connection engine of `BaseIPCServer` by a single event loop.
+    All client sockets are multiplexed on one selector (epoll where available), and registered functors are
+    dispatched inline in the loop, or, if `workers` is set, on a pool of that many threads.
+    Messages are handled with the same semantics as `BaseIPCHandler`: single calls, pipelined batches,
+    handshakes, subscriptions, telemetry and profiling requests, ping, goodbye and shutdown messages, and the same
+    metrics are recorded, except the 'send' phase, as replies are written as the sockets accept them. The clients of
+    a TCP server are authenticated the same way too, their first frame being the answer to the challenge they were
+    sent on connection.
+    Functors registered with `IPCAvailable` or `register_functor` are served as usual.
+    The protocol must be frame based (as `BinaryIPCProtocol` is), since messages are parsed from non-blocking reads.
+
+    It must come first in the bases of the server class:
+
+        class EventLoopSharedCacheServer(EventLoopMixIn, SharedCacheServer):
+            workers = 4
+
+    :class attribute workers: number of worker threads dispatching calls, 0 (default) dispatches inline.
+    :class attribute max_queued: maximum number of dispatches waiting for a worker.
+    :class attribute read_size: maximum number of bytes read from a client socket at once.
+    :class attribute max_pending_events: events waiting to be sent to a subscriber, beyond which its connection is
+     closed, as `BaseIPCHandler.max_pending_events`.
+    """
+    workers = 0
+    max_queued = 1024
+    read_size = 65536
+    max_pending_events = 10000
+
+    def serve_forever(self, shuttingdown, poll_interval=5):
+        """
+        Runs the event loop until shutdown.
+        Polls for shutdown every poll_interval seconds.
+        """
+        self.socket.setblocking(False)
+        self._selector = DefaultSelector()
+        self._completed = deque()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        _set_nonblocking(self._wakeup_r)
+        # a single unread byte wakes the loop up: the loop itself may push more than the pipe holds
+        _set_nonblocking(self._wakeup_w)
+        self._selector.register(self.socket, EVENT_READ, None)
+        self._selector.register(self._wakeup_r, EVENT_READ, None)
+        self._pool = _WorkerPool(self.workers, self.max_queued) if self.workers else None
+
+        try:
+            while self.shuttingdown.value == 0:
+                for key, events in _eintr_retry(self._selector.select, poll_interval):
+                    if key.data is None:
+                        if key.fd == self._wakeup_r:
+                            self._drain_completed()
+                        else:
+                            self._accept()
+                        continue
+                    if events & EVENT_READ:
+                        self._read(key.data)
+                    if events & EVENT_WRITE and not key.data.closed:
+                        self._flush(key.data)
+        finally:
+            self._selector.close()
+            os.close(self._wakeup_r)
+            os.close(self._wakeup_w)
+
+    def _accept(self):
+        try:
+            sock, address = self.get_request()
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ECONNABORTED):
+                return
+            raise
+        sock.setblocking(False)
+        conn = _Connection(sock, address)
+        self._selector.register(sock, EVENT_READ, conn)
+        if self.collect_metrics:
+            self.metrics.gauge('connections', 1)
+            self.metrics.count('connections')
+        if self.authkey is not None:
+            conn.challenge = new_challenge()
+            self._send_token(conn, conn.challenge)
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(self.read_size)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            data = b''
+        if not data:
+            self._close(conn)
+            return
+
+        conn.inbuf.extend(data)
+        header = self.protocol.HEADER
+        metrics = self.metrics if self.collect_metrics else None
+        if metrics is not None:
+            metrics.count('bytes_received', value=len(data))
+        if conn.challenge is not None and not self._authenticate(conn):
+            return
+        start = 0
+        while len(conn.inbuf) - start >= header.size:
+            length, flags = header.unpack_from(conn.inbuf, start)
+            end = start + header.size + length
+            if len(conn.inbuf) < end:
+                break
+            if metrics is None:
+                message = self.protocol.loads(flags, conn.inbuf[start + header.size:end])
+            else:
+                decoding = clock()
+                message = self.protocol.loads(flags, conn.inbuf[start + header.size:end])
+                metrics.observe('phase', 'decode', clock() - decoding)
+                metrics.count('messages')
+            start = end
+            if not self._handle_message(conn, message):
+                return
+        if start:
+            del conn.inbuf[:start]
+
+    def _authenticate(self, conn):
+        """
+        Checks the answer of a TCP client to its challenge, which must be its first frame: nothing it sends is decoded
+        before. The connection is closed if the answer is wrong, or if the first frame is not a token.
+        :return: True if the client is authenticated, False if its answer is not complete yet or it was refused.
+        """
+        header = self.protocol.HEADER
+        if len(conn.inbuf) < header.size:
+            return False
+        length, flags = header.unpack_from(conn.inbuf)
+        if not is_token(length, flags):
+            self._close(conn)
+            return False
+        end = header.size + length
+        if len(conn.inbuf) < end:
+            return False
+        proof = check_answer(self.authkey, conn.challenge, bytes(conn.inbuf[header.size:end]))
+        if proof is None:
+            self._close(conn)
+            return False
+        del conn.inbuf[:end]
+        conn.challenge = None
+        self._send_token(conn, proof)
+        return not conn.closed
+
+    def _handle_message(self, conn, message):
+        """
+        Handles one message read from a connection.
+        :return: False if the connection was closed.
+        """
+        if message == '__!goodbye__' or message is None:
+            self._close(conn)
+            return False
+
+        if message == '__!shutdown__':
+            if self.address_family != socket.AF_UNIX:
+                self._close(conn)
+                return False
+            self.harakiri()
+            return False
+
+        if message == '__!ping__':
+            self._send(conn, '__!pong__')
+            return not conn.closed
+
+        if isinstance(message, tuple) and message[0] == '__!shm__':
+            # shared-memory rings need a blocking reader per connection: stay on the socket
+            self._send(conn, None)
+            return not conn.closed
+
+        if isinstance(message, tuple) and message[0] == '__!hello__':
+            serializer, codec, reply = _hello(message)
+            self._send(conn, reply)
+            conn.serializer, conn.codec = serializer, codec
+            return not conn.closed
+
+        if isinstance(message, tuple) and message[0] == '__!subscribe__':
+            push = lambda event: self._publish(conn, event)
+            subscribe(message[1], push)
+            conn.subscriptions.append((message[1], push))
+            self._send(conn, ('__!subscribe__', message[1]))
+            return not conn.closed
+
+        if message == '__!stats__' or isinstance(message, tuple) and message[0] == '__!stats__':
+            self._send(conn, self.stats_message(message))
+            return not conn.closed
+
+        if isinstance(message, tuple) and message[0] == '__!profile__':
+            self._send(conn, self.profile_message(message, self.address_family == socket.AF_UNIX))
+            return not conn.closed
+
+        if self._pool is not None:
+            self._pool.submit(self._dispatch_task, conn, message, clock())
+            return True
+
+        try:
+            reply = self._dispatch_message(message)
+        except Exception:
+            self.handle_error(conn.sock, conn.address)
+            self._close(conn)
+            return False
+        self._send(conn, reply)
+        return not conn.closed
+
+    def _dispatch_message(self, message):
+        if isinstance(message, list):
+            return [self.dispatch(call) for call in message]
+        return self.dispatch(message)
+
+    def _dispatch_task(self, conn, message, submitted):
+        # runs on a worker thread: the reply is handed back to the loop, which owns the sockets
+        if self.collect_metrics:
+            self.metrics.observe('phase', 'queue', clock() - submitted)
+        try:
+            reply = self._dispatch_message(message)
+        except Exception:
+            self.handle_error(conn.sock, conn.address)
+            reply = _CLOSE
+        self._push(conn, reply)
+
+    def _push(self, conn, reply):
+        # hands a reply (or a published event) over to the loop from any thread
+        self._completed.append((conn, reply))
+        try:
+            os.write(self._wakeup_w, b'x')
+        except OSError:
+            # EAGAIN: the pipe is full, so the loop will wake up anyway
+            pass
+
+    def _publish(self, conn, event):
+        # subscriber of a connection: closes it once it has more than `max_pending_events` events waiting, counting
+        # those in `outbuf` by their two frames each
+        if conn.overflowed:
+            return
+        if len(conn.events) + len(conn.outbuf) // 2 >= self.max_pending_events:
+            conn.overflowed = True
+            self._push(conn, _CLOSE)
+            return
+        conn.events.append(event)
+        self._push(conn, _EVENT)
+
+    def _drain_completed(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except OSError:
+            pass
+        while self._completed:
+            conn, reply = self._completed.popleft()
+            if conn.closed:
+                continue
+            if reply is _EVENT:
+                reply = conn.events.popleft()
+            if reply is _CLOSE:
+                self._close(conn)
+            else:
+                self._send(conn, reply)
+
+    def _send(self, conn, reply):
+        was_empty = not conn.outbuf
+        if self.collect_metrics:
+            start = clock()
+            frames = self.protocol.pack_frames(reply, serializer=conn.serializer, codec=conn.codec)
+            self.metrics.observe('phase', 'encode', clock() - start)
+            self.metrics.count('bytes_sent', value=sum(len(buf) for buf in frames))
+        else:
+            frames = self.protocol.pack_frames(reply, serializer=conn.serializer, codec=conn.codec)
+        conn.outbuf.extend(memoryview(buf) for buf in frames)
+        if was_empty:
+            self._flush(conn)
+
+    def _send_token(self, conn, token):
+        # frames of the handshake are not serialized (refer to `s1ipc.transport`)
+        was_empty = not conn.outbuf
+        conn.outbuf.extend((memoryview(self.protocol.HEADER.pack(len(token), TOKEN_FLAGS)), memoryview(token)))
+        if was_empty:
+            self._flush(conn)
+
+    def _flush(self, conn):
+        while conn.outbuf:
+            buf = conn.outbuf[0]
+            try:
+                sent = conn.sock.send(buf)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    break
+                self._close(conn)
+                return
+            if sent < len(buf):
+                conn.outbuf[0] = buf[sent:]
+                break
+            conn.outbuf.popleft()
+        writing = bool(conn.outbuf)
+        if writing != conn.writing:
+            conn.writing = writing
+            self._selector.modify(conn.sock, EVENT_READ | (EVENT_WRITE if writing else 0), conn)
+
+    def _close(self, conn):
+        if conn.closed:
+            return
+        conn.closed = True
+        conn.outbuf.clear()
+        conn.events.clear()
+        if self.collect_metrics:
+            self.metrics.gauge('connections', -1)
+        for channel, push in conn.subscriptions:
+            unsubscribe(channel, push)
+        self._selector.unregister(conn.sock)
+        conn.sock.close()
+
+
+    def stats(self):
+        """
+        Refer to `BaseIPCServer.stats`, adding the 'queue_depth' gauge on servers with workers.
+        """
+        stats = BaseIPCServer.stats(self)
+        if self._pool is not None:
+            stats['gauges']['queue_depth'] = self._pool.depth()
+        return stats
+
+
+class EventLoopIPCServer(EventLoopMixIn, BaseIPCServer):
+    """
+    `BaseIPCServer` running on a single event loop instead of a thread per connection.
+    """
+    pass
+
+
+_CLOSE = object()
+_EVENT = object()
+
+
+def _set_nonblocking(fd):
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
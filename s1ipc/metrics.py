@@ -0,0 +1,309 @@
+import threading
+import time
+
+try:
+    from thread import get_ident
+except ImportError:
+    from threading import get_ident
+
+__author__ = 'matheus2740'
+
+# clock of the latencies: monotonic and precise where available (python 3)
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Histogram(object):
+    """
+    HDR-style histogram of latencies, recorded as integer microseconds.
+    Values below 2 ** (PRECISION + 1) have a bucket each; above, every power of two is split in 2 ** PRECISION
+    buckets of equal width, so a value is known within 1 / 2 ** PRECISION of itself (about 3%) whatever its
+    magnitude, in at most a few hundred buckets. Buckets are only allocated once a value falls in them.
+    Recording is not thread-safe: every thread records in its own histograms (refer to `Metrics`).
+    """
+
+    PRECISION = 5
+    SUB_BUCKETS = 1 << PRECISION
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def index(cls, value):
+        """
+        :return: the index of the bucket of a value.
+        """
+        if value < cls.SUB_BUCKETS << 1:
+            return value
+        shift = value.bit_length() - cls.PRECISION - 1
+        return (shift << cls.PRECISION) + (value >> shift)
+
+    @classmethod
+    def upper(cls, index):
+        """
+        :return: the (exclusive) upper bound of the values of a bucket.
+        """
+        if index < cls.SUB_BUCKETS << 1:
+            return index + 1
+        shift = (index >> cls.PRECISION) - 1
+        return ((index & (cls.SUB_BUCKETS - 1)) + cls.SUB_BUCKETS + 1) << shift
+
+    def record(self, value):
+        """
+        :param value: (int) the latency in microseconds.
+        """
+        if value < 0:
+            value = 0
+        i = self.index(value)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        # items are copied at once, as the other histogram may be recording meanwhile
+        for i, n in list(other.counts.items()):
+            self.counts[i] = self.counts.get(i, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """
+        :param p: (float) the percentile, from 0 to 100.
+        :return: the upper bound in microseconds of the bucket holding the percentile, 0 if nothing was recorded.
+        """
+        rank = p / 100.0 * sum(self.counts.values())
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                return min(self.upper(i), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        :return: a dictionary of the count, sum, max and main percentiles in seconds, and of the buckets as a list
+        of [upper bound in seconds, count].
+        """
+        return {
+            'count': self.count,
+            'sum': self.total / 1e6,
+            'max': self.max / 1e6,
+            'p50': self.percentile(50) / 1e6,
+            'p90': self.percentile(90) / 1e6,
+            'p99': self.percentile(99) / 1e6,
+            'p999': self.percentile(99.9) / 1e6,
+            'buckets': [[self.upper(i) / 1e6, self.counts[i]] for i in sorted(self.counts)],
+        }
+
+
+class _Shard(object):
+    """
+    Histograms and counters of one thread.
+    """
+
+    def __init__(self):
+        # (family, label) -> Histogram
+        self.histograms = {}
+        # (family, label) -> int
+        self.counters = {}
+
+    def merge(self, other):
+        for key, histogram in list(other.histograms.items()):
+            mine = self.histograms.get(key)
+            if mine is None:
+                mine = self.histograms[key] = Histogram()
+            mine.merge(histogram)
+        for key, value in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+class Metrics(object):
+    """
+    Telemetry of a server process: latency histograms and counters, grouped in families (e.g. 'call') of series
+    with a label (e.g. the functor name), and gauges.
+    Every thread records in its own shard, without locking, and shards are merged when the metrics are read. A thread
+    which stops recording (e.g. at the end of a connection) calls `retire`, which folds its shard into the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self.gauges = {}
+        self.started = time.time()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def observe(self, family, label, seconds):
+        """
+        Records a latency.
+        :param family: (str) name of the histogram family, e.g. 'call'.
+        :param label: (str) label of the series in the family, e.g. the functor name.
+        :param seconds: (float) the latency.
+        """
+        histograms = self._shard().histograms
+        histogram = histograms.get((family, label))
+        if histogram is None:
+            histogram = histograms[(family, label)] = Histogram()
+        histogram.record(int(seconds * 1e6))
+
+    def count(self, family, label=None, value=1):
+        """
+        Increments a counter.
+        """
+        counters = self._shard().counters
+        key = (family, label)
+        counters[key] = counters.get(key, 0) + value
+
+    def gauge(self, name, delta):
+        """
+        Changes a gauge, e.g. the number of connections. Gauges are shared between threads, so they are for values
+        changing much less often than calls.
+        """
+        with self._lock:
+            self.gauges[name] = self.gauges.get(name, 0) + delta
+
+    def retire(self):
+        """
+        Folds the shard of the calling thread into the retired shard, e.g. before the thread ends.
+        """
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            return
+        del self._local.shard
+        with self._lock:
+            self._shards.remove(shard)
+            self._retired.merge(shard)
+
+    def snapshot(self):
+        """
+        :return: a dictionary with the summaries of the histograms by family and label (refer to
+        `Histogram.summary`), the counters by family (by label if they have one), the gauges and the uptime.
+        """
+        total = _Shard()
+        with self._lock:
+            total.merge(self._retired)
+            for shard in self._shards:
+                total.merge(shard)
+            gauges = dict(self.gauges)
+        histograms = {}
+        for (family, label), histogram in total.histograms.items():
+            histograms.setdefault(family, {})[label] = histogram.summary()
+        counters = {}
+        for (family, label), value in total.counters.items():
+            if label is None:
+                counters[family] = value
+            else:
+                counters.setdefault(family, {})[label] = value
+        return {'histograms': histograms, 'counters': counters, 'gauges': gauges,
+                'uptime': time.time() - self.started}
+
+
+class Counters(object):
+    """
+    Named counters incremented by many threads without locking: every thread increments its own cells, which are
+    summed when the counters are read. Cells are kept by thread id, so that a new thread reuses those of an ended
+    thread which had the same id, and their number stays bounded by the number of threads running at once.
+    """
+
+    def __init__(self, *names):
+        self.names = names
+        self._lock = threading.Lock()
+        # thread id -> {name: value}
+        self._cells = {}
+        # offsets of the totals, set by `reset`
+        self._base = dict.fromkeys(names, 0)
+
+    def add(self, name, value=1):
+        cells = self._cells.get(get_ident())
+        if cells is None:
+            with self._lock:
+                cells = self._cells.setdefault(get_ident(), dict.fromkeys(self.names, 0))
+        cells[name] += value
+
+    def _sums(self):
+        sums = dict.fromkeys(self.names, 0)
+        for cells in list(self._cells.values()):
+            for name, value in list(cells.items()):
+                sums[name] += value
+        return sums
+
+    def totals(self):
+        """
+        :return: a dictionary of the value of every counter.
+        """
+        with self._lock:
+            sums = self._sums()
+            return dict((name, self._base[name] + sums[name]) for name in self.names)
+
+    def reset(self, values=None):
+        """
+        Sets the counters, to 0 unless given in `values`. Cells are left alone, as their threads may be incrementing
+        them: the totals are offset instead.
+        """
+        values = values or {}
+        with self._lock:
+            sums = self._sums()
+            for name in self.names:
+                self._base[name] = values.get(name, 0) - sums[name]
+
+
+# upper bounds of the prometheus histogram buckets, in microseconds: powers of two from 8us to about 34s, which hold
+# whole buckets of `Histogram`
+_PROMETHEUS_BOUNDS = [1 << i for i in range(3, 26)]
+
+
+def prometheus_text(snapshot, prefix='s1ipc'):
+    """
+    Formats a snapshot of metrics (refer to `Metrics.snapshot`) in the Prometheus text exposition format.
+    Histogram families are exported as `<prefix>_<family>_seconds` histograms with the label as `name`, counter
+    families as `<prefix>_<family>_total` and gauges as `<prefix>_<name>`.
+    :return: the text, as a string.
+    """
+    lines = []
+    for family, series in sorted(snapshot['histograms'].items()):
+        metric = '%s_%s_seconds' % (prefix, family)
+        lines.append('# TYPE %s histogram' % metric)
+        for label, summary in sorted(series.items()):
+            name = _escape(label)
+            buckets = summary['buckets']
+            cumulative = 0
+            j = 0
+            for bound in _PROMETHEUS_BOUNDS:
+                while j < len(buckets) and buckets[j][0] * 1e6 <= bound + 0.5:
+                    cumulative += buckets[j][1]
+                    j += 1
+                lines.append('%s_bucket{name="%s",le="%g"} %d' % (metric, name, bound / 1e6, cumulative))
+            lines.append('%s_bucket{name="%s",le="+Inf"} %d' % (metric, name, summary['count']))
+            lines.append('%s_sum{name="%s"} %r' % (metric, name, summary['sum']))
+            lines.append('%s_count{name="%s"} %d' % (metric, name, summary['count']))
+    for family, value in sorted(snapshot['counters'].items()):
+        metric = '%s_%s_total' % (prefix, family)
+        lines.append('# TYPE %s counter' % metric)
+        if isinstance(value, dict):
+            for label, count in sorted(value.items()):
+                lines.append('%s{name="%s"} %d' % (metric, _escape(label), count))
+        else:
+            lines.append('%s %d' % (metric, value))
+    for name, value in sorted(snapshot['gauges'].items()):
+        lines.append('# TYPE %s_%s gauge' % (prefix, name))
+        lines.append('%s_%s %r' % (prefix, name, value))
+    lines.append('# TYPE %s_uptime_seconds gauge' % prefix)
+    lines.append('%s_uptime_seconds %r' % (prefix, snapshot['uptime']))
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(label):
+    return str(label).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
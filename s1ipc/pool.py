@@ -0,0 +1,225 @@
+from collections import deque
+from contextlib import contextmanager
+import os
+import socket
+import threading
+import time
+
+from .client import BaseIPCClient, IPCCLientException
+
+__author__ = 'matheus2740'
+
+
+class PooledCaller(object):
+    """
+    Functor which calls a foreign function on the IPC server through a connection borrowed from a `ClientPool`.
+    Instances of PooledCaller are returned when one makes an attribute call on a ClientPool.
+    """
+
+    def __init__(self, pool, function):
+        self.pool = pool
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        return self.pool.call(self.function, args, kwargs)
+
+
+class ClientPool(object):
+    """
+    Thread-safe, bounded pool of connections (`BaseIPCClient` instances) to one IPC server.
+    Connections are only opened when needed, and at most `max_size` of them exist at once: when all of them
+    are in use, threads wait for one to be released.
+    Like a client, any method called on a ClientPool is called on the server, through a borrowed connection:
+
+        pool = ClientPool('/tmp/SharedCacheServer.sock')
+        pool.get(namespace, key)
+
+    Connections that stayed idle for `check_interval` seconds are pinged before being reused, and broken
+    connections are discarded. A call failing because its connection broke (e.g. the server restarted) is
+    retried once on a new connection. Connections inherited by a forked process are never used by it, as
+    they are shared with the parent process: the child starts with an empty pool.
+    """
+
+    client_class = BaseIPCClient
+
+    def __init__(self, address='/tmp/BaseIPCServer.sock', max_size=8, timeout=None, check_interval=30,
+                 client_class=None, **client_kwargs):
+        """
+        Initializes the pool. No connection is made until one is needed.
+        :param address: The UNIX socket path
+        :param max_size: (int) Maximum number of connections in the pool.
+        :param timeout: (float) Maximum time in seconds to wait for a free connection, None waits forever.
+        :param check_interval: (float) Idle time in seconds after which a connection is pinged before reuse.
+        :param client_class: (optional) The client class used to connect, defaults to BaseIPCClient.
+        :param client_kwargs: other keyword arguments are passed to the client class (e.g. transport, serializer).
+        """
+        self.address = address
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.client_kwargs = client_kwargs
+        if client_class is not None:
+            self.client_class = client_class
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()
+        self._size = 0
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # the idle connections belong to the parent process: forget them without saying goodbye
+            for client, last_used in list(self._idle):
+                _forget(client)
+            self._reset()
+
+    def acquire(self):
+        """
+        Borrows a connection from the pool, connecting a new one if needed.
+        The connection must be given back with `release`.
+        :return: a connected client.
+        :raise IPCCLientException: if no connection became available within `timeout`.
+        """
+        self._check_fork()
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        with self._cond:
+            while not self._idle and self._size >= self.max_size:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise IPCCLientException('Timed out waiting for a connection from the pool.')
+                self._cond.wait(remaining)
+            if self._idle:
+                client, last_used = self._idle.pop()
+            else:
+                client, last_used = None, None
+                self._size += 1
+
+        if client is not None and time.time() - last_used >= self.check_interval and not self._healthy(client):
+            _forget(client)
+            client = None
+
+        if client is None:
+            try:
+                client = self.client_class(self.address, **self.client_kwargs)
+            except:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        return client
+
+    def release(self, client, broken=False):
+        """
+        Gives back a connection borrowed with `acquire`.
+        :param client: the borrowed client.
+        :param broken: (bool) Flag indicating the connection is not usable anymore, and must be discarded.
+        """
+        if self._pid != os.getpid():
+            return
+        discard = broken or not client.connected
+        with self._cond:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((client, time.time()))
+            self._cond.notify()
+        if discard:
+            _forget(client)
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager borrowing a connection for the duration of the `with` block,
+        e.g. to make a pipeline. The connection is discarded if the block raises.
+        """
+        client = self.acquire()
+        try:
+            yield client
+        except:
+            self.release(client, broken=True)
+            raise
+        self.release(client)
+
+    def call(self, function, args, kwargs):
+        """
+        Calls a foreign function on the server through a borrowed connection.
+        If the connection turns out to be broken, the call is retried once on a new connection.
+        """
+        for attempt in (0, 1):
+            client = self.acquire()
+            try:
+                result = client.__getattr__(function)(*args, **kwargs)
+            except (socket.error, IPCCLientException):
+                self.release(client, broken=True)
+                if attempt:
+                    raise
+                # the server probably restarted: the other idle connections are broken too
+                self._drop_idle()
+                continue
+            except:
+                self.release(client, broken=True)
+                raise
+            self.release(client)
+            return result
+
+    def telemetry(self, prometheus=False):
+        """
+        Retrieves the telemetry of the server through a borrowed connection (refer to `BaseIPCClient.telemetry`).
+        """
+        with self.connection() as client:
+            return client.telemetry(prometheus)
+
+    def profiling(self, command, **options):
+        """
+        Controls the profiler of the server through a borrowed connection (refer to `BaseIPCClient.profiling`).
+        """
+        with self.connection() as client:
+            return client.profiling(command, **options)
+
+    def close(self):
+        """
+        Disconnects all idle connections. Connections in use are disconnected when released.
+        The pool can still be used afterwards, connecting again as needed.
+        """
+        self._check_fork()
+        with self._cond:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for client, last_used in idle:
+            client.disconnect()
+
+    def _drop_idle(self):
+        with self._cond:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for client, last_used in idle:
+            _forget(client)
+
+    @staticmethod
+    def _healthy(client):
+        try:
+            return client.ping()
+        except (socket.error, IPCCLientException):
+            return False
+
+    def __getattr__(self, item):
+        """
+        Any method (with exception of the above defined and the object methods) called on an instance
+        of ClientPool is called on the server through a borrowed connection.
+        """
+        if item.startswith('__'):
+            raise AttributeError(item)
+        return PooledCaller(self, item)
+
+
+def _forget(client):
+    # closes the socket without the goodbye message, which the client would otherwise send when collected
+    client.connected = False
+    try:
+        client.sock.close()
+    except socket.error:
+        pass
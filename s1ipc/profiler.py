@@ -0,0 +1,216 @@
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    from thread import get_ident
+except ImportError:
+    from threading import get_ident
+
+import cProfile
+
+__author__ = 'matheus2740'
+
+MODES = ('cprofile', 'sample')
+
+
+class Profiler(object):
+    """
+    Profiler of the dispatches of a server, switched on and off while the server runs (refer to
+    `BaseIPCClient.profiling`). Only a fraction of the dispatches are profiled, drawn at random, so that it may run
+    on a loaded server. Two modes are available:
+     - 'cprofile' runs the profiled dispatches under cProfile, accumulating the calls of every function. A single
+       dispatch is profiled at a time: the dispatches made meanwhile by other threads are not profiled.
+     - 'sample' records, every `interval` seconds, the stack of every thread running a profiled dispatch, rooted at
+       the functor name, and counts the identical stacks ("collapsed stacks", the input of flame graph tools).
+       Its cost does not depend on how many functions the dispatches call.
+    While inactive, a dispatch costs one attribute check.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.mode = None
+        self.fraction = 0.0
+        self.interval = 0.0
+        self._lock = threading.Lock()
+        # held while a dispatch is profiled by cProfile
+        self._busy = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.started = None
+        self.stopped = None
+        # functor name -> number of profiled dispatches
+        self.dispatches = {}
+        self._profile = None
+        # thread id -> (functor name, frame of `call`) of the profiled dispatch the thread runs
+        self._running = {}
+        # collapsed stack -> number of samples
+        self._stacks = {}
+        self._sampler = None
+
+    def start(self, mode='cprofile', fraction=0.1, interval=0.005):
+        """
+        Starts profiling, discarding the data of the previous run.
+        :param mode: (str) 'cprofile' or 'sample'.
+        :param fraction: (float) fraction of the dispatches profiled, from 0 to 1.
+        :param interval: (float) seconds between two samples, in 'sample' mode.
+        """
+        if mode not in MODES:
+            raise ValueError('Unknown profiling mode: %r' % (mode,))
+        if not 0 <= fraction <= 1:
+            raise ValueError('The fraction of profiled dispatches must be between 0 and 1.')
+        with self._lock:
+            self._stop()
+            self._reset()
+            self.mode, self.fraction, self.interval = mode, fraction, interval
+            self.started = time.time()
+            if mode == 'cprofile':
+                self._profile = cProfile.Profile()
+            else:
+                self._sampler = threading.Thread(target=self._sample, name='Profiler')
+                self._sampler.daemon = True
+            self.active = True
+            if self._sampler is not None:
+                self._sampler.start()
+
+    def stop(self):
+        """
+        Stops profiling, keeping the data for `report`.
+        """
+        with self._lock:
+            self._stop()
+
+    def _stop(self):
+        if not self.active:
+            return
+        self.active = False
+        self.stopped = time.time()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def call(self, name, functor, args, kwargs):
+        """
+        Calls a functor on behalf of a dispatch, profiling it if it is drawn.
+        """
+        if not self.active or random.random() >= self.fraction:
+            return functor(*args, **kwargs)
+        if self.mode == 'sample':
+            ident = get_ident()
+            self._running[ident] = (name, sys._getframe())
+            try:
+                return functor(*args, **kwargs)
+            finally:
+                self._running.pop(ident, None)
+                self._count(name)
+        if not self._busy.acquire(False):
+            return functor(*args, **kwargs)
+        try:
+            profile = self._profile
+            if profile is None:
+                # switched to the sample mode meanwhile
+                return functor(*args, **kwargs)
+            profile.enable()
+            try:
+                return functor(*args, **kwargs)
+            finally:
+                profile.disable()
+                self._count(name)
+        finally:
+            self._busy.release()
+
+    def _count(self, name):
+        # counts are only approximate if several threads dispatch the same functor at once, which is enough here
+        self.dispatches[name] = self.dispatches.get(name, 0) + 1
+
+    def _sample(self):
+        me = get_ident()
+        stacks = self._stacks
+        while self.active:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for ident, (name, root) in list(self._running.items()):
+                frame = frames.get(ident)
+                if frame is None or ident == me:
+                    continue
+                stack = []
+                while frame is not None and frame is not root:
+                    code = frame.f_code
+                    stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                                                 code.co_firstlineno))
+                    frame = frame.f_back
+                if frame is None:
+                    # not the stack of the dispatch: on python 2, the threads of the parent of a forked process
+                    # are still listed, and their ids may be taken by new threads
+                    continue
+                stack.append(name)
+                key = ';'.join(reversed(stack))
+                stacks[key] = stacks.get(key, 0) + 1
+            del frames
+
+    def report(self, path=None, limit=30, sort='cumulative'):
+        """
+        :param path: (optional) file to write the data to: a pstats file in 'cprofile' mode (readable with
+        `pstats.Stats`), or collapsed stacks in 'sample' mode, one "stack count" line each.
+        :param limit: (int) number of functions (or stacks) in the text report.
+        :param sort: (str) pstats sort key of the text report, in 'cprofile' mode.
+        :return: a dictionary with the mode, whether profiling is active, its duration in seconds, the number of
+        profiled dispatches by functor, the text report, and in 'sample' mode the number of samples and the `limit`
+        most frequent stacks as a list of [stack, count].
+        """
+        with self._lock:
+            duration = 0.0
+            if self.started is not None:
+                duration = (time.time() if self.active else self.stopped) - self.started
+            report = {'mode': self.mode, 'active': self.active, 'fraction': self.fraction, 'duration': duration,
+                      'dispatches': dict(self.dispatches)}
+            if self.mode == 'cprofile':
+                report['text'] = self._cprofile_report(path, limit, sort)
+            elif self.mode == 'sample':
+                stacks = sorted(list(self._stacks.items()), key=lambda item: -item[1])
+                if path is not None:
+                    with open(path, 'w') as f:
+                        for stack, count in stacks:
+                            f.write('%s %d\n' % (stack, count))
+                report['samples'] = sum(count for stack, count in stacks)
+                report['stacks'] = [[stack, count] for stack, count in stacks[:limit]]
+                report['text'] = '\n'.join('%6d %s' % (count, stack) for stack, count in stacks[:limit])
+            if path is not None:
+                report['path'] = path
+            return report
+
+    def _cprofile_report(self, path, limit, sort):
+        # the profile must not be recording while it is read
+        with self._busy:
+            if not self.dispatches:
+                return ''
+            stream = StringIO()
+            stats = pstats.Stats(self._profile, stream=stream)
+            if path is not None:
+                stats.dump_stats(path)
+            stats.sort_stats(sort).print_stats(limit)
+            return stream.getvalue()
+
+    def command(self, command, options):
+        """
+        Runs a profiling command sent by a client (refer to `BaseIPCClient.profiling`).
+        :return: the report of the profiler (refer to `report`).
+        """
+        options = dict(options or {})
+        if command == 'start':
+            self.start(**options)
+            return self.report()
+        if command == 'stop':
+            self.stop()
+            return self.report(**options)
+        if command == 'report':
+            return self.report(**options)
+        raise ValueError('Unknown profiling command: %r' % (command,))
@@ -1,6 +1,12 @@
 __author__ = 'matheus2740'
 
+import errno
 import pickle
+import socket
+import struct
+
+from .compression import get_codec
+from .serializers import get_serializer, SerializerUnsupported, DEFAULT_SERIALIZER
 
 
 class ICPProtocolException(Exception):
@@ -43,7 +49,7 @@ class BaseIPCProtocol(object):
             zeros = '0' * (BaseIPCProtocol.HEADER_SIZE - len(header))
             header = zeros + header
 
-        packet = header + data
+        packet = header.encode('ascii') + data
         return packet
 
     @staticmethod
@@ -69,8 +75,203 @@ class BaseIPCProtocol(object):
         """
         try:
             header = sock.recv(BaseIPCProtocol.HEADER_SIZE)
-            length = int('0x'+header, 16)
+            length = int(header, 16)
             payload = sock.recv(length)
             return pickle.loads(payload)
         except ValueError:
             return None
+
+
+class BinaryIPCProtocol(BaseIPCProtocol):
+    """
+    Protocol with a fixed binary header and exact reads.
+    Every message is prefixed by `HEADER`, a network-order struct holding the payload length (unsigned 32 bits)
+    and a 16 bits flags field describing how the payload is encoded. The low bits of the flags (`SERIALIZER_MASK`)
+    hold the id of the serializer of the payload (refer to `s1ipc.serializers`), so every frame can be decoded
+    whichever serializer the sender chose; a serializer which cannot encode some message falls back to pickle.
+    The next 4 bits (`COMPRESSION_MASK`) hold the id of the codec which compressed the payload, 0 if it is not
+    compressed (refer to `s1ipc.compression`): when a codec is given, payloads of at least `COMPRESS_THRESHOLD` bytes
+    are compressed, unless that does not make them smaller.
+    The payload is read with `recv_into` in a loop over a buffer preallocated to the announced length, so messages
+    larger than the kernel socket buffer arrive intact.
+    Header and payload are handed to the socket as separate buffers (scatter-gather through `sendmsg` where available),
+    so large payloads are never copied just to be prefixed; buffers smaller than `COALESCE_SIZE` are joined, as a small
+    copy is cheaper than an extra system call.
+
+    Subclasses may override `dumps` and `loads` to change the payload encoding while keeping the framing.
+    """
+
+    HEADER = struct.Struct('!IH')
+    HEADER_SIZE = HEADER.size
+    MAX_PAYLOAD_SIZE = 0xFFFFFFFF
+    COALESCE_SIZE = 1024
+    SERIALIZER_MASK = 0x000F
+    COMPRESSION_MASK = 0x00F0
+    COMPRESSION_SHIFT = 4
+    COMPRESS_THRESHOLD = 8192
+
+    @classmethod
+    def dumps(cls, data, serializer=None, codec=None):
+        """
+        Serializes an object into a payload.
+        :param data: any object
+        :param serializer: (optional) the serializer to use (name, id or instance), defaults to pickle.
+        :param codec: (optional) the codec compressing large payloads (name, id or instance), defaults to none.
+        :return: a tuple (flags, payload), where payload is a string.
+        """
+        serializer = get_serializer(serializer)
+        try:
+            flags, payload = serializer.id, serializer.dumps(data)
+        except SerializerUnsupported:
+            flags, payload = DEFAULT_SERIALIZER.id, DEFAULT_SERIALIZER.dumps(data)
+        codec = get_codec(codec)
+        if codec is not None and len(payload) >= cls.COMPRESS_THRESHOLD:
+            compressed = codec.compress(payload)
+            if len(compressed) < len(payload):
+                flags, payload = flags | codec.id << cls.COMPRESSION_SHIFT, compressed
+        return flags, payload
+
+    @classmethod
+    def loads(cls, flags, payload):
+        """
+        Deserializes a payload received with the given header flags.
+        :param flags: (int) the flags field of the frame header.
+        :param payload: a bytearray (or string) holding the payload.
+        :return: the original object.
+        """
+        codec = (flags & cls.COMPRESSION_MASK) >> cls.COMPRESSION_SHIFT
+        if codec:
+            payload = get_codec(codec).decompress(payload)
+        return get_serializer(flags & cls.SERIALIZER_MASK).loads(payload)
+
+    @classmethod
+    def pack_frames(cls, data, flags=0, serializer=None, codec=None):
+        """
+        Serializes an object into the buffers of one frame, without joining them.
+        :param data: any object
+        :param flags: (int) extra flags to set on the frame header.
+        :param serializer: (optional) the serializer to use (name, id or instance), defaults to pickle.
+        :param codec: (optional) the codec compressing large payloads (name, id or instance), defaults to none.
+        :return: a list [header, payload].
+        """
+        dflags, payload = cls.dumps(data, serializer, codec)
+        if len(payload) > cls.MAX_PAYLOAD_SIZE:
+            raise ICPProtocolException('Attempted sending message too large for protocol: %s' % cls.__name__)
+        return [cls.HEADER.pack(len(payload), flags | dflags), payload]
+
+    @classmethod
+    def pack_message(cls, data):
+        """
+        Serializes an object into a single string holding the whole frame.
+        Prefer `pack_frames` when the result is to be written to a socket.
+        :param data: any object
+        :return: a string which will be messaged through the socket.
+        """
+        return b''.join(cls.pack_frames(data))
+
+    @classmethod
+    def send_message(cls, sock, data, serializer=None, codec=None):
+        """
+        Serializes and sends an object through the socket.
+        :param sock: a socket object
+        :param data: any object
+        :param serializer: (optional) the serializer to use (name, id or instance), defaults to pickle.
+        :param codec: (optional) the codec compressing large payloads (name, id or instance), defaults to none.
+        """
+        cls.send_buffers(sock, cls.pack_frames(data, serializer=serializer, codec=codec))
+
+    @classmethod
+    def send_buffers(cls, sock, buffers):
+        """
+        Writes a sequence of buffers to the socket, as if they were a single string.
+        Consecutive buffers smaller than `COALESCE_SIZE` are joined; the remaining ones are written with
+        `sendmsg` (scatter-gather) when the socket supports it, or with one `sendall` each otherwise.
+        :param sock: a socket object
+        :param buffers: a list of strings.
+        """
+        chunks = []
+        small = []
+        for buf in buffers:
+            if len(buf) < cls.COALESCE_SIZE:
+                small.append(buf)
+                continue
+            if small:
+                chunks.append(b''.join(small))
+                small = []
+            chunks.append(buf)
+        if small:
+            chunks.append(b''.join(small))
+
+        if len(chunks) == 1 or not hasattr(sock, 'sendmsg'):
+            for chunk in chunks:
+                sock.sendall(chunk)
+            return
+
+        views = [memoryview(chunk) for chunk in chunks]
+        while views:
+            sent = sock.sendmsg(views)
+            while views and sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            if views and sent:
+                views[0] = views[0][sent:]
+
+    @staticmethod
+    def recv_exactly(sock, size):
+        """
+        Receives exactly `size` bytes from the socket into a preallocated buffer.
+        :param sock: a socket object
+        :param size: (int) the number of bytes to receive.
+        :return: a bytearray of length `size`, or None if the peer closed the connection.
+        """
+        buf = bytearray(size)
+        view = memoryview(buf)
+        received = 0
+        while received < size:
+            n = sock.recv_into(view[received:], size - received)
+            if not n:
+                return None
+            received += n
+        return buf
+
+    @classmethod
+    def recv_frame(cls, sock):
+        """
+        Receives one whole frame from the socket.
+        :param sock: a socket object
+        :return: a tuple (flags, payload) where payload is a bytearray, or None if the connection was closed.
+        """
+        header = cls.recv_exactly(sock, cls.HEADER_SIZE)
+        if header is None:
+            return None
+        length, flags = cls.HEADER.unpack_from(header)
+        payload = cls.recv_exactly(sock, length)
+        if payload is None:
+            return None
+        return flags, payload
+
+    @classmethod
+    def recover_frame(cls, sock):
+        """
+        Receives one whole frame from the socket, like `recv_frame`, treating a connection reset as closed.
+        :param sock: a socket object
+        :return: a tuple (flags, payload), or None if the connection was closed.
+        """
+        try:
+            return cls.recv_frame(sock)
+        except socket.error as e:
+            if e.args[0] in (errno.ECONNRESET, errno.EPIPE):
+                return None
+            raise
+
+    @classmethod
+    def recover_message(cls, sock):
+        """
+        Receives and parses one message from the socket.
+        :param sock: a socket object
+        :return: the parsed message into the original object, or None if the connection was closed.
+        """
+        frame = cls.recover_frame(sock)
+        if frame is None:
+            return None
+        return cls.loads(*frame)
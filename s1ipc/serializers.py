@@ -0,0 +1,178 @@
+import marshal
+import pickle
+import sys
+
+__author__ = 'matheus2740'
+
+
+class SerializerUnsupported(Exception):
+    """
+    Raised by a serializer which cannot encode some object. The protocol then falls back to pickle for that message.
+    """
+    pass
+
+
+class Serializer(object):
+    """
+    Base class of the payload serializers.
+    Every serializer has a unique `id`, stored in the flags of the frames it encodes, so any frame can be
+    decoded whatever serializer the peer chose, and a unique `name`, used to choose it.
+    """
+
+    id = None
+    name = None
+
+    def dumps(self, data):
+        """
+        :param data: any object
+        :return: the serialized object, as a string.
+        :raise SerializerUnsupported: if this serializer cannot encode the object.
+        """
+        raise NotImplementedError
+
+    def loads(self, payload):
+        """
+        :param payload: a bytearray (or string) holding the serialized object.
+        :return: the original object.
+        """
+        raise NotImplementedError
+
+
+class PickleSerializer(Serializer):
+    """
+    Pickle, with the highest protocol of the interpreter. Encodes anything picklable, and is the fallback
+    of every other serializer.
+    """
+    id = 0
+    name = 'pickle'
+    protocol = pickle.HIGHEST_PROTOCOL
+
+    def dumps(self, data):
+        return pickle.dumps(data, self.protocol)
+
+    def loads(self, payload):
+        return pickle.loads(_as_loadable(payload))
+
+
+class MarshalSerializer(Serializer):
+    """
+    marshal: much faster than pickle, but only for builtin types (and not across python major versions).
+    """
+    id = 1
+    name = 'marshal'
+
+    def dumps(self, data):
+        try:
+            return marshal.dumps(data, 2)
+        except ValueError:
+            raise SerializerUnsupported()
+
+    def loads(self, payload):
+        return marshal.loads(_as_loadable(payload))
+
+
+class RawSerializer(Serializer):
+    """
+    Passthrough for messages which already are strings (bytes), which are sent as they are.
+    """
+    id = 2
+    name = 'raw'
+
+    def dumps(self, data):
+        if not isinstance(data, bytes):
+            raise SerializerUnsupported()
+        return data
+
+    def loads(self, payload):
+        return bytes(payload)
+
+
+class MsgpackSerializer(Serializer):
+    """
+    msgpack, if the msgpack package is installed. Only encodes builtin types, and decodes tuples as lists.
+    """
+    id = 3
+    name = 'msgpack'
+
+    def __init__(self, msgpack):
+        self.msgpack = msgpack
+
+    def dumps(self, data):
+        try:
+            return self.msgpack.packb(data, use_bin_type=True)
+        except (TypeError, ValueError, OverflowError):
+            raise SerializerUnsupported()
+
+    def loads(self, payload):
+        return self.msgpack.unpackb(_as_loadable(payload), raw=False)
+
+
+_by_id = {}
+_by_name = {}
+
+
+def register_serializer(serializer):
+    """
+    Makes a serializer available to the protocol and to the negotiation of clients and servers.
+    :param serializer: a `Serializer` instance, whose id (0 to 15) and name are not in use.
+    """
+    if not 0 <= serializer.id <= 15:
+        raise ValueError('Serializer ids must be between 0 and 15.')
+    _by_id[serializer.id] = serializer
+    _by_name[serializer.name] = serializer
+
+
+def get_serializer(key):
+    """
+    :param key: a serializer id, name or instance, or None for the default (pickle) serializer.
+    :return: the registered `Serializer`.
+    :raise KeyError: if no such serializer is registered.
+    """
+    if key is None:
+        return DEFAULT_SERIALIZER
+    if isinstance(key, Serializer):
+        return key
+    if isinstance(key, int):
+        return _by_id[key]
+    return _by_name[key]
+
+
+def negotiate(preferred):
+    """
+    Chooses the first serializer of a list which is registered in this process.
+    :param preferred: a list of serializer names, in order of preference.
+    :return: the chosen `Serializer`, or the default one if none is available.
+    """
+    for name in preferred:
+        if name in _by_name:
+            return _by_name[name]
+    return DEFAULT_SERIALIZER
+
+
+def available_serializers():
+    """
+    :return: the names of the registered serializers.
+    """
+    return sorted(_by_name)
+
+
+DEFAULT_SERIALIZER = PickleSerializer()
+register_serializer(DEFAULT_SERIALIZER)
+register_serializer(MarshalSerializer())
+register_serializer(RawSerializer())
+
+try:
+    import msgpack
+except ImportError:
+    pass
+else:
+    register_serializer(MsgpackSerializer(msgpack))
+
+
+if sys.version_info[0] >= 3:
+    def _as_loadable(payload):
+        return payload
+else:
+    def _as_loadable(payload):
+        # python 2 unpicklers only accept strings
+        return bytes(payload)
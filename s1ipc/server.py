@@ -1,34 +1,213 @@
-from SocketServer import UnixStreamServer, StreamRequestHandler, ThreadingMixIn
+try:
+    from SocketServer import UnixStreamServer, StreamRequestHandler, ThreadingMixIn
+except ImportError:
+    from socketserver import UnixStreamServer, StreamRequestHandler, ThreadingMixIn
 from multiprocessing import Process, Value
 import os
 import select
+import socket
 import errno
-from protocol import BaseIPCProtocol
+import threading
+import weakref
+
+try:
+    from Queue import Queue, Empty, Full
+except ImportError:
+    from queue import Queue, Empty, Full
+
+from .compression import negotiate_codec
+from .metrics import Metrics, clock, prometheus_text
+from .profiler import Profiler
+from .protocol import BinaryIPCProtocol
+from .serializers import negotiate
+from .shm import ShmChannel
+from .transport import HANDSHAKE_TIMEOUT, deliver_challenge, get_authkey, is_tcp, tune_tcp
 
 
 __author__ = 'matheus2740'
 
 
 class BaseIPCHandler(StreamRequestHandler):
+    """
+    Handles one client connection, reading call requests until the client says goodbye.
+    A message may be a single call dictionary or a list of them (a pipelined batch), in which case
+    every call is dispatched in order and all the replies are sent back in one message.
+    A client may also ask to move the connection to shared-memory rings (refer to `ShmChannel`), after which
+    the request is read from and answered through them, and may choose the serializer and compression codec
+    of the replies in a handshake (refer to `s1ipc.serializers` and `s1ipc.compression`).
+    A connection may also subscribe to a channel, after which it only receives the events published on it
+    (refer to `publish`), may ask for the telemetry of the server (refer to `BaseIPCServer.stats`), and may switch
+    the profiler of the server on and off (refer to `BaseIPCServer.profiler`).
+    Clients of a TCP server must first pass the handshake of its authkey; they may neither shut the server down nor
+    have the profiler write files.
+    Unless the server's `collect_metrics` is False, the handler records the bytes it reads and writes and the time
+    spent decoding calls, encoding replies and sending them (the 'phase' histograms).
+
+    :class attribute max_pending_events: events waiting to be sent to a subscriber, beyond which the subscription
+     is closed (the subscriber is not keeping up and must assume it missed events).
+    :class attribute subscription_poll: interval in seconds at which an idle subscription checks its connection.
+    """
+
+    max_pending_events = 10000
+    subscription_poll = 1.0
+
+    def setup(self):
+        StreamRequestHandler.setup(self)
+        self.serializer = None
+        self.codec = None
+        self.metrics = self.server.metrics if self.server.collect_metrics else None
+        if self.metrics is not None:
+            self.metrics.gauge('connections', 1)
+            self.metrics.count('connections')
 
     def handle(self):
+        if self.server.authkey is not None and not self.authenticate():
+            return
+
         while 1:
-            self.data = self.server.protocol.recover_message(self.request)
+            self.data = self.receive()
 
             if self.data == '__!goodbye__' or self.data is None:
                 return
 
             if self.data == '__!shutdown__':
-                self.server.harakiri()
+                if self.server.address_family == socket.AF_UNIX:
+                    self.server.harakiri()
+                return
+
+            if self.data == '__!ping__':
+                self.server.protocol.send_message(self.request, '__!pong__')
+                continue
+
+            if isinstance(self.data, tuple) and self.data[0] == '__!shm__':
+                self.upgrade_shm(self.data[1])
+                continue
+
+            if isinstance(self.data, tuple) and self.data[0] == '__!hello__':
+                self.serializer, self.codec, reply = _hello(self.data)
+                self.server.protocol.send_message(self.request, reply)
+                continue
+
+            if isinstance(self.data, tuple) and self.data[0] == '__!subscribe__':
+                self.subscription(self.data[1])
                 return
 
-            fname = self.data['f']
-            args = self.data['a']
-            kwargs = self.data['kw']
+            if self.data == '__!stats__' or isinstance(self.data, tuple) and self.data[0] == '__!stats__':
+                self.server.protocol.send_message(self.request, self.server.stats_message(self.data),
+                                                  self.serializer, self.codec)
+                continue
+
+            if isinstance(self.data, tuple) and self.data[0] == '__!profile__':
+                local = self.server.address_family == socket.AF_UNIX
+                self.server.protocol.send_message(self.request, self.server.profile_message(self.data, local),
+                                                  self.serializer, self.codec)
+                continue
+
+            if isinstance(self.data, list):
+                reply = [self.server.dispatch(call) for call in self.data]
+            else:
+                reply = self.server.dispatch(self.data)
+
+            self.reply(reply)
+
+    def authenticate(self):
+        """
+        Runs the handshake of a new TCP connection, before any message of the client is decoded.
+        :return: True if the client proved it knows the authkey of the server.
+        """
+        self.request.settimeout(HANDSHAKE_TIMEOUT)
+        try:
+            if not deliver_challenge(self.server.protocol, self.request, self.server.authkey):
+                return False
+        except socket.error:
+            return False
+        self.request.settimeout(None)
+        return True
+
+    def receive(self):
+        """
+        Reads the next message of the client.
+        :return: the message, or None if the connection was closed.
+        """
+        protocol = self.server.protocol
+        if self.metrics is None or not hasattr(protocol, 'recover_frame'):
+            return protocol.recover_message(self.request)
+        frame = protocol.recover_frame(self.request)
+        if frame is None:
+            return None
+        self.metrics.count('bytes_received', value=protocol.HEADER_SIZE + len(frame[1]))
+        self.metrics.count('messages')
+        start = clock()
+        message = protocol.loads(*frame)
+        self.metrics.observe('phase', 'decode', clock() - start)
+        return message
+
+    def reply(self, reply):
+        """
+        Sends the reply to a call or batch of calls.
+        """
+        protocol = self.server.protocol
+        if self.metrics is None or not hasattr(protocol, 'pack_frames'):
+            protocol.send_message(self.request, reply, self.serializer, self.codec)
+            return
+        start = clock()
+        frames = protocol.pack_frames(reply, serializer=self.serializer, codec=self.codec)
+        encoded = clock()
+        protocol.send_buffers(self.request, frames)
+        self.metrics.observe('phase', 'encode', encoded - start)
+        self.metrics.observe('phase', 'send', clock() - encoded)
+        self.metrics.count('bytes_sent', value=sum(len(frame) for frame in frames))
+
+    def upgrade_shm(self, capacity):
+        """
+        Answers a request to move the connection to shared memory: creates the rings, sends their paths
+        to the client and from then on uses them instead of the socket.
+        Servers whose `shm_transport` is False answer None, and the client stays on the socket.
+        """
+        if not self.server.shm_transport or isinstance(self.request, ShmChannel):
+            self.server.protocol.send_message(self.request, None)
+            return
+        channel, client_tx, client_rx = ShmChannel.create(self.request, capacity)
+        self.server.protocol.send_message(self.request, ('__!shm__', client_tx, client_rx))
+        self.request = channel
+
+    def subscription(self, channel):
+        """
+        Serves a subscription: sends the events published on the channel until the client leaves.
+        """
+        events = Queue(self.max_pending_events)
+        overflow = []
 
-            result = self.server._quiver[fname](*args, **kwargs)
+        def push(event):
+            try:
+                events.put_nowait(event)
+            except Full:
+                overflow.append(True)
 
-            BaseIPCProtocol.send_message(self.request, [result])
+        subscribe(channel, push)
+        try:
+            self.server.protocol.send_message(self.request, ('__!subscribe__', channel))
+            while not overflow:
+                try:
+                    event = events.get(timeout=self.subscription_poll)
+                except Empty:
+                    # the client only writes to a subscription to leave
+                    r, w, e = select.select([self.request], [], [], 0)
+                    if r:
+                        return
+                    continue
+                self.server.protocol.send_message(self.request, event, self.serializer, self.codec)
+        finally:
+            unsubscribe(channel, push)
+
+    def finish(self):
+        StreamRequestHandler.finish(self)
+        if isinstance(self.request, ShmChannel):
+            self.request.close()
+        if self.metrics is not None:
+            self.metrics.gauge('connections', -1)
+            # this thread serves no other connection
+            self.metrics.retire()
 
 
 class IPCAvailable(object):
@@ -58,25 +237,59 @@ class BaseIPCServer(ThreadingMixIn, UnixStreamServer):
     :class attribute handler: The requisition handler class, defaults to BaseIPCHandler
      which is adequate for most scenarios.
     :class attribute protocol: The class in charge of serializing, deserializing, sending and
-     retrieving information to and from the socket, defaults to BaseIPCProtocol which uses pickling.
+     retrieving information to and from the socket, defaults to BinaryIPCProtocol which uses pickling
+     and binary length-prefixed frames.
+    :class attribute shm_transport: Flag indicating that clients may move their connection to shared-memory
+     rings (experimental, refer to `ShmChannel`), defaults to False. Always False for TCP servers.
+    :attribute profiler: the `Profiler` of the dispatches, which clients switch on and off while the server runs
+     (refer to `BaseIPCClient.profiling`).
+    :class attribute collect_metrics: Flag indicating that the server records latency histograms of every functor
+     and of the phases of every call, byte counters and connection gauges (refer to `stats`), defaults to True.
+
+    Servers listen on a UNIX socket, or on TCP if their address is a (host, port) tuple, e.g. to serve clients on
+    other hosts. The framing is the same on both. As messages are pickled, any client may run code in the server
+    process: TCP servers therefore need an `authkey`, a shared secret which every client must prove it knows (through
+    an HMAC challenge in both directions, refer to `s1ipc.transport`) before any of its messages is decoded. The secret
+    is never sent, but the traffic is not encrypted: the port must still only be reachable from trusted hosts (or
+    through a tunnel). Clients connected through TCP cannot shut the server down, nor have the profiler write files.
     """
     daemon_threads = True
     request_queue_size = 128
     handler = BaseIPCHandler
-    protocol = BaseIPCProtocol
+    protocol = BinaryIPCProtocol
+    shm_transport = False
+    collect_metrics = True
     _quiver = {}
+    # servers created by this process, whose listening sockets the server processes forked later must not keep open
+    _instances = weakref.WeakSet()
 
-    def __init__(self, address='/tmp/BaseIPCServer.sock', start=True):
+    def __init__(self, address='/tmp/BaseIPCServer.sock', start=True, authkey=None):
         """
         Initializes the server.
-        :param address: (str) The unix socket file path
+        :param address: (str) The unix socket file path, or a (host, port) tuple to listen on TCP. With port 0, a free
+        port is chosen, and `address` holds it once the server is initialized.
         :param start: (bool) Flag indicating if the server should startup rightaway.
+        :param authkey: (bytes) shared secret of the clients of a TCP server, defaults to the S1IPC_AUTHKEY environment
+        variable. Ignored for UNIX sockets, whose access is controlled by the permissions of the socket file.
+        :raise ValueError: if the server listens on TCP without an authkey.
         """
+        self.authkey = get_authkey(authkey) if is_tcp(address) else None
+        if is_tcp(address) and self.authkey is None:
+            raise ValueError('TCP servers need an authkey (or the S1IPC_AUTHKEY environment variable).')
         self.address = address
         self.deleted_socket_file = False
         self.process = None
         self.shuttingdown = Value('i', 0)
+        self.metrics = Metrics()
+        self.profiler = Profiler()
+        if is_tcp(address):
+            self.address_family = socket.AF_INET
+            self.allow_reuse_address = True
+            self.shm_transport = False
         UnixStreamServer.__init__(self, self.address, self.handler)
+        if is_tcp(address):
+            self.address = self.server_address
+        BaseIPCServer._instances.add(self)
         self._started = False
         if start:
             self.startup()
@@ -93,6 +306,73 @@ class BaseIPCServer(ThreadingMixIn, UnixStreamServer):
         """
         BaseIPCServer._quiver[functor.__name__ if not name else name] = functor
 
+    def get_request(self):
+        request, client_address = self.socket.accept()
+        if self.address_family != socket.AF_UNIX:
+            tune_tcp(request)
+        return request, client_address
+
+    def dispatch(self, call):
+        """
+        Calls a registered functor on behalf of a client.
+        :param call: a call dictionary, holding the function name ('f'), arguments ('a'),
+         keyword arguments ('kw') and optionally a request id ('id').
+        :return: the reply to be sent to the client: a list [result, request id].
+        """
+        if not self.collect_metrics:
+            return [self._call(call), call.get('id')]
+        start = clock()
+        try:
+            result = self._call(call)
+        except Exception:
+            self.metrics.count('errors', call.get('f'))
+            raise
+        self.metrics.observe('call', call['f'], clock() - start)
+        return [result, call.get('id')]
+
+    def _call(self, call):
+        if self.profiler.active:
+            return self.profiler.call(call['f'], self._quiver[call['f']], call['a'], call['kw'])
+        return self._quiver[call['f']](*call['a'], **call['kw'])
+
+    def stats(self):
+        """
+        Telemetry of the server process, as returned to clients asking for it (refer to `BaseIPCClient.telemetry`):
+         - histograms 'call', the latency of every functor by name, and 'phase', the time spent decoding calls
+           ('decode'), encoding replies ('encode'), sending them ('send') and, on servers with workers, waiting
+           for a worker ('queue');
+         - counters 'messages', 'bytes_received', 'bytes_sent', 'connections' (accepted so far) and 'errors' (calls
+           which raised, by functor);
+         - gauges 'connections' (currently open) and 'threads', and 'queue_depth' on servers with workers.
+        :return: a dictionary (refer to `Metrics.snapshot`).
+        """
+        stats = self.metrics.snapshot()
+        stats['gauges']['threads'] = threading.active_count()
+        return stats
+
+    def stats_message(self, message):
+        """
+        :param message: a request for the telemetry, '__!stats__' or ('__!stats__', 'prometheus').
+        :return: the reply: the dictionary of `stats`, or its Prometheus text format.
+        """
+        if isinstance(message, tuple) and message[1] == 'prometheus':
+            return prometheus_text(self.stats())
+        return self.stats()
+
+    def profile_message(self, message, local=True):
+        """
+        :param message: a profiling command, ('__!profile__', command, options) (refer to `Profiler.command`).
+        :param local: (bool) False if the command came through TCP, in which case it may not write files.
+        :return: the reply: the report of the profiler, or a dictionary {'error': message} if the command failed.
+        """
+        options = message[2] if len(message) > 2 else None
+        if not local and isinstance(options, dict) and options.get('path') is not None:
+            return {'error': 'The profiler only writes files for clients of the UNIX socket.'}
+        try:
+            return self.profiler.command(message[1], options)
+        except (ValueError, TypeError, IOError, KeyError) as e:
+            return {'error': '%s: %s' % (type(e).__name__, e)}
+
     def shutdown(self):
         """
         Shuts down the server.
@@ -103,7 +383,8 @@ class BaseIPCServer(ThreadingMixIn, UnixStreamServer):
         if self.process:
             self.process.terminate()
 
-        os.remove(self.address)
+        if not is_tcp(self.address):
+            os.remove(self.address)
         self.deleted_socket_file = True
 
     def harakiri(self):
@@ -114,7 +395,8 @@ class BaseIPCServer(ThreadingMixIn, UnixStreamServer):
             self.shuttingdown.value = 1
         UnixStreamServer.server_close(self)
 
-        os.remove(self.address)
+        if not is_tcp(self.address):
+            os.remove(self.address)
         self.deleted_socket_file = True
 
         exit(0)
@@ -128,11 +410,55 @@ class BaseIPCServer(ThreadingMixIn, UnixStreamServer):
     def startup(self):
         if self._started:
             return
-        self.process = Process(target=self.serve_forever, args=(self.shuttingdown, 5))
+        self.process = Process(target=self._serve, args=(self.shuttingdown, 5))
         self.process.daemon = True
         self.process.start()
         self._started = True
 
+    def _serve(self, shuttingdown, poll_interval):
+        for server in list(BaseIPCServer._instances):
+            if server is not self:
+                # otherwise connections to a server shut down would wait in its backlog here instead of failing
+                server.socket.close()
+        self.metrics = Metrics()
+        self.prepare()
+        self.serve_forever(shuttingdown, poll_interval)
+        self.finish()
+
+    def prepare(self):
+        """
+        Called in the server process before it starts serving, e.g. to load state. Does nothing by default.
+        Clients connecting meanwhile wait for it to return.
+        """
+        pass
+
+    def finish(self):
+        """
+        Called in the server process once it stopped serving because of `stop`, e.g. to save state. Does nothing by
+        default. It is not called if the process is terminated by `shutdown`.
+        """
+        pass
+
+    def stop(self, timeout):
+        """
+        Asks the server process to stop serving and run `finish`, then waits for it to exit.
+        :param timeout: (float) maximum time in seconds to wait for the process.
+        :return: True if the process exited, False if it is still running.
+        """
+        with self.shuttingdown.get_lock():
+            self.shuttingdown.value = 1
+        # a connection wakes the loop up, which then sees the flag
+        sock = socket.socket(self.address_family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(self.address)
+        except socket.error:
+            pass
+        finally:
+            sock.close()
+        self.process.join(timeout)
+        return not self.process.is_alive()
+
     def serve_forever(self, shuttingdown, poll_interval=5):
         """Handle one request at a time until shutdown.
 
@@ -159,4 +485,59 @@ def _eintr_retry(func, *args):
             return func(*args)
         except (OSError, select.error) as e:
             if e.args[0] != errno.EINTR:
-                raise
\ No newline at end of file
+                raise
+
+
+_subscribers = {}
+_subscribers_lock = threading.Lock()
+
+
+def subscribe(channel, subscriber):
+    """
+    Registers a subscriber to the events published on a channel.
+    :param channel: any hashable object naming the channel.
+    :param subscriber: a function receiving each event. It is called by the publishing thread, so it must not block.
+    """
+    with _subscribers_lock:
+        _subscribers[channel] = _subscribers.get(channel, ()) + (subscriber,)
+
+
+def unsubscribe(channel, subscriber):
+    """
+    Removes a subscriber registered with `subscribe`.
+    """
+    with _subscribers_lock:
+        subscribers = tuple(s for s in _subscribers.get(channel, ()) if s is not subscriber)
+        if subscribers:
+            _subscribers[channel] = subscribers
+        else:
+            _subscribers.pop(channel, None)
+
+
+def has_subscribers(channel):
+    """
+    :return: True if any subscriber is registered to the channel.
+    """
+    return channel in _subscribers
+
+
+def publish(channel, event):
+    """
+    Sends an event to every connection of this server process subscribed to the channel.
+    Clients subscribe with `Subscription`. Publishing to a channel without subscribers costs a dictionary lookup.
+    :param channel: any hashable object naming the channel.
+    :param event: any object.
+    """
+    for subscriber in _subscribers.get(channel, ()):
+        subscriber(event)
+
+
+def _hello(message):
+    """
+    Negotiates the serializer and compression codec of a connection.
+    :param message: a handshake message ('__!hello__', serializer names[, codec names]).
+    :return: a tuple (serializer, codec or None, reply to send to the client).
+    """
+    serializer = negotiate(message[1])
+    codec = negotiate_codec(message[2]) if len(message) > 2 else None
+    return serializer, codec, ('__!hello__', serializer.name, codec.name if codec is not None else None)
@@ -1,5 +1,16 @@
 __author__ = 'salvia'
 
-from shared_cache import SharedCache
-from server import SharedCacheServer
-from memoize import Memoize, NonNoneMemoize, ValidativeMemoize, LocalMemoize, LocalNonNoneMemoize, LocalValidativeMemoize
\ No newline at end of file
+from .shared_cache import SharedCache
+from .sharded_cache import ShardedSharedCache
+from .cluster import ClusterSharedCache
+from .server import SharedCacheServer, EventLoopSharedCacheServer, ShardedSharedCacheServer
+from .ring import HashRing
+from .keys import KeyBuilder
+from .memoize import Memoize, NonNoneMemoize, ValidativeMemoize, LocalMemoize, LocalNonNoneMemoize, LocalValidativeMemoize
+try:
+    from .aio_shared_cache import AsyncSharedCache
+    from .aio_memoize import AsyncMemoize, AsyncNonNoneMemoize, AsyncValidativeMemoize, AsyncLocalMemoize, \
+        AsyncLocalNonNoneMemoize, AsyncLocalValidativeMemoize
+except ImportError:
+    # asyncio is only available on python 3
+    pass
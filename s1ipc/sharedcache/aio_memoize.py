@@ -0,0 +1,297 @@
+from collections import OrderedDict
+import asyncio
+import time
+from s1ipc.aioclient import then
+from .aio_shared_cache import AsyncSharedCache
+from .keys import default_key_builder
+from .memoize import _l_function_cache, _SoftEntry
+
+__author__ = 'salvia'
+
+# (namespace, loop) -> future resolved with the connected AsyncSharedCache of the namespace on that loop
+_async_caches = {}
+
+
+def _async_shared_cache(memo, loop):
+    """
+    Returns a future resolved with the AsyncSharedCache of the memoizer's namespace on the given event loop,
+    connecting it on first use, and again once the connection failed or was lost. The caches of the loops closed
+    meanwhile (e.g. by `asyncio.run`) are dropped then.
+    """
+    key = (memo.namespace, loop)
+    future = _async_caches.get(key)
+    if future is None or future.done() and not _usable(future):
+        for other in [other for other in _async_caches if other[1].is_closed()]:
+            del _async_caches[other]
+        cache = AsyncSharedCache(memo.namespace, max_items=100000, global_expiry=memo.expiry_time,
+                                 address=memo.address, loop=loop)
+        future = _async_caches[key] = cache.connect()
+    return future
+
+
+def _usable(future):
+    return not future.cancelled() and future.exception() is None and future.result().client.connected
+
+
+class AsyncWrapper(object):
+    """
+    Wraps a coroutine function: calling it returns a future resolved with the (possibly cached) result.
+    Concurrent callers of the same key in the process share a single call of the wrapped function, and callers in
+    other processes wait for it through a lease on the key (refer to `AsyncValidativeMemoize`). Stale results are
+    refreshed by a task of the event loop, at most one at a time per key and loop.
+    """
+
+    def __init__(self, memo, func):
+        self.memo = memo
+        self.func = func
+        self.prefix = memo.key_builder.prefix(func)
+        # (loop, key) -> future of the result being looked up or computed
+        self._inflight = {}
+        # (loop, key) of the stale results being refreshed
+        self._refreshing = set()
+
+    def get_stats(self):
+        """
+        :return: a future resolved with the statistics of the namespace.
+        """
+        return then(_async_shared_cache(self.memo, asyncio.get_event_loop()),
+                    lambda cache: cache.client.get_stats(self.memo.namespace))
+
+    def reset_stats(self):
+        """
+        :return: a future resolved once the statistics of the namespace were reset.
+        """
+        return then(_async_shared_cache(self.memo, asyncio.get_event_loop()),
+                    lambda cache: cache.client.reset_stats(self.memo.namespace))
+
+    def remove_local_namespaces(self):
+        _async_caches.clear()
+
+    def disconnect(self):
+        for future in list(_async_caches.values()):
+            if future.done() and _usable(future):
+                future.result().disconnect()
+        _async_caches.clear()
+
+    def __call__(self, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        # [:None] is equivalent to [:]
+        # the key is the same as the one of `Wrapper`, so synchronous and asynchronous callers share the results
+        key = self.memo.key_builder.build(self.prefix, args[:self.memo.num_args], kwargs)
+        inflight = self._inflight.get((loop, key))
+        if inflight is None:
+            deadline = time.time() + self.memo.lease_wait
+            inflight = then(_async_shared_cache(self.memo, loop),
+                            lambda cache: self._lookup(cache, key, args, kwargs, deadline, 0.005))
+            self._inflight[(loop, key)] = inflight
+            inflight.add_done_callback(lambda f: self._inflight.pop((loop, key), None))
+        # a caller cancelling its call does not cancel the call shared with the others
+        return asyncio.shield(inflight)
+
+    def _lookup(self, cache, key, args, kwargs, deadline, delay):
+        if not self.memo.lease_timeout:
+            def found(items):
+                if key in items:
+                    return self._fresh(cache, key, items[key], args, kwargs)
+                return self._compute(cache, key, None, args, kwargs)
+
+            return then(cache.get_many([key]), found)
+
+        def leased(reply):
+            status, value = reply
+            if status == 'hit':
+                return self._fresh(cache, key, value, args, kwargs)
+            if status == 'lease':
+                return self._compute(cache, key, value, args, kwargs)
+            if time.time() >= deadline:
+                return self._compute(cache, key, None, args, kwargs)
+            # another process computes the value: poll for it, without blocking the loop
+            return then(asyncio.ensure_future(asyncio.sleep(delay)),
+                        lambda _: self._lookup(cache, key, args, kwargs, deadline, min(delay * 2, 0.1)))
+
+        return then(cache.get_or_lease(key, self.memo.lease_timeout), leased)
+
+    def _compute(self, cache, key, token, args, kwargs):
+        try:
+            computation = asyncio.ensure_future(self.func(*args, **kwargs))
+        except Exception:
+            if token is not None:
+                cache.release_lease(key, token)
+            raise
+
+        def failed(f):
+            if token is not None and (f.cancelled() or f.exception() is not None):
+                cache.release_lease(key, token)
+
+        def store(result):
+            if not self.memo.validator(result):
+                if token is not None:
+                    cache.release_lease(key, token)
+            elif token is None:
+                cache.set(key, self._entry(result))
+            else:
+                cache.fill_lease(key, token, self._entry(result))
+            return result
+
+        computation.add_done_callback(failed)
+        return then(computation, store)
+
+    def _entry(self, result):
+        """
+        :return: the cached form of a result (refer to `Wrapper._entry`).
+        """
+        if self.memo.soft_ttl is None:
+            return result
+        return _SoftEntry(result, time.time() + self.memo.soft_ttl)
+
+    def _fresh(self, cache, key, entry, args, kwargs):
+        """
+        :return: the result of a cached entry, starting its refresh if it is stale (refer to `Wrapper._fresh`).
+        """
+        if not isinstance(entry, _SoftEntry):
+            return entry
+        loop = asyncio.get_event_loop()
+        if time.time() >= entry.stale_at and (loop, key) not in self._refreshing:
+            self._refreshing.add((loop, key))
+            refresh = self._refresh(cache, key, args, kwargs)
+            refresh.add_done_callback(lambda f: self._refreshed(loop, key, f))
+        return entry.result
+
+    def _refresh(self, cache, key, args, kwargs):
+        """
+        Recomputes a stale result, unless another caller got the lease to do it.
+        :return: a future resolved once the result was refreshed or the lease was denied.
+        """
+        def leased(token):
+            if token is not None:
+                return self._compute(cache, key, token, args, kwargs)
+
+        return then(cache.acquire_lease(key, self.memo.lease_timeout or 60), leased)
+
+    def _refreshed(self, loop, key, future):
+        self._refreshing.discard((loop, key))
+        # failures are ignored: the stale result is served until it is refreshed or expires
+        if not future.cancelled():
+            future.exception()
+
+
+class AsyncValidativeMemoize(object):
+    """
+    Memoization decorator for coroutine functions, storing the results in the SharedCache system like
+    `ValidativeMemoize`, through non-blocking connections: the decorated function returns a future.
+
+        @AsyncMemoize('namespace', 60)
+        async def fetch(key):
+            ...
+
+        value = await fetch(key)
+    """
+
+    def __init__(self, namespace, expiry_time=0, num_args=None, validator=lambda x: True,
+                 address='/tmp/SharedCacheServer.sock', lease_timeout=60, lease_wait=10, key_builder=None,
+                 soft_ttl=None, hard_ttl=None, refresh_ahead=None):
+        """
+        Initializes an AsyncValidativeMemoize.
+        For the other parameters refer to `ValidativeMemoize`, including why leases are not used when `expiry_time`
+        is 0.
+        :param address: The UNIX socket path of the SharedCacheServer. Every event loop has its own connection.
+        """
+        if hard_ttl is not None:
+            expiry_time = hard_ttl
+        if soft_ttl is None and refresh_ahead is not None:
+            soft_ttl = refresh_ahead * expiry_time
+        self.namespace = namespace
+        self.expiry_time = expiry_time
+        self.num_args = num_args
+        self.validator = validator
+        self.address = address
+        self.lease_timeout = lease_timeout if expiry_time else 0
+        self.lease_wait = lease_wait
+        self.soft_ttl = soft_ttl
+        self.key_builder = key_builder or default_key_builder
+
+    def __call__(self, func):
+        return AsyncWrapper(self, func)
+
+
+class AsyncNonNoneMemoize(AsyncValidativeMemoize):
+    """
+    The same as AsyncValidativeMemoize except the functor is fixed to `lambda x: x is not None`.
+    """
+    def __init__(self, namespace, expiry_time=0, num_args=None, address='/tmp/SharedCacheServer.sock',
+                 lease_timeout=60, lease_wait=10, key_builder=None, soft_ttl=None, hard_ttl=None, refresh_ahead=None):
+        super(AsyncNonNoneMemoize, self).__init__(namespace, expiry_time, num_args, lambda x: x is not None, address,
+                                                  lease_timeout, lease_wait, key_builder, soft_ttl, hard_ttl,
+                                                  refresh_ahead)
+
+
+class AsyncMemoize(AsyncValidativeMemoize):
+    """
+    The same as AsyncValidativeMemoize except the functor is fixed to `lambda x: True`.
+    """
+    def __init__(self, namespace, expiry_time=0, num_args=None, address='/tmp/SharedCacheServer.sock',
+                 lease_timeout=60, lease_wait=10, key_builder=None, soft_ttl=None, hard_ttl=None, refresh_ahead=None):
+        super(AsyncMemoize, self).__init__(namespace, expiry_time, num_args, lambda x: True, address, lease_timeout,
+                                           lease_wait, key_builder, soft_ttl, hard_ttl, refresh_ahead)
+
+
+class AsyncLocalValidativeMemoize(object):
+    """
+    Same functionality as LocalValidativeMemoize, for coroutine functions: the decorated function returns a future,
+    and concurrent callers of the same arguments share a single call of the wrapped function.
+    """
+    def __init__(self, namespace, expiry_time=0, num_args=None, validator=lambda x: True):
+        """
+        For parameters refer to `LocalValidativeMemoize`.
+        """
+        if not namespace in _l_function_cache:
+            _l_function_cache[namespace] = {}
+        self.index = namespace
+        self.expiry_time = expiry_time
+        self.num_args = num_args
+        self.validator = validator
+
+    def __call__(self, func):
+        inflight = {}
+
+        def wrapped(*args):
+            loop = asyncio.get_event_loop()
+            mem_args = default_key_builder.encode(args[:self.num_args], {})
+            name = func.__name__
+            if not name in _l_function_cache[self.index]:
+                _l_function_cache[self.index][name] = OrderedDict({})
+            cache = _l_function_cache[self.index][name]
+            if mem_args in cache:
+                result, timestamp = cache[mem_args]
+                if not self.expiry_time or time.time() - timestamp < self.expiry_time:
+                    done = loop.create_future()
+                    done.set_result(result)
+                    return done
+                else:
+                    _l_function_cache[self.index][name] = cache = OrderedDict({})
+            future = inflight.get((loop, mem_args))
+            if future is None:
+                def store(result):
+                    if self.validator(result):
+                        if len(cache) >= 225000:
+                            cache.pop(next(iter(cache)))
+                        cache[mem_args] = (result, time.time())
+                    return result
+
+                future = then(asyncio.ensure_future(func(*args)), store)
+                inflight[(loop, mem_args)] = future
+                future.add_done_callback(lambda f: inflight.pop((loop, mem_args), None))
+            return asyncio.shield(future)
+
+        return wrapped
+
+
+class AsyncLocalNonNoneMemoize(AsyncLocalValidativeMemoize):
+    def __init__(self, namespace, expiry_time=0, num_args=None):
+        super(AsyncLocalNonNoneMemoize, self).__init__(namespace, expiry_time, num_args,
+                                                       validator=lambda x: x is not None)
+
+
+class AsyncLocalMemoize(AsyncLocalValidativeMemoize):
+    def __init__(self, namespace, expiry_time=0, num_args=None):
+        super(AsyncLocalMemoize, self).__init__(namespace, expiry_time, num_args, validator=lambda x: True)
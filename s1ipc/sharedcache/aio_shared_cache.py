@@ -0,0 +1,169 @@
+import pickle
+from s1ipc.aioclient import AsyncIPCClient, then
+from s1ipc.compression import pack_value, unpack_value
+from .eviction import check_policy
+from .shared_table import PICKLE_PROTOCOL
+
+__author__ = 'salvia'
+
+
+class AsyncSharedCache(object):
+    """
+    asyncio counterpart of `SharedCache`. Every operation returns a future instead of blocking,
+    and many operations may be in flight at once on the same connection.
+
+        cache = await AsyncSharedCache('namespace').connect()
+        value = await cache.get(key)
+    """
+
+    def __init__(self, namespace, max_items=100, global_expiry=60 * 5,
+                 autoclean=True, unlimited=False, address='/tmp/SharedCacheServer.sock', loop=None, serializer=None,
+                 compression=None, compress_values=None, compress_threshold=8192, policy=None, max_bytes=None):
+        """
+        Initializes a new AsyncSharedCache object, which is a client for the SharedCacheServer.
+        The connection is only opened by `connect`.
+        For other parameters please refer to the `Namespace` Class.
+        :param address: The UNIX socket path which the server is listening.
+        :param loop: (optional) the event loop to use, defaults to the current event loop.
+        :param serializer: (optional) name of the serializer of calls and replies, or list of names in order of
+        preference (refer to `BaseIPCClient`).
+        :param compression: (optional) name of the codec compressing large calls and replies on the wire, or list of
+        names in order of preference (refer to `BaseIPCClient`).
+        :param compress_values: (optional) name of the codec compressing the values stored at rest in the server
+        (refer to `SharedCache`).
+        :param compress_threshold: (int) minimum serialized size in bytes of the values compressed by `compress_values`.
+        :param policy: (optional) name of the eviction policy of the namespace (refer to `SharedCache`).
+        :param max_bytes: (optional) byte budget of the namespace (refer to `Namespace`), unchanged if None.
+        :raise ValueError: if `policy` is not a known eviction policy.
+        """
+        if policy is not None:
+            check_policy(policy)
+        self.namespace = namespace
+        self.compress_values = compress_values
+        self.compress_threshold = compress_threshold
+        self.client = AsyncIPCClient(address, loop, serializer, compression)
+        self._config = (max_items, global_expiry, autoclean, unlimited, policy, max_bytes)
+
+    def connect(self):
+        """
+        Connects to the SharedCacheServer and configures the namespace.
+        :return: a future resolved with this object once it is ready to use.
+        """
+        def configure(client):
+            return then(client.configure_namespace(self.namespace, *self._config), lambda result: self)
+
+        return then(self.client.connect(), configure)
+
+    def __getitem__(self, item):
+        """
+        Gets an item from the cache.
+        :param item: The key to get.
+        :return: A future resolved with the value for the given key, which raises KeyError if the item does not exist.
+        """
+        def found(val):
+            if val == u'!___null___':
+                raise KeyError(item)
+            return unpack_value(val, pickle.loads)
+
+        return then(self.client.get(self.namespace, item), found)
+
+    def get(self, item):
+        """
+        Gets an item from the cache.
+        :param item: The key to get.
+        :return: A future resolved with the value for the given key, or None if it does not exist.
+        """
+        return then(self.client.get(self.namespace, item),
+                    lambda val: None if val == u'!___null___' else unpack_value(val, pickle.loads))
+
+    def set(self, key, value):
+        """
+        Sets an item into the cache.
+        :param key: The key of the item.
+        :param value: The value of the Item.
+        :return: A future resolved once the server stored the item.
+        """
+        return self.client.put(self.namespace, key, self._pack(value))
+
+    def __setitem__(self, key, value):
+        """
+        Sets an item into the cache, without waiting for the server to store it.
+        """
+        self.set(key, value)
+
+    def get_many(self, keys):
+        """
+        Gets many items from the cache, in a single call to the server.
+        :param keys: iterable of keys to get.
+        :return: A future resolved with a dictionary holding the items found.
+        """
+        def unpack(found):
+            return dict((key, unpack_value(value, pickle.loads)) for key, value in found.items())
+
+        return then(self.client.get_many(self.namespace, list(keys)), unpack)
+
+    def set_many(self, mapping, expiry=(60 * 60 * 24)):
+        """
+        Sets many items into the cache, in a single call to the server.
+        :param mapping: dictionary of key-value pairs.
+        :param expiry: expiry in seconds for these items.
+        :return: A future resolved once the server stored the items.
+        """
+        mapping = dict((key, self._pack(value)) for key, value in dict(mapping).items())
+        return self.client.put_many(self.namespace, mapping, expiry)
+
+    def delete_many(self, keys):
+        """
+        Removes many items from the cache, in a single call to the server.
+        :param keys: iterable of keys to remove.
+        :return: A future resolved with the number of items removed.
+        """
+        return self.client.delete_many(self.namespace, list(keys))
+
+    def get_or_lease(self, key, lease_timeout=60):
+        """
+        Gets an item from the cache or, if it is missing, a lease to compute it (refer to `SharedCache.get_or_lease`).
+        :param key: The key to get.
+        :param lease_timeout: (float) seconds after which an unfilled lease is granted to another caller.
+        :return: A future resolved with a tuple ('hit', value), ('lease', token) or ('wait', None).
+        """
+        def unpack(reply):
+            status, value = reply
+            if status == 'hit':
+                value = unpack_value(value, pickle.loads)
+            return status, value
+
+        return then(self.client.get_or_lease(self.namespace, key, lease_timeout), unpack)
+
+    def acquire_lease(self, key, lease_timeout=60):
+        """
+        Gets a lease on a key whether or not the item exists (refer to `SharedCache.acquire_lease`).
+        :return: A future resolved with the token of the lease, or None if another caller holds it.
+        """
+        return self.client.acquire_lease(self.namespace, key, lease_timeout)
+
+    def fill_lease(self, key, token, value, expiry=(60 * 60 * 24)):
+        """
+        Sets the item computed under a lease.
+        :return: A future resolved with True if the item was set, False if the lease was lost meanwhile.
+        """
+        return self.client.fill_lease(self.namespace, key, token, self._pack(value), expiry)
+
+    def release_lease(self, key, token):
+        """
+        Gives up a lease without setting the item.
+        :return: A future resolved once the server released the lease.
+        """
+        return self.client.release_lease(self.namespace, key, token)
+
+    def _pack(self, value):
+        if self.compress_values is None:
+            return value
+        return pack_value(value, self.compress_values, self.compress_threshold,
+                          lambda v: pickle.dumps(v, PICKLE_PROTOCOL))
+
+    def disconnect(self):
+        """
+        Disconnects from the SharedCacheServer.
+        """
+        self.client.disconnect()
@@ -0,0 +1,261 @@
+import pickle
+import socket
+import time
+from s1ipc.client import IPCCLientException
+from s1ipc.compression import unpack_value
+from s1ipc.pool import ClientPool
+from .ring import HashRing
+from .shared_cache import SharedCache
+from .sharded_cache import merge_stats, _split
+
+__author__ = 'salvia'
+
+# errors meaning a node cannot be reached, as opposed to errors raised by the call itself on the node
+_FAILURES = (socket.error, IPCCLientException)
+
+
+class ClusterSharedCache(object):
+    """
+    Dictionary-like cache spreading a namespace over several SharedCacheServers, usually on different hosts and
+    reached through TCP. Keys (or whole namespaces, refer to `by`) are assigned to the nodes by consistent hashing
+    (refer to `HashRing`), and every node is reached through its own `ClientPool`, so instances are safe to share
+    between threads.
+
+    A node which cannot be reached is considered down for `retry_interval` seconds: meanwhile its keys are misses,
+    and writes and removals of its keys are dropped, the rest of the cluster being served as usual. Keys are not
+    moved to the other nodes, which would serve values missed by writes made while the node was down once it is back.
+    """
+
+    def __init__(self, namespace, addresses, max_items=100, global_expiry=60 * 5, autoclean=True, unlimited=False,
+                 max_bytes=None, by='key', replicas=160, pool_size=8, socket_timeout=1.0, retry_interval=5.0,
+                 serializer=None, compression=None, compress_values=None, compress_threshold=8192, policy=None,
+                 authkey=None):
+        """
+        Initializes a new ClusterSharedCache object. No connection is made until a node is needed.
+        For other parameters please refer to the `Namespace` Class and to `SharedCache.__init__`.
+        :param addresses: list of the addresses of the nodes, (host, port) tuples or UNIX socket paths.
+        :param max_items: (int) maximum number of items of the namespace, split evenly between the nodes if keys are
+        spread over them.
+        :param max_bytes: (optional) byte budget of the namespace, split like `max_items`.
+        :param by: (str) 'key' spreads the keys of the namespace over the nodes, 'namespace' keeps the whole namespace
+        on a single node, so that namespaces, rather than keys, are spread over the cluster.
+        :param replicas: (int) number of points of every node on the hash ring.
+        :param pool_size: (int) maximum number of connections to every node.
+        :param socket_timeout: (float) seconds to wait for connecting to a node and for its replies, after which the
+        node is considered down.
+        :param retry_interval: (float) seconds during which a node is considered down, before it is tried again.
+        :param authkey: (optional) shared secret of the nodes listening on TCP, defaults to the S1IPC_AUTHKEY
+        environment variable (refer to `BaseIPCServer`).
+        """
+        if by not in ('key', 'namespace'):
+            raise ValueError('Unknown distribution: %r' % (by,))
+        self.namespace = namespace
+        self.by = by
+        self.retry_interval = retry_interval
+        self.ring = HashRing(addresses, replicas)
+        parts = len(addresses) if by == 'key' else 1
+        self._config = dict(max_items=_split(max_items, parts), global_expiry=global_expiry, autoclean=autoclean,
+                            unlimited=unlimited, max_bytes=_split(max_bytes, parts), policy=policy,
+                            compress_values=compress_values, compress_threshold=compress_threshold)
+        self.pools = {}
+        for address in addresses:
+            self.pools[address] = ClientPool(address, pool_size, socket_timeout=socket_timeout,
+                                             serializer=serializer, compression=compression, authkey=authkey)
+        # address -> SharedCache of the namespace on the node, created once the node was reached
+        self._caches = {}
+        # address -> time until which the node is considered down
+        self._down = {}
+
+    def node(self, key):
+        """
+        :return: the address of the node holding a key.
+        """
+        return self.ring.node(self.namespace if self.by == 'namespace' else key)
+
+    def _partition(self, keys):
+        if self.by == 'namespace':
+            keys = list(keys)
+            return {self.node(None): keys} if keys else {}
+        return self.ring.partition(keys)
+
+    def _cache(self, address):
+        """
+        :return: the `SharedCache` of a node, configuring the namespace on it if needed, or None if the node is down.
+        """
+        cache = self._caches.get(address)
+        if cache is None:
+            if self._down.get(address, 0) > time.time():
+                return None
+            try:
+                cache = SharedCache(self.namespace, pool=self.pools[address], **self._config)
+            except _FAILURES:
+                self._fail(address)
+                return None
+            self._caches[address] = cache
+        return cache
+
+    def _fail(self, address):
+        """
+        Considers a node down. Its namespace is configured again once it is back, as it may have restarted.
+        """
+        self._down[address] = time.time() + self.retry_interval
+        self._caches.pop(address, None)
+        # the idle connections are as broken as the one which failed
+        self.pools[address]._drop_idle()
+
+    def _attempt(self, address, function, default):
+        """
+        Calls `function` with the `SharedCache` of a node.
+        :return: the result of the call, or `default` if the node is down.
+        """
+        cache = self._cache(address)
+        if cache is None:
+            return default
+        try:
+            return function(cache)
+        except _FAILURES:
+            self._fail(address)
+            return default
+
+    def _fan_out(self, calls, default):
+        """
+        Calls several nodes in parallel, through one pipeline each.
+        :param calls: list of tuples (address, function, args).
+        :return: The list of the results, in the order of the calls, `default` standing for the calls of nodes down.
+        """
+        results = [default] * len(calls)
+        pending = []
+        for i, (address, function, args) in enumerate(calls):
+            if self._cache(address) is None:
+                continue
+            pool = self.pools[address]
+            try:
+                client = pool.acquire()
+            except _FAILURES:
+                self._fail(address)
+                continue
+            pipeline = client.pipeline()
+            getattr(pipeline, function)(*args)
+            try:
+                pipeline.send()
+            except _FAILURES:
+                pool.release(client, broken=True)
+                self._fail(address)
+                continue
+            pending.append((i, address, client, pipeline))
+
+        error = None
+        # every reply is read before raising, so that no connection is given back with a reply pending
+        for i, address, client, pipeline in pending:
+            try:
+                results[i] = pipeline.receive()[0]
+            except _FAILURES:
+                self.pools[address].release(client, broken=True)
+                self._fail(address)
+            except Exception as e:
+                self.pools[address].release(client, broken=True)
+                error = error or e
+            else:
+                self.pools[address].release(client)
+        if error is not None:
+            raise error
+        return results
+
+    def __getitem__(self, item):
+        found, value = self._attempt(self.node(item), lambda cache: (True, cache[item]), (False, None))
+        if not found:
+            raise KeyError(item)
+        return value
+
+    def get(self, item):
+        try:
+            return self[item]
+        except KeyError:
+            return None
+
+    def __setitem__(self, key, value):
+        def put(cache):
+            cache[key] = value
+
+        self._attempt(self.node(key), put, None)
+
+    def get_or_lease(self, key, lease_timeout=60):
+        """
+        Refer to `SharedCache.get_or_lease`. If the node of the key is down, the caller gets a lease whose token is
+        None, so that it computes the value instead of waiting for it.
+        """
+        return self._attempt(self.node(key), lambda cache: cache.get_or_lease(key, lease_timeout), ('lease', None))
+
+    def acquire_lease(self, key, lease_timeout=60):
+        return self._attempt(self.node(key), lambda cache: cache.acquire_lease(key, lease_timeout), None)
+
+    def fill_lease(self, key, token, value, expiry=(60 * 60 * 24)):
+        return self._attempt(self.node(key), lambda cache: cache.fill_lease(key, token, value, expiry), False)
+
+    def release_lease(self, key, token):
+        self._attempt(self.node(key), lambda cache: cache.release_lease(key, token), None)
+
+    def get_many(self, keys):
+        """
+        Gets many items from the cache, calling the nodes in parallel.
+        :param keys: iterable of keys to get.
+        :return: A dictionary holding the items found; keys not found, or held by nodes down, are left out.
+        """
+        groups = self._partition(keys)
+        calls = [(address, 'get_many', (self.namespace, group)) for address, group in groups.items()]
+        found = {}
+        for (address, function, args), result in zip(calls, self._fan_out(calls, None)):
+            if result is not None:
+                for key, value in result.items():
+                    found[key] = unpack_value(value, pickle.loads)
+        return found
+
+    def set_many(self, mapping, expiry=(60 * 60 * 24)):
+        """
+        Sets many items into the cache, calling the nodes in parallel. Items of nodes down are dropped.
+        :param mapping: dictionary of key-value pairs.
+        :param expiry: expiry in seconds for these items.
+        """
+        mapping = dict(mapping)
+        calls = []
+        for address, group in self._partition(mapping).items():
+            cache = self._cache(address)
+            if cache is not None:
+                calls.append((address, 'put_many',
+                              (self.namespace, dict((key, cache._pack(mapping[key])) for key in group), expiry)))
+        self._fan_out(calls, None)
+
+    def delete_many(self, keys):
+        """
+        Removes many items from the cache, calling the nodes in parallel.
+        :param keys: iterable of keys to remove.
+        :return: The number of items removed, not counting those of nodes down.
+        """
+        return sum(self._fan_out([(address, 'delete_many', (self.namespace, group))
+                                  for address, group in self._partition(keys).items()], 0))
+
+    def invalidate(self):
+        """
+        Invalidates the namespace on every node up.
+        """
+        self._fan_out([(address, 'invalidate', (self.namespace,)) for address in self._nodes()], None)
+
+    def get_stats(self):
+        """
+        Retrieves the statistics of the namespace, summed over the nodes up (refer to `Namespace.get_stats`).
+        """
+        return merge_stats(self._fan_out([(address, 'get_stats', (self.namespace,)) for address in self._nodes()],
+                                         u'!___null___'))
+
+    def _nodes(self):
+        if self.by == 'namespace':
+            return [self.node(None)]
+        return list(self.pools)
+
+    def disconnect(self):
+        """
+        Disconnects from every node.
+        """
+        self._caches.clear()
+        for pool in self.pools.values():
+            pool.close()
@@ -0,0 +1,270 @@
+from collections import OrderedDict
+
+__author__ = 'salvia'
+
+# halves a counter of `FrequencySketch`, through bytearray.translate
+_HALVE = bytes(bytearray(count >> 1 for count in range(256)))
+
+
+class EvictionPolicy(object):
+    """
+    Chooses which items a full `Namespace` evicts.
+    The namespace tells the policy about every key it inserts (`insert`), every hit (`access`) and every key removed
+    for another reason (`remove`, `clear`), and asks it for a key to evict (`evict`) while it holds more than
+    `max_items` items. All the methods are called with the namespace lock held, and run in (amortized) O(1).
+    """
+
+    name = None
+
+    def insert(self, key, max_items):
+        """
+        Records a key newly inserted in the namespace.
+        :param max_items: (int) the current capacity of the namespace.
+        """
+        raise NotImplementedError
+
+    def access(self, key):
+        """
+        Records a hit on a key. Keys the policy does not know (e.g. removed concurrently) are ignored.
+        """
+        pass
+
+    def remove(self, key):
+        """
+        Forgets a key removed from the namespace by expiry or deletion.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Forgets all the keys.
+        """
+        raise NotImplementedError
+
+    def evict(self):
+        """
+        Chooses a key to evict, and forgets it.
+        :return: the key the namespace must remove.
+        """
+        raise NotImplementedError
+
+
+class FifoPolicy(EvictionPolicy):
+    """
+    Evicts the oldest inserted key, whatever its hits.
+    """
+
+    name = 'fifo'
+
+    def __init__(self):
+        self.order = OrderedDict()
+
+    def insert(self, key, max_items):
+        self.order[key] = None
+
+    def remove(self, key):
+        self.order.pop(key, None)
+
+    def clear(self):
+        self.order = OrderedDict()
+
+    def evict(self):
+        return self.order.popitem(last=False)[0]
+
+
+class LruPolicy(FifoPolicy):
+    """
+    Evicts the least recently used key: a hit moves the key to the end of the order.
+    """
+
+    name = 'lru'
+
+    def access(self, key):
+        _move_to_end(self.order, key)
+
+
+class LfuPolicy(EvictionPolicy):
+    """
+    Evicts the least frequently used key, the least recently used one among those of equal frequency.
+    Keys are kept in one insertion-ordered bucket per use count, so that every operation is O(1).
+    """
+
+    name = 'lfu'
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.counts = {}
+        self.buckets = {}
+        self.min_count = 0
+
+    def insert(self, key, max_items):
+        self.counts[key] = 1
+        self.buckets.setdefault(1, OrderedDict())[key] = None
+        self.min_count = 1
+
+    def access(self, key):
+        count = self.counts.get(key)
+        if count is None:
+            return
+        self._unlink(key, count)
+        if self.min_count == count and count not in self.buckets:
+            self.min_count = count + 1
+        self.counts[key] = count + 1
+        self.buckets.setdefault(count + 1, OrderedDict())[key] = None
+
+    def remove(self, key):
+        count = self.counts.pop(key, None)
+        if count is not None:
+            self._unlink(key, count)
+
+    def evict(self):
+        if self.min_count not in self.buckets:
+            # the least used keys were removed: only then the minimum is searched
+            self.min_count = min(self.buckets)
+        key = next(iter(self.buckets[self.min_count]))
+        self.remove(key)
+        return key
+
+    def _unlink(self, key, count):
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+
+
+class TinyLfuPolicy(EvictionPolicy):
+    """
+    W-TinyLFU: new keys enter a small LRU window (`window_ratio` of the capacity). Keys leaving the window are
+    candidates to the main LRU region, and when the namespace is full a candidate is only admitted if it was
+    used more often than the key the main region would evict; otherwise the candidate itself is evicted, making
+    room in the window.
+    Use frequencies are estimated by a `FrequencySketch`, which also counts keys that are not (or no longer)
+    cached, so that one-hit keys streaming through the namespace cannot push out the popular ones.
+    """
+
+    name = 'tinylfu'
+    window_ratio = 0.01
+
+    def __init__(self):
+        self.sketch = None
+        self.window_size = 1
+        self.clear()
+
+    def clear(self):
+        self.window = OrderedDict()
+        self.main = OrderedDict()
+
+    def insert(self, key, max_items):
+        if self.sketch is None or self.sketch.width < 4 * max_items:
+            self.sketch = FrequencySketch(max(4 * max_items, 16))
+        self.window_size = max(1, int(max_items * self.window_ratio))
+        self.sketch.increment(key)
+        self.window[key] = None
+        if len(self.window) > self.window_size:
+            # the namespace is not full: the key leaving the window is admitted without contest
+            key = self.window.popitem(last=False)[0]
+            self.main[key] = None
+
+    def access(self, key):
+        if self.sketch is not None:
+            self.sketch.increment(key)
+        if key in self.window:
+            _move_to_end(self.window, key)
+        elif key in self.main:
+            _move_to_end(self.main, key)
+
+    def remove(self, key):
+        self.window.pop(key, None)
+        self.main.pop(key, None)
+
+    def evict(self):
+        if len(self.window) < self.window_size and self.main or not self.window:
+            return self.main.popitem(last=False)[0]
+        candidate = self.window.popitem(last=False)[0]
+        if not self.main:
+            return candidate
+        victim = next(iter(self.main))
+        if self.sketch.frequency(candidate) <= self.sketch.frequency(victim):
+            return candidate
+        del self.main[victim]
+        self.main[candidate] = None
+        return victim
+
+
+class FrequencySketch(object):
+    """
+    Count-min sketch of 4 rows of saturating counters (up to 15, one byte each), estimating how often keys were seen.
+    Counters are halved every `10 * width` increments, so that the estimate favours recent popularity. Halving runs
+    in C (a byte translation of each row), as it happens with the namespace lock held.
+    """
+
+    _SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+    _MASK = 0xFFFFFFFFFFFFFFFF
+
+    def __init__(self, width):
+        """
+        :param width: (int) minimum number of counters per row, rounded up to a power of 2.
+        """
+        self.bits = max(4, (width - 1).bit_length())
+        self.width = 1 << self.bits
+        self.rows = [bytearray(self.width) for seed in self._SEEDS]
+        self.additions = 0
+        self.sample_size = 10 * self.width
+
+    def _indexes(self, key):
+        h = hash(key) & self._MASK
+        shift = 64 - self.bits
+        return [((h * seed) & self._MASK) >> shift for seed in self._SEEDS]
+
+    def frequency(self, key):
+        return min(row[i] for row, i in zip(self.rows, self._indexes(key)))
+
+    def increment(self, key):
+        added = False
+        for row, i in zip(self.rows, self._indexes(key)):
+            if row[i] < 15:
+                row[i] += 1
+                added = True
+        if added:
+            self.additions += 1
+            if self.additions >= self.sample_size:
+                self._age()
+
+    def _age(self):
+        self.rows = [row.translate(_HALVE) for row in self.rows]
+        self.additions //= 2
+
+
+def _move_to_end(order, key):
+    if key not in order:
+        return
+    if hasattr(order, 'move_to_end'):
+        order.move_to_end(key)
+    else:
+        # python 2 OrderedDicts lack move_to_end, but popping and setting a key is O(1) too
+        order[key] = order.pop(key)
+
+
+POLICIES = dict((policy.name, policy) for policy in (FifoPolicy, LruPolicy, LfuPolicy, TinyLfuPolicy))
+
+
+def check_policy(name):
+    """
+    Validates a policy name before it is sent to the server, whose handler would otherwise fail on it.
+    :param name: (str) name of a policy of `POLICIES`: 'fifo', 'lru', 'lfu' or 'tinylfu'.
+    :raise ValueError: if there is no such policy.
+    """
+    if name not in POLICIES:
+        raise ValueError('Unknown eviction policy: %r' % (name,))
+
+
+def make_policy(name):
+    """
+    :param name: (str) name of a policy (refer to `check_policy`).
+    :return: a new `EvictionPolicy` instance.
+    :raise ValueError: if there is no such policy.
+    """
+    check_policy(name)
+    return POLICIES[name]()
@@ -0,0 +1,83 @@
+"""
+Cache keys of the calls of memoized functions (refer to `ValidativeMemoize`).
+
+A key is the prefix of the function (its name), computed once per decorated function, followed by its arguments,
+pickled in a single call of the C pickler: the tuple of positional arguments as it is, along with the keyword
+arguments in the order of their names, if any, so that a call gives the same key in every process whatever the order
+they were passed in. Arguments made of None, booleans, numbers, strings, bytes and tuples of them give the same key
+in every process of a python version; dictionaries and sets may not, as their order depends on their history.
+With a digest, the key is instead a 16 bytes hash of the prefix and arguments: keys are small and fixed-width, at the
+cost of the (negligible) risk of two calls sharing a key.
+"""
+import hashlib
+import pickle
+
+__author__ = 'salvia'
+
+DIGESTS = ('blake2b', 'md5')
+
+# the same protocol for every python 3 version (python 2 only has up to 2)
+KEY_PROTOCOL = min(3, pickle.HIGHEST_PROTOCOL)
+
+
+def _hash_factory(digest):
+    if digest not in DIGESTS:
+        raise ValueError('Unknown key digest: %r' % (digest,))
+    if digest == 'blake2b' and hasattr(hashlib, 'blake2b'):
+        return lambda: hashlib.blake2b(digest_size=16)
+    # python 2 has no blake2b: md5 is as wide, and fast enough for keys
+    return hashlib.md5
+
+
+class KeyBuilder(object):
+    """
+    Derives the cache keys of the calls of a memoized function. Subclasses may override `encode`, e.g. to identify
+    objects of the application by their id rather than by their pickle.
+    Keys built with a digest are only consistent between processes using the same digest, which is md5 on python 2.
+    """
+
+    def __init__(self, digest=None):
+        """
+        :param digest: (optional) name of the hash of fixed-width keys, 'blake2b' (128 bits) or 'md5'; None keeps
+        the encoded arguments as keys.
+        """
+        self.digest = digest
+        self._hash = None if digest is None else _hash_factory(digest)
+
+    def prefix(self, func):
+        """
+        :return: the prefix of the keys of a function, computed once by the memoizer: the name of the function, or a
+        hash already fed with it if keys are digested.
+        """
+        name = func.__name__
+        prefix = (name if isinstance(name, bytes) else name.encode('utf-8')) + b'\0'
+        if self._hash is None:
+            return prefix
+        h = self._hash()
+        h.update(prefix)
+        return h
+
+    def encode(self, args, kwargs):
+        """
+        :param args: tuple of the positional arguments.
+        :param kwargs: dictionary of the keyword arguments.
+        :return: bytes identifying the arguments.
+        """
+        if not kwargs:
+            return b'a' + pickle.dumps(args, KEY_PROTOCOL)
+        return b'k' + pickle.dumps((args, sorted(kwargs.items())), KEY_PROTOCOL)
+
+    def build(self, prefix, args, kwargs):
+        """
+        :param prefix: the prefix of the function (refer to `prefix`).
+        :return: the key of a call, as bytes.
+        """
+        data = self.encode(args, kwargs)
+        if self._hash is None:
+            return prefix + data
+        h = prefix.copy()
+        h.update(data)
+        return h.digest()
+
+
+default_key_builder = KeyBuilder()
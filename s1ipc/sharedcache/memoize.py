@@ -1,59 +1,226 @@
-from collections import OrderedDict
-from shared_cache import SharedCache
-from time import time
-import pickle
+from collections import OrderedDict, namedtuple
+from .keys import default_key_builder
+from .shared_cache import SharedCache
+from s1ipc import ClientPool
+from time import time, sleep
+import os
+import threading
+try:
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full
 
 __author__ = 'matheus2740'
 
 _function_cache = {}
+_function_cache_lock = threading.Lock()
+_default_pool = None
+
+# cached form of the results memoized with a soft TTL. It is told apart from results which are tuples, so that every
+# memoizer of the namespace (synchronous or asynchronous, with or without a soft TTL) returns the result itself.
+_SoftEntry = namedtuple('_SoftEntry', 'result stale_at')
+
+
+def _shared_cache(memo):
+    """
+    Returns the SharedCache of the memoizer's namespace, creating it on first use.
+    SharedCaches are shared by all threads, and use `memo.pool`, or a pool common to all
+    memoizers, to connect to the SharedCacheServer.
+    """
+    global _default_pool
+    cache = _function_cache.get(memo.namespace)
+    if cache is None:
+        with _function_cache_lock:
+            cache = _function_cache.get(memo.namespace)
+            if cache is None:
+                pool = memo.pool
+                if pool is None:
+                    if _default_pool is None:
+                        _default_pool = ClientPool('/tmp/SharedCacheServer.sock')
+                    pool = _default_pool
+                cache = SharedCache(memo.namespace, max_items=100000, global_expiry=memo.expiry_time, pool=pool)
+                _function_cache[memo.namespace] = cache
+    return cache
+
 
 class Wrapper(object):
 
     def __init__(self, memo, func):
         self.memo = memo
         self.func = func
+        self.prefix = memo.key_builder.prefix(func)
 
     def get_stats(self):
-        if not self.memo.namespace in _function_cache:
-            _function_cache[self.memo.namespace] = SharedCache(self.memo.namespace, max_items=100000, global_expiry=self.memo.expiry_time)
-        return _function_cache[self.memo.namespace].client.get_stats(self.memo.namespace)
+        return _shared_cache(self.memo).client.get_stats(self.memo.namespace)
 
     def reset_stats(self):
-        if not self.memo.namespace in _function_cache:
-            _function_cache[self.memo.namespace] = SharedCache(self.memo.namespace, max_items=100000, global_expiry=self.memo.expiry_time)
-        return _function_cache[self.memo.namespace].client.reset_stats(self.memo.namespace)
+        return _shared_cache(self.memo).client.reset_stats(self.memo.namespace)
 
     def remove_local_namespaces(self):
         global _function_cache
-        _function_cache = {}
+        with _function_cache_lock:
+            _function_cache = {}
 
     def disconnect(self):
-        for k, v in _function_cache.iteritems():
+        for k, v in list(_function_cache.items()):
             v.disconnect()
+        if self.memo.pool is not None:
+            self.memo.pool.close()
+        if _default_pool is not None:
+            _default_pool.close()
 
     def __call__(self, *args, **kwargs):
-        if not self.memo.namespace in _function_cache:
-                _function_cache[self.memo.namespace] = SharedCache(self.memo.namespace, max_items=100000, global_expiry=self.memo.expiry_time)
+        cache = _shared_cache(self.memo)
         # The *args list will act as the cache key (at least the first part of it)
         # [:None] is equivalent to [:]
-        mem_args = list(args[:self.memo.num_args]) + kwargs.items()
-        # Get the name of the decorated function
-        name = self.func.__name__
-        key = pickle.dumps([name] + mem_args)
+        key = self.memo.key_builder.build(self.prefix, args[:self.memo.num_args], kwargs)
+        if self.memo.lease_timeout:
+            return self._single_flight(cache, key, args, kwargs)
         # Check the cache
         try:
-            result = _function_cache[self.memo.namespace][key]
-            return result
+            result = cache[key]
+            return self._fresh(cache, key, result, args, kwargs)
         except KeyError:
             pass
             # Get a new result
         result = self.func(*args, **kwargs)
         # Cache it
         if self.memo.validator(result):
-            _function_cache[self.memo.namespace][key] = result
+            cache[key] = self._entry(result)
         # and return it.
         return result
 
+    def _single_flight(self, cache, key, args, kwargs):
+        """
+        Calls the wrapped function on a miss only if this caller got the lease on the key; otherwise waits for the
+        holder of the lease to store the value, polling the server, for at most `memo.lease_wait` seconds, after
+        which the function is called anyway.
+        """
+        deadline = time() + self.memo.lease_wait
+        delay = 0.005
+        while True:
+            status, value = cache.get_or_lease(key, self.memo.lease_timeout)
+            if status == 'hit':
+                return self._fresh(cache, key, value, args, kwargs)
+            if status == 'lease':
+                token = value
+                break
+            if time() >= deadline:
+                token = None
+                break
+            sleep(delay)
+            delay = min(delay * 2, 0.1)
+        try:
+            result = self.func(*args, **kwargs)
+        except BaseException:
+            if token is not None:
+                cache.release_lease(key, token)
+            raise
+        if not self.memo.validator(result):
+            if token is not None:
+                cache.release_lease(key, token)
+        elif token is None:
+            cache[key] = self._entry(result)
+        else:
+            cache.fill_lease(key, token, self._entry(result))
+        return result
+
+    def _entry(self, result):
+        """
+        :return: the cached form of a result: with a soft TTL, a `_SoftEntry` of the result and the time it becomes
+        stale.
+        """
+        if self.memo.soft_ttl is None:
+            return result
+        return _SoftEntry(result, time() + self.memo.soft_ttl)
+
+    def _fresh(self, cache, key, entry, args, kwargs):
+        """
+        :return: the result of a cached entry, scheduling its refresh in the background if it is stale. Entries stored
+        with a soft TTL are recognized whatever the soft TTL of this memoizer.
+        """
+        if not isinstance(entry, _SoftEntry):
+            return entry
+        if time() >= entry.stale_at:
+            _refresher.submit((self.memo.namespace, key), lambda: self._refresh(cache, key, args, kwargs))
+        return entry.result
+
+    def _refresh(self, cache, key, args, kwargs):
+        """
+        Recomputes a stale result, unless another process got the lease to do it.
+        Failures are ignored: the stale result is served until it is refreshed or expires.
+        """
+        token = cache.acquire_lease(key, self.memo.lease_timeout or 60)
+        if token is None:
+            return
+        try:
+            result = self.func(*args, **kwargs)
+        except Exception:
+            cache.release_lease(key, token)
+            return
+        if self.memo.validator(result):
+            cache.fill_lease(key, token, self._entry(result))
+        else:
+            cache.release_lease(key, token)
+
+
+class _Refresher(object):
+    """
+    Daemon threads refreshing stale memoized results, off the path of the callers.
+    A key is queued at most once at a time per process, and the server lease taken by the refresh lets a single
+    process recompute it.
+    """
+
+    threads = 2
+    max_pending = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._pending = set()
+
+    def _start(self):
+        # the threads of the parent process do not survive a fork: every process starts its own
+        self._pid = os.getpid()
+        self._queue = Queue(self.max_pending)
+        self._pending = set()
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._run, args=(self._queue, self._pending), name='MemoizeRefresher')
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, key, task):
+        """
+        Queues a refresh, unless one is already queued or running for the key, or the queue is full.
+        :param key: hashable identifying the refreshed result.
+        :param task: callable doing the refresh.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            if key in self._pending:
+                return
+            try:
+                self._queue.put_nowait((key, task))
+            except Full:
+                return
+            self._pending.add(key)
+
+    def _run(self, queue, pending):
+        while True:
+            key, task = queue.get()
+            try:
+                task()
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    pending.discard(key)
+
+
+_refresher = _Refresher()
+
 
 class ValidativeMemoize(object):
     """
@@ -62,7 +229,8 @@ class ValidativeMemoize(object):
     if specific values should or not be cached.
     """
 
-    def __init__(self, namespace, expiry_time=0, num_args=None, validator=lambda x: True):
+    def __init__(self, namespace, expiry_time=0, num_args=None, validator=lambda x: True, pool=None, lease_timeout=60,
+                 lease_wait=10, soft_ttl=None, hard_ttl=None, refresh_ahead=None, key_builder=None):
         """
         Initializes a ValidativeMemoize.
         :param namespace: Name of the namespace to use in the SharedCacheServer.
@@ -70,11 +238,38 @@ class ValidativeMemoize(object):
         :param num_args: Number of relevant arguments to use as cache kay. None means all of arguments are relevant.
         :param validator: functor of the form f(object):bool. Any value returned by the wrapped function will be submited
         to this functor. If it returns True, the value is cached.
+        :param pool: (optional) `ClientPool` used to reach the SharedCacheServer. By default, all memoizers of the
+        process share one pool connected to the default SharedCacheServer address.
+        :param lease_timeout: (float) On a miss, only the caller which got a lease on the key from the server calls the
+        wrapped function, while the other callers (of any process) wait for its result. If the result is not stored
+        within `lease_timeout` seconds (e.g. the process died), the lease is granted to another caller. 0 disables
+        this, letting every caller missing a key call the function. Leases are not used when `expiry_time` is 0, as
+        results then expire as soon as they are stored: the callers could only wait for each other.
+        :param lease_wait: (float) maximum time in seconds a caller waits for the holder of a lease, after which it
+        calls the wrapped function itself.
+        :param soft_ttl: (float) age in seconds after which a result is stale: it is still returned, but one
+        process recomputes it in the background (stale-while-revalidate). None disables this.
+        :param hard_ttl: (float) age in seconds after which a result is no longer returned; overrides `expiry_time`.
+        :param refresh_ahead: (float) fraction of the expiry time after which results are refreshed in the
+        background, if `soft_ttl` is not given: results read shortly before they expire (the popular ones) are
+        recomputed in time, so their callers never wait.
+        :param key_builder: (optional) `KeyBuilder` deriving the cache keys from the name of the wrapped function and
+        its arguments, e.g. `KeyBuilder('blake2b')` for fixed-width keys. Memoizers sharing a namespace must use the
+        same kind of keys.
         """
+        if hard_ttl is not None:
+            expiry_time = hard_ttl
+        if soft_ttl is None and refresh_ahead is not None:
+            soft_ttl = refresh_ahead * expiry_time
         self.namespace = namespace
         self.expiry_time = expiry_time
         self.num_args = num_args
         self.validator = validator
+        self.pool = pool
+        self.lease_timeout = lease_timeout if expiry_time else 0
+        self.lease_wait = lease_wait
+        self.soft_ttl = soft_ttl
+        self.key_builder = key_builder or default_key_builder
 
     def __call__(self, func):
         return Wrapper(self, func)
@@ -85,8 +280,12 @@ class NonNoneMemoize(ValidativeMemoize):
     The same as ValidativeMemoize except the functor is fixed to `lambda x: x is not None`,
     id est, only cache non-None values.
     """
-    def __init__(self, namespace, expiry_time=0, num_args=None):
-        super(NonNoneMemoize, self).__init__(namespace, expiry_time, num_args, validator=lambda x: x is not None)
+    def __init__(self, namespace, expiry_time=0, num_args=None, pool=None, lease_timeout=60, lease_wait=10,
+                 soft_ttl=None, hard_ttl=None, refresh_ahead=None, key_builder=None):
+        super(NonNoneMemoize, self).__init__(namespace, expiry_time, num_args, validator=lambda x: x is not None,
+                                             pool=pool, lease_timeout=lease_timeout, lease_wait=lease_wait,
+                                             soft_ttl=soft_ttl, hard_ttl=hard_ttl, refresh_ahead=refresh_ahead,
+                                             key_builder=key_builder)
 
 
 # Indexed memoization
@@ -95,8 +294,11 @@ class Memoize(ValidativeMemoize):
     The same as ValidativeMemoize except the functor is fixed to `lambda x: True`,
     id est, cache all values.
     """
-    def __init__(self, namespace, expiry_time=0, num_args=None):
-        super(Memoize, self).__init__(namespace, expiry_time, num_args, validator=lambda x: True)
+    def __init__(self, namespace, expiry_time=0, num_args=None, pool=None, lease_timeout=60, lease_wait=10,
+                 soft_ttl=None, hard_ttl=None, refresh_ahead=None, key_builder=None):
+        super(Memoize, self).__init__(namespace, expiry_time, num_args, validator=lambda x: True, pool=pool,
+                                      lease_timeout=lease_timeout, lease_wait=lease_wait, soft_ttl=soft_ttl,
+                                      hard_ttl=hard_ttl, refresh_ahead=refresh_ahead, key_builder=key_builder)
 
 
 _l_function_cache = {}
@@ -127,7 +329,7 @@ class LocalValidativeMemoize(object):
         def wrapped(*args):
             # The *args list will act as the cache key (at least the first part of it)
             # [:None] is equivalent to [:]
-            mem_args = pickle.dumps(args[:self.num_args])
+            mem_args = default_key_builder.encode(args[:self.num_args], {})
             # Get the name of the decorated function
             name = func.__name__
             # check if the function is already indexed
@@ -0,0 +1,118 @@
+from collections import OrderedDict
+import socket
+import threading
+import time
+from s1ipc.client import IPCCLientException, Subscription
+from s1ipc.transport import AuthenticationError
+
+__author__ = 'salvia'
+
+
+class NearCache(object):
+    """
+    Bounded in-process copy (LRU, with a TTL) of the values a `SharedCache` read from its namespace.
+    It subscribes to the namespace channel of the server, and drops the keys the server reports as overwritten or
+    removed, or everything when the namespace is invalidated. Events travel asynchronously, so a copy may be served
+    shortly after the server changed it, but never after `ttl` seconds, even if events were lost.
+
+    While the subscription is down no value is kept, and it is attempted again at most every `ttl` seconds.
+    Values are shared with the callers, which must not mutate them.
+    """
+
+    def __init__(self, address, channel, max_items=1000, ttl=1.0, authkey=None):
+        """
+        :param address: The UNIX socket path of the server, or its (host, port) TCP address.
+        :param channel: the channel of the namespace (refer to `Namespace.channel`).
+        :param max_items: (int) maximum number of values kept.
+        :param ttl: (float) maximum time in seconds a value is kept.
+        :param authkey: (bytes) shared secret of a TCP server, defaults to the S1IPC_AUTHKEY environment variable.
+        """
+        self.address = address
+        self.authkey = authkey
+        self.channel = channel
+        self.max_items = max_items
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.hits = 0
+        self._lock = threading.Lock()
+        # incremented by every event, so values read from the server before an event are not kept after it
+        self._generation = 0
+        self._subscription = None
+        self._last_attempt = 0
+        self._closed = False
+        self._subscribe()
+
+    def _subscribe(self):
+        self._last_attempt = time.time()
+        try:
+            subscription = Subscription(self.address, self.channel, self._event, authkey=self.authkey)
+        except (socket.error, IPCCLientException, AuthenticationError):
+            return
+        with self._lock:
+            if self._closed:
+                subscription.close()
+            else:
+                self._subscription = subscription
+
+    def _event(self, event):
+        with self._lock:
+            self._generation += 1
+            if event is None:
+                self._subscription = None
+                self.items = OrderedDict()
+            elif event[0] == 'clear':
+                self.items = OrderedDict()
+            else:
+                for key in event[1]:
+                    self.items.pop(key, None)
+
+    def get(self, key):
+        """
+        :return: a tuple (found, value).
+        """
+        now = time.time()
+        with self._lock:
+            entry = self.items.pop(key, None)
+            if entry is not None and entry[1] > now:
+                # popped and set again: moved to the end of the LRU order
+                self.items[key] = entry
+                self.hits += 1
+                return True, entry[0]
+        if self._subscription is None and not self._closed and now - self._last_attempt >= self.ttl:
+            self._subscribe()
+        return False, None
+
+    def token(self):
+        """
+        :return: a token to take before reading values from the server, and to give back to `put` with them.
+        """
+        return self._generation
+
+    def put(self, key, value, token):
+        """
+        Keeps a value read from the server, unless an event arrived since `token` was taken.
+        """
+        with self._lock:
+            if token != self._generation or self._subscription is None:
+                return
+            self.items.pop(key, None)
+            self.items[key] = (value, time.time() + self.ttl)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+
+    def discard(self, keys):
+        """
+        Drops the given keys, e.g. before this process writes them.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self.items.pop(key, None)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            subscription, self._subscription = self._subscription, None
+            self.items = OrderedDict()
+        if subscription is not None:
+            subscription.close()
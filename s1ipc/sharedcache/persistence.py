@@ -0,0 +1,143 @@
+"""
+On-disk format of the snapshots and logs of a `SharedCacheServer`.
+
+Both are sequences of length-prefixed pickled records (a 4 bytes big-endian length, then the pickle):
+ - a snapshot starts with a header (MAGIC, VERSION, generation, time), followed for every namespace by a record
+   ('namespace', name, config, stats) and records ('items', name, [(key, value, insertion, expiry), ...]).
+ - a log holds the writes made since the snapshot of its generation: ('put', name, items), ('del', name, keys),
+   ('clear', name) and ('config', name, config).
+A snapshot of generation N holds every write logged before the log of generation N was opened, so restoring
+means loading the snapshot, then replaying the logs of generation N and above in order.
+"""
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from .shared_table import PICKLE_PROTOCOL
+
+__author__ = 'salvia'
+
+MAGIC = 's1ipc-snapshot'
+VERSION = 1
+_LENGTH = struct.Struct('!I')
+
+
+def dump_record(record):
+    data = pickle.dumps(record, PICKLE_PROTOCOL)
+    return _LENGTH.pack(len(data)) + data
+
+
+def read_records(path):
+    """
+    Streams the records of a snapshot or log, mapping the file in memory instead of reading it whole.
+    A truncated or corrupt record (e.g. the server was killed while writing it) ends the stream.
+    :param path: path of the file; a missing file holds no records.
+    """
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offset = 0
+            while offset + _LENGTH.size <= size:
+                length, = _LENGTH.unpack_from(mm, offset)
+                end = offset + _LENGTH.size + length
+                if end > size:
+                    break
+                try:
+                    record = pickle.loads(mm[offset + _LENGTH.size:end])
+                except Exception:
+                    break
+                yield record
+                offset = end
+        finally:
+            mm.close()
+
+
+def write_snapshot(path, generation, namespaces, chunk=1000):
+    """
+    Writes a snapshot to a temporary file, then moves it over `path`, so that a snapshot is either complete or absent.
+    :param generation: (int) generation of the snapshot (refer to the format above).
+    :param namespaces: iterable of tuples (name, config, stats, items), items being a list of tuples
+    (key, value, insertion, expiry).
+    :param chunk: (int) number of items per record.
+    :return: the number of items written.
+    """
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    count = 0
+    with open(tmp, 'wb') as f:
+        f.write(dump_record((MAGIC, VERSION, generation, time.time())))
+        for name, config, stats, items in namespaces:
+            f.write(dump_record(('namespace', name, config, stats)))
+            for i in range(0, len(items), chunk):
+                f.write(dump_record(('items', name, items[i:i + chunk])))
+            count += len(items)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, path)
+    return count
+
+
+def snapshot_records(path):
+    """
+    :return: a tuple (generation, records) of a snapshot, where records streams its records after the header.
+    A missing or invalid snapshot has generation 0 and no records.
+    """
+    records = read_records(path)
+    header = next(records, None)
+    if not isinstance(header, tuple) or len(header) != 4 or header[0] != MAGIC or header[1] != VERSION:
+        records.close()
+        return 0, iter(())
+    return header[2], records
+
+
+def log_path(path, generation):
+    return '%s.log.%d' % (path, generation)
+
+
+def log_generations(path):
+    """
+    :return: the sorted generations of the logs of a snapshot path.
+    """
+    directory, base = os.path.split(path)
+    prefix = base + '.log.'
+    generations = []
+    for name in os.listdir(directory or '.'):
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            generations.append(int(name[len(prefix):]))
+    return sorted(generations)
+
+
+class Journal(object):
+    """
+    Append-only log of the writes made to the namespaces since the last snapshot.
+    Every record is flushed as it is appended, so it survives the server process being killed (but not the machine
+    crashing, as records are not synced to disk).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'ab')
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        data = dump_record(record)
+        with self._lock:
+            if self._file is None:
+                # replaced by a newer log: the write is in the snapshot being taken
+                return
+            self._file.write(data)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
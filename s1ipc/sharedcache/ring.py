@@ -0,0 +1,82 @@
+import bisect
+import hashlib
+import struct
+from .shared_table import key_bytes
+
+__author__ = 'salvia'
+
+_POINT = struct.Struct('!Q')
+
+
+def _hash(data):
+    return _POINT.unpack(hashlib.md5(data).digest()[:8])[0]
+
+
+class HashRing(object):
+    """
+    Consistent hashing of cache keys onto nodes (e.g. the addresses of the shards of a cache).
+    Every node owns `replicas` points of a 64-bit ring, and a key belongs to the node owning the first point after
+    the hash of the key. Adding or removing one of N nodes thus only moves about 1/N of the keys.
+    Keys hash as in `SharedTable` (refer to `key_bytes`), so that every process of the same python major version
+    agrees on the node of a key.
+    """
+
+    def __init__(self, nodes=(), replicas=160):
+        """
+        :param nodes: iterable of nodes; each node must have a stable `str` (e.g. a socket path or (host, port)).
+        :param replicas: (int) number of points per node. More points spread the keys more evenly.
+        """
+        self.replicas = replicas
+        self.nodes = []
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        """
+        Adds a node to the ring. Adding a node twice has no effect.
+        """
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        self._build()
+
+    def remove(self, node):
+        """
+        Removes a node from the ring; its keys move to the other nodes.
+        """
+        if node in self.nodes:
+            self.nodes.remove(node)
+            self._build()
+
+    def _build(self):
+        points = []
+        for node in self.nodes:
+            label = str(node).encode('utf-8')
+            for i in range(self.replicas):
+                points.append((_hash(label + b'#' + str(i).encode('ascii')), node))
+        points.sort(key=lambda point: point[0])
+        self._points = [point[0] for point in points]
+        self._owners = [point[1] for point in points]
+
+    def node(self, key):
+        """
+        :return: the node of a key.
+        :raise KeyError: if the ring has no nodes.
+        """
+        if not self._points:
+            raise KeyError('The hash ring has no nodes.')
+        i = bisect.bisect(self._points, _hash(key_bytes(key)))
+        return self._owners[i % len(self._owners)]
+
+    def partition(self, keys):
+        """
+        Groups keys by node.
+        :param keys: iterable of keys.
+        :return: A dictionary node -> list of keys.
+        """
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.node(key), []).append(key)
+        return groups
@@ -1,29 +1,105 @@
 from collections import OrderedDict, deque
+from contextlib import contextmanager
+import glob
+import hashlib
+import heapq
+import itertools
+import multiprocessing
+import os
+import pickle
+import tempfile
 import threading
 import time
 
 __author__ = 'salvia'
 from s1ipc import BaseIPCServer
+from s1ipc.server import has_subscribers, publish
+from s1ipc.compression import Compressed
+from s1ipc.transport import is_tcp
+from s1ipc.eventloop import EventLoopMixIn
+from s1ipc.metrics import Counters
+from .eviction import make_policy
+from .persistence import Journal, write_snapshot, snapshot_records, read_records, log_path, log_generations
+from .shared_table import SharedTable, key_bytes, PICKLE_PROTOCOL
 
 
 _cache = {}
+# held while namespaces are created or configured; reads of `_cache` take no lock
+_cache_lock = threading.Lock()
+
+# server-wide memory budget, shared by all the namespaces (0 means unlimited)
+_memory = {'max_bytes': 0, 'peak_bytes': 0}
+
+# snapshot path, current generation and log of the server process, if persistence is enabled (refer to `persistence`)
+_persistence = {'path': None, 'generation': 0, 'journal': None, 'lock': threading.Lock()}
 
 
 class Value(object):
 
-    def __init__(self, value, insertion, expiry=(60 * 60 * 24)):
+    def __init__(self, value, insertion, expiry=(60 * 60 * 24), size=0):
         self.value = value
         self.insertion = insertion
         self.expiry = expiry
+        self.size = size
+        # sequence number of the entry of the item in the expiry heap of its segment, if any
+        self.sequence = None
+
+
+class _Segment(object):
+    """
+    Part of the items of a `Namespace`, with its own lock, expiry heap and leases (refer to `Namespace`).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.objects = {}
+        # entries (deadline, sequence, key); entries whose sequence is not the one of the current Value of their key
+        # (it was replaced or removed) are skipped when popped. Entries do not hold the values, so that the values
+        # evicted or removed are freed at once
+        self.deadlines = []
+        # key -> (token, deadline) of the leases granted on missing keys
+        self.leases = {}
 
 
 class Namespace(object):
     """
     `Namespace` is a dictionary-like class proper for caching objects, supporting object count limit,
      expiry, automatic cleaning, and hit/put/get statistics.
+     When the namespace is full, the evicted items are chosen by its `EvictionPolicy`.
+     The size of the items is accounted approximately (refer to `approximate_size`).
+     Expired items are found through a min-heap of their deadlines, and removed a few at a time by puts and by the
+     reaper thread of the server (refer to `expire`).
+     Every item overwritten or removed, and every invalidation, is published on the `channel` of the namespace
+     (refer to `s1ipc.server.publish`) as an event ('del', keys) or ('clear',), so clients can keep near caches.
+     The keys of a batch of writes (`put_many`, `delete_many`) are published in a single event.
+     Missing keys can be leased to a single client computing their value, while the others wait for it
+     (refer to `get_or_lease`).
+     If the server logs writes (refer to `SharedCacheServer.__init__`), every put, deletion and invalidation is
+     appended to the log with the lock of its segment held, so that the log keeps the order of the writes of every key.
+
+     Items are spread over `segment_count` segments by the hash of their keys, each with its own lock, so that
+     writes of keys of different segments only share the short critical section of the namespace lock, which guards
+     the eviction policy and the size accounting. Items are only added to and removed from the segments under the
+     namespace lock, while the lock of a segment guards its expiry heap, its leases and the order in which the writes
+     of its keys are logged: a put evicting items of other segments, once the namespace is full, therefore holds no
+     other lock than these two. Operations on the whole namespace (e.g. batches of writes, invalidating, snapshots)
+     hold the locks of all the segments.
+     Reads take no lock: statistics are counted per thread (refer to `s1ipc.metrics.Counters`), and hits are
+     buffered for the eviction policy, which is told about them by whoever next holds the namespace lock. Hits are
+     only dropped, making the policy slightly less accurate, if the buffer fills up while the lock is busy.
     """
 
-    def __init__(self, name, max_items=100, global_expiry=(60 * 5), autoclean=True, unlimited=False):
+    # maximum number of expired items removed by each put
+    expire_per_put = 2
+    # seconds an expired lease is kept after its deadline, so that a late fill is still accepted if nobody took over
+    lease_retention = 60
+    # number of segments of every namespace
+    segment_count = 16
+    # maximum number of hits buffered for the eviction policy
+    read_buffer = 4096
+
+    def __init__(self, name, max_items=100, global_expiry=(60 * 5), autoclean=True, unlimited=False, policy='lru',
+                 max_bytes=0):
         """
         Initializes the namespace.
         :param name: (str) The name of the namespace.
@@ -32,18 +108,73 @@ class Namespace(object):
         :param autoclean: (bool) Flag indicating that this namespace should automatically remove expired objects.
         :param unlimited: (bool) Flag indicating that this namespace is unlimited, meaning it will any number of objects
         indefinitely (overrides max_items and global_expiry)
+        :param policy: (str) The eviction policy: 'lru' (default), 'fifo', 'lfu' or 'tinylfu' (refer to `eviction`).
+        :param max_bytes: (int) The maximum approximate size in bytes of the items this namespace can hold,
+        0 for no limit. Items larger than that are not stored.
         """
         self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.peak_bytes = 0
+        self.count = 0
         self.global_expiry = global_expiry
-        self.objects = OrderedDict()
+        self.segments = [_Segment() for i in range(self.segment_count)]
         self.autoclean = autoclean
-        self._lastclean = time.time()
+        self._sequence = itertools.count()
         self.name = name
+        self.channel = ('namespace', name)
         self.unlimited = unlimited
+        # guards the policy, the size accounting, the evictions counters and the shared table
         self._lock = threading.Lock()
-        self.hits = 0
-        self.gets = 0
-        self.puts = 0
+        self._reads = deque(maxlen=self.read_buffer)
+        # keys overwritten or removed by the batch of writes in progress, if any (refer to `_batched`)
+        self._batch = None
+        self.table = None
+        self.policy = make_policy(policy)
+        self.counters = Counters('hits', 'gets', 'puts', 'leases')
+        self.evictions = {}
+        self._tokens = itertools.count(1)
+        _start_reaper()
+
+    def _segment(self, key):
+        return self.segments[hash(key) % self.segment_count]
+
+    @contextmanager
+    def _locked(self):
+        """
+        Holds the locks of all the segments, taken in order. Must not be entered with the lock of a segment held.
+        """
+        for segment in self.segments:
+            segment.lock.acquire()
+        try:
+            yield
+        finally:
+            for segment in reversed(self.segments):
+                segment.lock.release()
+
+    @property
+    def objects(self):
+        """
+        Copy of the items of the namespace, in their insertion order: key -> `Value`.
+        """
+        items = []
+        for segment in self.segments:
+            items.extend(list(segment.objects.items()))
+        items.sort(key=lambda item: item[1].insertion)
+        return OrderedDict(items)
+
+    @property
+    def leases(self):
+        """
+        Copy of the leases of the namespace: key -> (token, deadline).
+        """
+        leases = {}
+        for segment in self.segments:
+            leases.update(list(segment.leases.items()))
+        return leases
+
+    def __len__(self):
+        return self.count
 
     def __getitem__(self, item):
         """
@@ -52,22 +183,44 @@ class Namespace(object):
         :return: Return the value from the given key.
         :raise KeyError: If the key-value pair does not exist in this namespace.
         """
-        hit = False
-        try:
-            val = self.objects[item]
-            now = time.time()
+        segment = self._segment(item)
+        val = segment.objects.get(item)
+        self.counters.add('gets')
+        if val is None:
+            raise KeyError(item)
+        # Check if the object expired
+        if not self.unlimited and time.time() - val.insertion >= min(self.global_expiry, val.expiry):
+            with segment.lock:
+                # unless it was overwritten meanwhile
+                if segment.objects.get(item) is val:
+                    self._remove(segment, item)
+            raise KeyError(item)
+        self.counters.add('hits')
+        self._touch(item)
+        return val.value
 
-            # Check if the object expired
-            if not self.unlimited and now - val.insertion >= min(self.global_expiry, val.expiry):
-                self.objects.pop(item)
-                raise KeyError()
-            hit = True
-            return val.value
-        finally:
-            with self._lock:
-                self.gets += 1
-                if hit:
-                    self.hits += 1
+    def _touch(self, key):
+        """
+        Records a hit for the eviction policy, without waiting for the namespace lock.
+        """
+        self._reads.append(key)
+        if self._lock.acquire(False):
+            try:
+                self._drain()
+            finally:
+                self._lock.release()
+
+    def _drain(self):
+        """
+        Tells the policy about the buffered hits. Must be called with the namespace lock held.
+        """
+        reads = self._reads
+        while reads:
+            try:
+                key = reads.popleft()
+            except IndexError:
+                break
+            self.policy.access(key)
 
     def __setitem__(self, key, value):
         """
@@ -75,40 +228,520 @@ class Namespace(object):
         :param key:
         :param value:
         """
-        self.verify_and_clean()
-        if 0 < self.max_items <= len(self.objects):
-            delkey = next(iter(self.objects))
-            self.objects.pop(delkey)
-        value = Value(value[0], time.time(), value[1])
+        self._store(key, value[0], value[1], time.time())
+
+    def _store(self, key, value, expiry, now, check=None):
+        """
+        Inserts and logs an item under the lock of its segment.
+        :param check: (optional) function called with the segment of the key, its lock held, the item being only
+        inserted if it returns True.
+        :return: True if the item was inserted.
+        """
+        segment = self._segment(key)
+        with segment.lock:
+            if check is not None and not check(segment):
+                return False
+            self._insert(segment, key, value, expiry, now)
+            self._stored(segment, key, value, expiry, now)
+            return True
+
+    def _stored(self, segment, key, value, expiry, now):
+        if _persistence['journal'] is not None:
+            self._log(('put', self.name, [(key, value, now, expiry)]))
+        self._expire(segment, now, self.expire_per_put)
+
+    def _insert(self, segment, key, value, expiry, now):
+        """
+        Inserts an item, evicting others while the namespace is full or over its byte budget.
+        Must be called with the lock of the segment held. An overwrite counts as a use of the key.
+        """
+        size = approximate_size(key) + approximate_size(value) + ENTRY_OVERHEAD
+        if 0 < self.max_bytes < size:
+            self._remove(segment, key)
+            return
+        value = Value(value, now, expiry, size)
         with self._lock:
-            self.objects[key] = value
-            self.puts += 1
+            self._drain()
+            old = segment.objects.get(key)
+            while self.count and self._full(old, size):
+                self._evict()
+                old = segment.objects.get(key)
+            if old is None:
+                self.policy.insert(key, self.max_items)
+                self.count += 1
+            else:
+                self.policy.access(key)
+                self.bytes -= old.size
+                self._deleted(key)
+            segment.objects[key] = value
+            self.bytes += size
+            if self.bytes > self.peak_bytes:
+                self.peak_bytes = self.bytes
+            self._mirror(key, value)
+        if segment.leases:
+            # whoever stored the value, the clients waiting for it will find it
+            segment.leases.pop(key, None)
+        self._schedule(segment, key, value)
+        self.counters.add('puts')
 
-    def invalidate(self):
+    def _schedule(self, segment, key, value):
         """
-        Invalidates all items in the namespace, effectively removing all data.
+        Pushes the deadline of an item on the expiry heap of its segment. Must be called with the segment lock held.
         """
+        if self.unlimited:
+            return
+        deadline = value.insertion + min(self.global_expiry, value.expiry)
+        value.sequence = next(self._sequence)
+        heapq.heappush(segment.deadlines, (deadline, value.sequence, key))
+        self._compact(segment)
+
+    def _compact(self, segment):
+        """
+        Drops the stale entries of the expiry heap of a segment, if they are most of it. Must be called with the
+        segment lock held.
+        """
+        if len(segment.deadlines) > 2 * len(segment.objects) + 64:
+            self._reschedule(segment)
+
+    def _reschedule(self, segment):
+        """
+        Rebuilds the expiry heap of a segment from its current items, e.g. after the expiry settings changed.
+        Must be called with the segment lock held. The items are copied first, as evictions may remove some of them
+        meanwhile (refer to `Namespace`).
+        """
+        segment.deadlines = []
+        if self.unlimited:
+            return
+        for key, value in list(segment.objects.items()):
+            deadline = value.insertion + min(self.global_expiry, value.expiry)
+            value.sequence = next(self._sequence)
+            segment.deadlines.append((deadline, value.sequence, key))
+        heapq.heapify(segment.deadlines)
+
+    def reschedule(self):
+        """
+        Rebuilds the expiry heaps, after `global_expiry` or `unlimited` changed.
+        """
+        for segment in self.segments:
+            with segment.lock:
+                self._reschedule(segment)
+
+    def _expire(self, segment, now, limit=None):
+        """
+        Removes the items of a segment due at `now`, at most `limit` of them. Must be called with the segment lock
+        held.
+        :return: the number of items removed.
+        """
+        removed = 0
+        heap = segment.deadlines
+        if not self.autoclean:
+            return 0
+        while heap and heap[0][0] <= now and (limit is None or removed < limit):
+            deadline, sequence, key = heapq.heappop(heap)
+            value = segment.objects.get(key)
+            if value is not None and value.sequence == sequence:
+                self._remove(segment, key)
+                removed += 1
+        return removed
+
+    def expire(self, now=None, limit=None):
+        """
+        Removes expired items. Only the items actually due are visited, each in O(log n).
+        Does nothing if `autoclean` is False; expired items are then only removed when read.
+        The segments are visited one at a time, so writers are only blocked on the segment being visited.
+        :param now: (float) current time, defaults to time.time().
+        :param limit: (int) maximum number of items to remove, None for all.
+        :return: the number of items removed.
+        """
+        now = time.time() if now is None else now
+        removed = 0
+        for segment in self.segments:
+            with segment.lock:
+                if segment.leases:
+                    self._drop_leases(segment, now - self.lease_retention)
+                removed += self._expire(segment, now, None if limit is None else limit - removed)
+                if not self.unlimited:
+                    self._compact(segment)
+        return removed
+
+    def _full(self, old, size):
+        """
+        :param old: the `Value` currently stored under the key of the item, if any.
+        :return: True if storing an item of the given size needs evicting another item first.
+        """
+        if old is not None:
+            return 0 < self.max_bytes < self.bytes - old.size + size
+        return 0 < self.max_bytes < self.bytes + size or 0 < self.max_items <= self.count
+
+    def _evict(self):
+        """
+        Evicts the item chosen by the policy. Must be called with the namespace lock held, and with the lock of the
+        segment being written, if any: the item may belong to a segment whose lock another thread holds (refer to
+        `Namespace`).
+        """
+        delkey = self.policy.evict()
+        self._discard(self._segment(delkey), delkey)
+        self.evictions[self.policy.name] = self.evictions.get(self.policy.name, 0) + 1
+
+    def trim(self):
+        """
+        Evicts items until the namespace is back under its byte budget, e.g. after the budget was lowered.
+        """
+        with self._lock:
+            self._drain()
+            while self.count and 0 < self.max_bytes < self.bytes:
+                self._evict()
+
+    def evict(self):
+        """
+        Evicts one item chosen by the policy, e.g. to enforce the server-wide memory budget.
+        :return: True if an item was evicted, False if the namespace is empty.
+        """
+        with self._lock:
+            if not self.count:
+                return False
+            self._drain()
+            self._evict()
+            return True
+
+    def _remove(self, segment, key):
+        """
+        Removes an item if it exists, and revokes the lease on its key, if any, so that a value computed before the
+        removal is not stored. Must be called with the segment lock held.
+        :return: True if the item existed.
+        """
+        if segment.leases:
+            segment.leases.pop(key, None)
+        if key not in segment.objects:
+            return False
         with self._lock:
-            self.objects = OrderedDict()
+            if not self._discard(segment, key):
+                return False
+            self.policy.remove(key)
+        return True
+
+    def _discard(self, segment, key):
+        """
+        Removes an item from its segment and from the accounting, but not from the policy. Must be called with the
+        namespace lock held, and with the segment lock too unless the item is evicted.
+        :return: True if the item existed.
+        """
+        value = segment.objects.pop(key, None)
+        if value is None:
+            return False
+        self.bytes -= value.size
+        self.count -= 1
+        self._forget(key)
+        return True
+
+    def set_policy(self, name):
+        """
+        Replaces the eviction policy. The new policy knows nothing about past hits: it starts from the items
+        in their insertion order.
+        :param name: (str) name of the policy (refer to `eviction.POLICIES`).
+        """
+        policy = make_policy(name)
+        with self._locked():
+            with self._lock:
+                for key in self.objects:
+                    policy.insert(key, self.max_items)
+                self.policy = policy
+                self._reads.clear()
+
+    def attach_table(self, path, slots, slot_size):
+        """
+        Creates a `SharedTable` mirroring this namespace, so clients can read entries directly from it.
+        If the namespace already has a table, it is kept (clients have it mapped) and its entries are written again.
+        :param path: (str) path of the table file.
+        :param slots: (int) number of slots of the table.
+        :param slot_size: (int) size in bytes of each slot; larger entries are not mirrored.
+        """
+        with self._locked():
+            with self._lock:
+                if self.table is None:
+                    self.table = SharedTable(path, slots, slot_size, create=True)
+                else:
+                    self.table.clear()
+                for segment in self.segments:
+                    for key, value in segment.objects.items():
+                        self._mirror(key, value)
 
-    def verify_and_clean(self):
+    def _mirror(self, key, value):
         """
-        (non-blocking)
-        Verify if a clean is necessary, and if is, opens a new thread to clean expired items.
+        Writes an entry to the shared table, if any. Must be called with the namespace lock held, as the table has a
+        single writer.
+        """
+        if self.table is None:
+            return
+        kb = key_bytes(key)
+        try:
+            vb = pickle.dumps(value.value, PICKLE_PROTOCOL)
+        except Exception:
+            self.table.delete(kb)
+            return
+        deadline = 0.0 if self.unlimited else value.insertion + min(self.global_expiry, value.expiry)
+        self.table.put(kb, vb, deadline)
+
+    def _forget(self, key):
+        """
+        Removes an entry from the shared table, if any, and from the near caches of the clients.
+        Must be called with the namespace lock held.
+        """
+        if self.table is not None:
+            self.table.delete(key_bytes(key))
+        self._deleted(key)
+
+    def _deleted(self, key):
+        """
+        Publishes that a key was overwritten or removed, or adds it to the event of the batch being written (refer to
+        `_batched`). Must be called with the namespace lock held.
+        """
+        if self._batch is not None:
+            self._batch.append(key)
+        elif has_subscribers(self.channel):
+            publish(self.channel, ('del', [key]))
+
+    @contextmanager
+    def _batched(self):
+        """
+        Publishes the keys overwritten or removed by a batch of writes as a single ('del', keys) event, rather than an
+        event per key. Must be entered with the locks of all the segments held, so that no other write is batched.
+        """
+        self._batch = []
+        try:
+            yield
+        finally:
+            batch, self._batch = self._batch, None
+            if batch and has_subscribers(self.channel):
+                publish(self.channel, ('del', batch))
+
+    def get_many(self, keys):
+        """
+        Retrieves many items from the namespace at once, without locking but to remove expired items.
+        :param keys: iterable of keys.
+        :return: A dictionary holding the key-value pairs found (misses are left out).
+        """
+        found = {}
+        gets = 0
+        now = time.time()
+        for key in keys:
+            gets += 1
+            segment = self._segment(key)
+            val = segment.objects.get(key)
+            if val is None:
+                continue
+            if not self.unlimited and now - val.insertion >= min(self.global_expiry, val.expiry):
+                with segment.lock:
+                    if segment.objects.get(key) is val:
+                        self._remove(segment, key)
+                continue
+            found[key] = val.value
+            self._touch(key)
+        self.counters.add('gets', gets)
+        self.counters.add('hits', len(found))
+        return found
+
+    def put_many(self, mapping, expiry=(60 * 60 * 24)):
+        """
+        Sets many items in the namespace at once, under a single acquisition of the locks.
+        :param mapping: dictionary of key-value pairs.
+        :param expiry: expiry in seconds for these items.
+        """
+        now = time.time()
+        with self._locked(), self._batched():
+            segments = set()
+            for key, value in mapping.items():
+                segment = self._segment(key)
+                self._insert(segment, key, value, expiry, now)
+                segments.add(segment)
+            if _persistence['journal'] is not None:
+                self._log(('put', self.name, [(key, value, now, expiry) for key, value in mapping.items()]))
+            for segment in segments:
+                self._expire(segment, now, self.expire_per_put)
+
+    def get_or_lease(self, key, lease_timeout):
+        """
+        Gets an item or, if it is missing, grants the caller a lease on its key: the caller computes the value and
+        stores it with `fill_lease`, while the other callers are told to wait (single flight). A lease which is
+        neither filled nor released within `lease_timeout` seconds is granted to the next caller.
+        :param key: The key of the item.
+        :param lease_timeout: (float) duration in seconds of the lease.
+        :return: A tuple ('hit', value), ('lease', token) or ('wait', None).
         """
         now = time.time()
-        if not self.unlimited and self.autoclean and now - self._lastclean >= self.global_expiry:
-            self._lastclean = now
-            t = threading.Thread(target=self.cleanup)
-            t.start()
+        segment = self._segment(key)
+        with segment.lock:
+            val = segment.objects.get(key)
+            if val is not None:
+                if self.unlimited or now - val.insertion < min(self.global_expiry, val.expiry):
+                    self.counters.add('gets')
+                    self.counters.add('hits')
+                    self._touch(key)
+                    return 'hit', val.value
+                self._remove(segment, key)
+            token = self._grant(segment, key, lease_timeout, now)
+            if token is None:
+                # waiting clients poll: only the first miss counts as a get
+                return 'wait', None
+            self.counters.add('gets')
+            return 'lease', token
+
+    def acquire_lease(self, key, lease_timeout):
+        """
+        Grants the caller a lease on a key whether or not it holds an item, e.g. to refresh a stale value, unless
+        another caller holds it. The lease is filled or released like those of `get_or_lease`.
+        :param key: The key of the item.
+        :param lease_timeout: (float) duration in seconds of the lease.
+        :return: The token of the lease, or None if another caller holds it.
+        """
+        segment = self._segment(key)
+        with segment.lock:
+            return self._grant(segment, key, lease_timeout, time.time())
+
+    def _grant(self, segment, key, lease_timeout, now):
+        """
+        Grants a lease on a key, unless a lease on it is still running. Must be called with the segment lock held.
+        :return: The token of the lease, or None.
+        """
+        lease = segment.leases.get(key)
+        if lease is not None and lease[1] > now:
+            return None
+        self.counters.add('leases')
+        token = next(self._tokens)
+        segment.leases[key] = (token, now + lease_timeout)
+        return token
+
+    def fill_lease(self, key, token, value, expiry=(60 * 60 * 24)):
+        """
+        Stores the value computed by the holder of a lease. The value is dropped if the key was written or removed
+        since the lease was granted, or if the lease expired and was granted to another caller.
+        :param token: the token returned by `get_or_lease`.
+        :param expiry: expiry in seconds for this item.
+        :return: True if the value was stored.
+        """
+        def held(segment):
+            lease = segment.leases.get(key)
+            return lease is not None and lease[0] == token
+
+        return self._store(key, value, expiry, time.time(), held)
+
+    def release_lease(self, key, token):
+        """
+        Gives up a lease without storing a value (e.g. the computation failed), so that the next caller gets it.
+        """
+        segment = self._segment(key)
+        with segment.lock:
+            lease = segment.leases.get(key)
+            if lease is not None and lease[0] == token:
+                del segment.leases[key]
+
+    def _drop_leases(self, segment, before):
+        """
+        Forgets the leases of a segment which expired before the given time. Must be called with the segment lock
+        held.
+        """
+        for key, lease in list(segment.leases.items()):
+            if lease[1] < before:
+                del segment.leases[key]
+
+    def delete_many(self, keys):
+        """
+        Removes many items from the namespace at once, under a single acquisition of the locks.
+        :param keys: iterable of keys.
+        :return: The number of items actually removed.
+        """
+        deleted = 0
+        keys = list(keys)
+        with self._locked(), self._batched():
+            for key in keys:
+                if self._remove(self._segment(key), key):
+                    deleted += 1
+            if _persistence['journal'] is not None:
+                self._log(('del', self.name, keys))
+        return deleted
+
+    def invalidate(self):
+        """
+        Invalidates all items in the namespace, effectively removing all data.
+        """
+        with self._locked():
+            with self._lock:
+                for segment in self.segments:
+                    segment.objects = {}
+                    segment.deadlines = []
+                    segment.leases = {}
+                self.bytes = 0
+                self.count = 0
+                self.policy.clear()
+                self._reads.clear()
+                if self.table is not None:
+                    self.table.clear()
+                publish(self.channel, ('clear',))
+            if _persistence['journal'] is not None:
+                self._log(('clear', self.name))
+
+    def _log(self, record):
+        """
+        Appends a write to the log of the server. Must be called with the locks of the segments of the written keys
+        held.
+        """
+        journal = _persistence['journal']
+        if journal is not None:
+            journal.append(record)
+
+    def config(self):
+        """
+        :return: the configuration of the namespace, as keyword arguments of `SharedCacheServer.configure_namespace`.
+        """
+        return {
+            'max_items': self.max_items,
+            'global_expiry': self.global_expiry,
+            'autoclean': self.autoclean,
+            'unlimited': self.unlimited,
+            'policy': self.policy.name,
+            'max_bytes': self.max_bytes
+        }
+
+    def dump(self):
+        """
+        Copies the namespace for a snapshot. Writers are only blocked while the items are copied (shallowly).
+        :return: a tuple (config, stats, items), items being a list of tuples (key, value, insertion, expiry), in
+        their insertion order.
+        """
+        with self._locked():
+            config = self.config()
+            stats = self.get_stats()
+            items = list(self.objects.items())
+        return config, stats, [(key, value.value, value.insertion, value.expiry) for key, value in items]
+
+    def restore(self, items, now):
+        """
+        Inserts the items of a snapshot or log with their original insertion time, leaving out the expired ones.
+        :param items: iterable of tuples (key, value, insertion, expiry).
+        :param now: (float) the current time.
+        """
+        with self._locked():
+            for key, value, insertion, expiry in items:
+                if self.unlimited or now - insertion < min(self.global_expiry, expiry):
+                    self._insert(self._segment(key), key, value, expiry, insertion)
+
+    def restore_stats(self, stats):
+        """
+        Sets the counters saved in a snapshot (refer to `get_stats`).
+        """
+        self.counters.reset(stats)
+        with self._lock:
+            self.evictions = dict(stats['evictions'])
+            self.peak_bytes = max(stats['peak_bytes'], self.bytes)
 
     def reset_stats(self):
         """
-        Reset the hits/gets/puts counters.
+        Reset the hits/gets/puts/evictions counters, and the peak size to the current size.
         """
-        self.hits = 0
-        self.gets = 0
-        self.puts = 0
+        self.counters.reset()
+        with self._lock:
+            self.evictions = {}
+            self.peak_bytes = self.bytes
 
     def get_stats(self):
         """
@@ -117,78 +750,156 @@ class Namespace(object):
         {
             'hits': `number of cache hits`,
             'gets': `number of cache gets (hits and misses)`,
-            'puts': `number of cache insertions`
+            'puts': `number of cache insertions`,
+            'policy': `name of the eviction policy`,
+            'evictions': `dictionary of the number of items evicted by each policy used since the last reset`,
+            'bytes': `approximate size of the items`,
+            'peak_bytes': `highest approximate size of the items since the last reset`,
+            'max_bytes': `the byte budget of the namespace, 0 if unlimited`,
+            'leases': `number of leases granted`
         }
         """
-        return {
-            'hits': self.hits,
-            'gets': self.gets,
-            'puts': self.puts
-        }
+        stats = self.counters.totals()
+        with self._lock:
+            stats.update({
+                'policy': self.policy.name,
+                'evictions': dict(self.evictions),
+                'bytes': self.bytes,
+                'peak_bytes': self.peak_bytes,
+                'max_bytes': self.max_bytes
+            })
+        return stats
 
     def cleanup(self):
         """
          (blocking)
          Remove expired items
         """
-        if self.unlimited:
-            return
-        now = time.time()
-        delete = deque()
-
-        for k, v in self.objects.iteritems():
-            if now - v.insertion >= min(self.global_expiry, v.expiry):
-                delete.append(k)
-
-        with self._lock:
-            for d in delete:
-                try:
-                    self.objects.pop(d)
-                except KeyError:
-                    pass
+        self.expire()
 
 
 class SharedCacheServer(BaseIPCServer):
     """
     IPC server designed for shared caching.
+
+    :class attribute shutdown_timeout: seconds `shutdown` waits for the last snapshot of a server with persistence
+     enabled, after which the server process is terminated anyway.
     """
 
-    def __init__(self, address='/tmp/SharedCacheServer.sock', start=True):
+    shutdown_timeout = 60.0
+
+    def __init__(self, address='/tmp/SharedCacheServer.sock', start=True, max_bytes=0, snapshot_path=None,
+                 snapshot_interval=60, append_log=False, authkey=None):
         """
         Initializes the server.
-        :param address: (str) The unix socket file path
+        :param address: (str) The unix socket file path, or a (host, port) tuple to listen on TCP.
         :param start: (bool) Flag indicating if the server should startup rightaway.
+        :param max_bytes: (int) Server-wide memory budget: the maximum approximate size in bytes of the items of all
+        the namespaces together, 0 for no limit. When it is exceeded, items are evicted from the largest namespaces.
+        :param snapshot_path: (str) Path of the snapshot file. If given, the namespaces (configuration, items with their
+        expiry, and statistics) are restored from it when the server starts, leaving out the items which expired
+        meanwhile, and saved to it every `snapshot_interval` seconds, on `snapshot` calls and on harakiri.
+        :param snapshot_interval: (float) seconds between snapshots, 0 to only take them on demand.
+        :param append_log: (bool) Flag indicating that every write is also appended to a log next to the snapshot, so
+        that the writes made since the last snapshot are restored too, even if the server was killed.
+        :param authkey: (bytes) shared secret of the clients of a TCP server (refer to `BaseIPCServer`).
+        """
+        _memory['max_bytes'] = max_bytes
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.append_log = append_log
+        BaseIPCServer.__init__(self, address, start, authkey)
+
+    def prepare(self):
         """
-        BaseIPCServer.__init__(self, address, start)
+        Restores the snapshot and its logs, if any, then starts logging and taking snapshots, if enabled.
+        """
+        if self.snapshot_path is None:
+            return
+        path = _persistence['path'] = self.snapshot_path
+        _persistence['generation'] = _restore(path)
+        if self.append_log:
+            # a new log, as the last one may end with a truncated record
+            _persistence['generation'] += 1
+            _persistence['journal'] = Journal(log_path(path, _persistence['generation']))
+        if self.snapshot_interval:
+            _Snapshotter(self.snapshot_interval).start()
+
+    def finish(self):
+        """
+        Takes a last snapshot, if persistence is enabled.
+        """
+        if _persistence['path'] is not None:
+            _take_snapshot()
+
+    def shutdown(self):
+        """
+        Shuts down the server, removing the files of its shared tables. If persistence is enabled, the server process
+        first stops serving and takes a last snapshot (refer to `stop`), and is only terminated if it did not exit
+        within `shutdown_timeout` seconds.
+        """
+        pid = self.process.pid if self.process else None
+        if self.snapshot_path is not None and self.process is not None and self.process.is_alive():
+            self.stop(self.shutdown_timeout)
+        BaseIPCServer.shutdown(self)
+        if pid is not None:
+            _remove_tables(pid)
+
+    def harakiri(self):
+        """
+        Shuts down the server from the server process itself, removing the files of its shared tables, after taking
+        a last snapshot if persistence is enabled.
+        """
+        if _persistence['path'] is not None:
+            _take_snapshot()
+        _remove_tables(os.getpid())
+        BaseIPCServer.harakiri(self)
 
     @staticmethod
-    def create_namespace(name, max_items=100, global_expiry=60 * 5, autoclean=True, unlimited=False):
+    def create_namespace(name, max_items=100, global_expiry=60 * 5, autoclean=True, unlimited=False, policy='lru',
+                         max_bytes=0):
         """
         Inserts a new namespace in this server.
         For parameters refer to the `Namespace` class.
         """
-        if name in _cache:
-            raise KeyError('Namespace already exists.')
-        _cache[name] = Namespace(name, max_items, global_expiry, autoclean, unlimited)
+        with _cache_lock:
+            if name in _cache:
+                raise KeyError('Namespace already exists.')
+            _cache[name] = Namespace(name, max_items, global_expiry, autoclean, unlimited, policy, max_bytes)
+            _log_config(name)
 
     @staticmethod
-    def configure_namespace(name, max_items=None, global_expiry=None, autoclean=None, unlimited=None):
+    def configure_namespace(name, max_items=None, global_expiry=None, autoclean=None, unlimited=None, policy=None,
+                            max_bytes=None):
         """
         Configures an existing namespace or creates a new one.
         For parameters refer to the `Namespace` class.
         """
-        if name in _cache:
-            namespace = _cache[name]
-            if max_items is not None:
-                namespace.max_items = max_items
-            if global_expiry is not None:
-                namespace.global_expiry = global_expiry
-            if autoclean is not None:
-                namespace.autoclean = autoclean
-            if unlimited is not None:
-                namespace.unlimited = unlimited
-        else:
-            _cache[name] = Namespace(name, max_items, global_expiry, autoclean, unlimited)
+        with _cache_lock:
+            if name in _cache:
+                namespace = _cache[name]
+                if max_items is not None:
+                    namespace.max_items = max_items
+                if global_expiry is not None:
+                    namespace.global_expiry = global_expiry
+                if autoclean is not None:
+                    namespace.autoclean = autoclean
+                if unlimited is not None:
+                    namespace.unlimited = unlimited
+                if policy is not None and policy != namespace.policy.name:
+                    namespace.set_policy(policy)
+                if max_bytes is not None:
+                    namespace.max_bytes = max_bytes
+                    namespace.trim()
+                if global_expiry is not None or unlimited is not None:
+                    namespace.reschedule()
+                    if namespace.table is not None:
+                        # the deadlines stored in the table may have changed: mirror the entries again
+                        namespace.attach_table(namespace.table.path, namespace.table.slots, namespace.table.slot_size)
+            else:
+                _cache[name] = Namespace(name, max_items, global_expiry, autoclean, unlimited, policy or 'lru',
+                                         max_bytes or 0)
+            _log_config(name)
 
     @staticmethod
     def put(namespace, key, value, expiry=(60 * 60 * 24)):
@@ -200,10 +911,8 @@ class SharedCacheServer(BaseIPCServer):
         :param value: item value
         :param expiry: expiry in secondos for this item
         """
-        if not namespace in _cache:
-            _cache[namespace] = Namespace(namespace)
-
-        _cache[namespace][key] = (value, expiry)
+        _namespace(namespace)[key] = (value, expiry)
+        _enforce_memory_budget()
 
     @staticmethod
     def get(namespace, key):
@@ -219,6 +928,111 @@ class SharedCacheServer(BaseIPCServer):
         except KeyError:
             return '!___null___'
 
+    @staticmethod
+    def get_many(namespace, keys):
+        """
+        Gets many items from the cache at once.
+        :param namespace: Name of the namespace.
+        :param keys: list of keys of the items to get.
+        :return: A dictionary holding the items found; keys not found are left out.
+        """
+        if namespace in _cache:
+            return _cache[namespace].get_many(keys)
+        return {}
+
+    @staticmethod
+    def put_many(namespace, mapping, expiry=(60 * 60 * 24)):
+        """
+        Inserts many items into the cache at once.
+        If the namespace does not exist, a new one with default configuration will be created.
+        :param namespace: Name of the namespace.
+        :param mapping: dictionary of key-value pairs to insert.
+        :param expiry: expiry in secondos for these items
+        """
+        _namespace(namespace).put_many(mapping, expiry)
+        _enforce_memory_budget()
+
+    @staticmethod
+    def get_or_lease(namespace, key, lease_timeout=60):
+        """
+        Gets an item from the cache, or a lease to compute it if it is missing.
+        If the namespace does not exist, a new one with default configuration will be created.
+        :param namespace: Name of the namespace.
+        :param key: The key of the item to get.
+        :param lease_timeout: (float) duration in seconds of the lease.
+        :return: Refer to `Namespace.get_or_lease`.
+        """
+        return _namespace(namespace).get_or_lease(key, lease_timeout)
+
+    @staticmethod
+    def acquire_lease(namespace, key, lease_timeout=60):
+        """
+        Gets a lease on a key, whether or not the item exists, e.g. to refresh it.
+        If the namespace does not exist, a new one with default configuration will be created.
+        :param namespace: Name of the namespace.
+        :param key: item key
+        :param lease_timeout: (float) duration in seconds of the lease.
+        :return: The token of the lease, or None if another caller holds it.
+        """
+        return _namespace(namespace).acquire_lease(key, lease_timeout)
+
+    @staticmethod
+    def fill_lease(namespace, key, token, value, expiry=(60 * 60 * 24)):
+        """
+        Inserts the item computed by the holder of a lease.
+        :param namespace: Name of the namespace.
+        :param key: item key
+        :param token: the token returned by `get_or_lease`.
+        :param value: item value
+        :param expiry: expiry in secondos for this item
+        :return: True if the item was inserted, False if the lease was lost (refer to `Namespace.fill_lease`).
+        """
+        if namespace not in _cache:
+            return False
+        filled = _cache[namespace].fill_lease(key, token, value, expiry)
+        if filled:
+            _enforce_memory_budget()
+        return filled
+
+    @staticmethod
+    def release_lease(namespace, key, token):
+        """
+        Gives up a lease without inserting the item.
+        :param namespace: Name of the namespace.
+        :param key: item key
+        :param token: the token returned by `get_or_lease`.
+        """
+        if namespace in _cache:
+            _cache[namespace].release_lease(key, token)
+
+    @staticmethod
+    def delete_many(namespace, keys):
+        """
+        Removes many items from the cache at once.
+        :param namespace: Name of the namespace.
+        :param keys: list of keys of the items to remove.
+        :return: The number of items removed.
+        """
+        if namespace in _cache:
+            return _cache[namespace].delete_many(keys)
+        return 0
+
+    @staticmethod
+    def shared_table(namespace, slots=4096, slot_size=1024):
+        """
+        Enables direct reads on a namespace, by mirroring it in a `SharedTable`.
+        If the namespace does not exist, a new one with default configuration will be created.
+        If the namespace already has a table, it is kept along with its geometry.
+        :param namespace: Name of the namespace.
+        :param slots: (int) number of slots of the table.
+        :param slot_size: (int) size in bytes of each slot; larger entries are only served by the server.
+        :return: A tuple (path, slots, slot_size) describing the table, for clients to map it.
+        """
+        ns = _namespace(namespace)
+        if ns.table is None:
+            ns.attach_table(_table_path(os.getpid(), namespace), slots, slot_size)
+        return ns.table.path, ns.table.slots, ns.table.slot_size
+
     @staticmethod
     def invalidate(namespace):
         """
@@ -240,6 +1054,46 @@ class SharedCacheServer(BaseIPCServer):
         else:
             return '!___null___'
 
+    @staticmethod
+    def configure_server(max_bytes=None):
+        """
+        Configures the server-wide settings.
+        :param max_bytes: (int) the server-wide memory budget (refer to `SharedCacheServer.__init__`).
+        """
+        if max_bytes is not None:
+            _memory['max_bytes'] = max_bytes
+            _enforce_memory_budget()
+
+    @staticmethod
+    def server_stats():
+        """
+        Retrieves the server-wide statistics.
+        :return: A dictionary following form:
+        {
+            'namespaces': `number of namespaces`,
+            'bytes': `approximate size of the items of all the namespaces`,
+            'peak_bytes': `highest approximate size of the items of all the namespaces`,
+            'max_bytes': `the server-wide memory budget, 0 if unlimited`
+        }
+        """
+        namespaces = list(_cache.values())
+        return {
+            'namespaces': len(namespaces),
+            'bytes': sum(ns.bytes for ns in namespaces),
+            'peak_bytes': _memory['peak_bytes'],
+            'max_bytes': _memory['max_bytes']
+        }
+
+    @staticmethod
+    def snapshot():
+        """
+        Takes a snapshot of all the namespaces now (refer to `SharedCacheServer.__init__`).
+        :return: The number of items saved, or '!___null___' if persistence is not enabled.
+        """
+        if _persistence['path'] is None:
+            return '!___null___'
+        return _take_snapshot()
+
     @staticmethod
     def reset_stats(namespace):
         """
@@ -253,11 +1107,282 @@ class SharedCacheServer(BaseIPCServer):
             return '!___null___'
 
 
+class _Reaper(threading.Thread):
+    """
+    Long-lived daemon thread removing the expired items of every namespace of the process, every `interval` seconds.
+    """
+
+    interval = 1.0
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='SharedCacheReaper')
+        self.daemon = True
+
+    def run(self):
+        # bound here, as the globals of the module are cleared while python 2 exits, with this thread still running
+        sleep, clock, cache = time.sleep, time.time, _cache
+        while True:
+            sleep(self.interval)
+            now = clock()
+            for namespace in list(cache.values()):
+                try:
+                    namespace.expire(now)
+                except Exception:
+                    # this thread is the only reaper of the process: a failure must not stop it, nor skip the
+                    # other namespaces
+                    pass
+
+
+_reaper = {'pid': None}
+_reaper_lock = threading.Lock()
+
+
+def _start_reaper():
+    """
+    Starts the reaper of this process, if it is not running yet (a forked server process starts its own).
+    """
+    pid = os.getpid()
+    if _reaper['pid'] == pid:
+        return
+    with _reaper_lock:
+        if _reaper['pid'] != pid:
+            _Reaper().start()
+            _reaper['pid'] = pid
+
+
+class _Snapshotter(threading.Thread):
+    """
+    Long-lived daemon thread taking a snapshot of the namespaces every `interval` seconds.
+    """
+
+    def __init__(self, interval):
+        threading.Thread.__init__(self, name='SharedCacheSnapshotter')
+        self.daemon = True
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                _take_snapshot()
+            except Exception:
+                # e.g. the disk is full: the previous snapshot and the logs are kept, and the next one is attempted
+                pass
+
+
+def _take_snapshot():
+    """
+    Writes a snapshot of all the namespaces, after starting a new log if writes are logged.
+    Namespaces are copied one at a time, and written without holding their locks.
+    :return: the number of items saved.
+    """
+    path = _persistence['path']
+    with _persistence['lock']:
+        generation = _persistence['generation'] + 1
+        journal = _persistence['journal']
+        if journal is not None:
+            # writes made from now on go to the new log, whether or not the snapshot holds them
+            _persistence['journal'] = Journal(log_path(path, generation))
+            journal.close()
+        count = write_snapshot(path, generation, ((ns.name,) + ns.dump() for ns in list(_cache.values())))
+        _persistence['generation'] = generation
+        for old in log_generations(path):
+            if old < generation:
+                os.remove(log_path(path, old))
+    return count
+
+
+def _restore(path):
+    """
+    Loads the snapshot at `path`, then replays its logs, leaving out the items which expired meanwhile.
+    :return: the highest generation of the snapshot and logs found.
+    """
+    now = time.time()
+    generation, records = snapshot_records(path)
+    stats = {}
+    for record in records:
+        if record[0] == 'namespace':
+            SharedCacheServer.configure_namespace(record[1], **record[2])
+            stats[record[1]] = record[3]
+        else:
+            _replay(record, now)
+    logs = [log for log in log_generations(path) if log >= generation]
+    for log in logs:
+        for record in read_records(log_path(path, log)):
+            _replay(record, now)
+    for name, values in stats.items():
+        _cache[name].restore_stats(values)
+    _enforce_memory_budget()
+    return max([generation] + logs)
+
+
+def _replay(record, now):
+    kind, name = record[0], record[1]
+    if kind == 'config':
+        SharedCacheServer.configure_namespace(name, **record[2])
+    elif kind in ('items', 'put'):
+        _namespace(name).restore(record[2], now)
+    elif name in _cache:
+        if kind == 'del':
+            _cache[name].delete_many(record[2])
+        elif kind == 'clear':
+            _cache[name].invalidate()
+
+
+def _namespace(name):
+    """
+    :return: the namespace of the given name, created with the default configuration if it does not exist.
+    """
+    namespace = _cache.get(name)
+    if namespace is None:
+        with _cache_lock:
+            namespace = _cache.get(name)
+            if namespace is None:
+                namespace = _cache[name] = Namespace(name)
+    return namespace
+
+
+def _log_config(name):
+    journal = _persistence['journal']
+    if journal is not None:
+        journal.append(('config', name, _cache[name].config()))
+
+
+def _enforce_memory_budget():
+    """
+    Evicts items from the largest namespaces, by their own policies, until the server is back under its memory budget.
+    """
+    namespaces = list(_cache.values())
+    total = sum(ns.bytes for ns in namespaces)
+    max_bytes = _memory['max_bytes']
+    while 0 < max_bytes < total:
+        largest = max(namespaces, key=lambda ns: ns.bytes)
+        before = largest.bytes
+        if not largest.evict():
+            break
+        total -= before - largest.bytes
+    if total > _memory['peak_bytes']:
+        _memory['peak_bytes'] = total
+
+
+ENTRY_OVERHEAD = 64
+_FIXED_SIZES = {bool: 8, int: 8, float: 8, type(None): 0}
+
+
+def approximate_size(obj):
+    """
+    Approximates the serialized size in bytes of an object, cheaply: strings and compressed values count their
+    length, numbers 8 bytes and containers the sum of their items; other objects are pickled to be measured.
+    """
+    size = _FIXED_SIZES.get(type(obj))
+    if size is not None:
+        return size
+    if isinstance(obj, (bytes, bytearray, type(u''))):
+        return len(obj)
+    if isinstance(obj, Compressed):
+        return len(obj.data)
+    if isinstance(obj, dict):
+        return sum(approximate_size(k) + approximate_size(v) for k, v in obj.items()) + 8
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sum(approximate_size(item) for item in obj) + 8
+    try:
+        return len(pickle.dumps(obj, PICKLE_PROTOCOL))
+    except Exception:
+        return ENTRY_OVERHEAD
+
+
+def _table_directory():
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def _table_path(pid, namespace):
+    digest = hashlib.md5(key_bytes(namespace)).hexdigest()[:16]
+    return os.path.join(_table_directory(), 's1ipc-%d-%s.table' % (pid, digest))
+
+
+def _remove_tables(pid):
+    for path in glob.glob(os.path.join(_table_directory(), 's1ipc-%d-*.table' % pid)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class EventLoopSharedCacheServer(EventLoopMixIn, SharedCacheServer):
+    """
+    `SharedCacheServer` serving every client on a single event loop, instead of a thread per connection.
+    Refer to `EventLoopMixIn`.
+    """
+    pass
+
+
+def shard_addresses(address, shards):
+    """
+    :return: the addresses of the shards of a `ShardedSharedCacheServer`: socket paths suffixed with the number of
+    the shard, or TCP addresses on consecutive ports (all on port 0, i.e. free ports, if the port is 0).
+    """
+    if is_tcp(address):
+        host, port = address
+        return [(host, port + i if port else 0) for i in range(shards)]
+    return ['%s.%d' % (address, i) for i in range(shards)]
+
+
+class ShardedSharedCacheServer(object):
+    """
+    Runs several SharedCacheServer processes (shards), on the socket paths `<address>.0` to `<address>.<shards - 1>`,
+    so that the cache is served by as many cores. Clients spread the keys of every namespace over the shards with
+    `ShardedSharedCache`.
+    Namespace limits and the server-wide memory budget apply to each shard separately.
+    """
+
+    def __init__(self, address='/tmp/SharedCacheServer.sock', shards=None, start=True, server_class=None,
+                 **server_kwargs):
+        """
+        Initializes the shards.
+        :param address: (str) prefix of the socket paths of the shards, or TCP address of the first shard
+        (refer to `shard_addresses`). The actual addresses are listed in `addresses`.
+        :param shards: (int) number of shards, defaults to the number of CPUs.
+        :param start: (bool) Flag indicating if the shards should startup rightaway.
+        :param server_class: (optional) class of the shards, defaults to `SharedCacheServer`.
+        :param server_kwargs: other keyword arguments of the shards (refer to `SharedCacheServer.__init__`).
+        A `snapshot_path` is suffixed with the number of the shard.
+        """
+        if shards is None:
+            shards = multiprocessing.cpu_count()
+        server_class = server_class or SharedCacheServer
+        snapshot_path = server_kwargs.pop('snapshot_path', None)
+        self.servers = []
+        for i, shard in enumerate(shard_addresses(address, shards)):
+            if snapshot_path is not None:
+                server_kwargs['snapshot_path'] = '%s.%d' % (snapshot_path, i)
+            self.servers.append(server_class(shard, start, **server_kwargs))
+        self.addresses = [server.address for server in self.servers]
+
+    def startup(self):
+        for server in self.servers:
+            server.startup()
+
+    def shutdown(self):
+        for server in self.servers:
+            server.shutdown()
+
+
 # make the functions available for IPC calls
 SharedCacheServer.register_functor(SharedCacheServer.create_namespace)
 SharedCacheServer.register_functor(SharedCacheServer.configure_namespace)
 SharedCacheServer.register_functor(SharedCacheServer.put)
 SharedCacheServer.register_functor(SharedCacheServer.get)
+SharedCacheServer.register_functor(SharedCacheServer.get_many)
+SharedCacheServer.register_functor(SharedCacheServer.put_many)
+SharedCacheServer.register_functor(SharedCacheServer.delete_many)
+SharedCacheServer.register_functor(SharedCacheServer.get_or_lease)
+SharedCacheServer.register_functor(SharedCacheServer.acquire_lease)
+SharedCacheServer.register_functor(SharedCacheServer.fill_lease)
+SharedCacheServer.register_functor(SharedCacheServer.release_lease)
+SharedCacheServer.register_functor(SharedCacheServer.shared_table)
 SharedCacheServer.register_functor(SharedCacheServer.invalidate)
 SharedCacheServer.register_functor(SharedCacheServer.reset_stats)
+SharedCacheServer.register_functor(SharedCacheServer.configure_server)
+SharedCacheServer.register_functor(SharedCacheServer.server_stats)
+SharedCacheServer.register_functor(SharedCacheServer.snapshot)
 SharedCacheServer.register_functor(SharedCacheServer.get_stats)
\ No newline at end of file
@@ -0,0 +1,182 @@
+from s1ipc.client import execute_all
+from .ring import HashRing
+from .shared_cache import SharedCache
+
+__author__ = 'salvia'
+
+
+class ShardedSharedCache(object):
+    """
+    Dictionary-like cache spreading the keys of a namespace over the shards of a `ShardedSharedCacheServer`
+    (or any set of SharedCacheServers) by consistent hashing (refer to `HashRing`). Every shard is reached through
+    its own `SharedCache`, and operations on many keys call the shards in parallel, with one pipeline each.
+    Like `SharedCache` without a pool, instances must not be shared between threads.
+    """
+
+    def __init__(self, namespace, addresses, max_items=100, global_expiry=60 * 5, autoclean=True, unlimited=False,
+                 max_bytes=None, replicas=160, **cache_kwargs):
+        """
+        Initializes a new ShardedSharedCache object, connecting to every shard.
+        For other parameters please refer to the `Namespace` Class.
+        :param addresses: list of the addresses of the shards (refer to `ShardedSharedCacheServer.addresses`).
+        Adding or removing a shard only moves the keys of about one shard.
+        :param max_items: (int) maximum number of items of the namespace, split evenly between the shards.
+        :param max_bytes: (optional) byte budget of the namespace, split evenly between the shards.
+        :param replicas: (int) number of points of every shard on the hash ring.
+        :param cache_kwargs: other keyword arguments of the `SharedCache` of every shard, except `address` and `pool`
+        (refer to `SharedCache.__init__`).
+        """
+        count = len(addresses)
+        self.namespace = namespace
+        self.ring = HashRing(addresses, replicas)
+        self.shards = {}
+        for address in addresses:
+            self.shards[address] = SharedCache(namespace, _split(max_items, count), global_expiry, autoclean,
+                                               unlimited, address=address, max_bytes=_split(max_bytes, count),
+                                               **cache_kwargs)
+
+    def shard(self, key):
+        """
+        :return: the `SharedCache` of the shard holding a key.
+        """
+        return self.shards[self.ring.node(key)]
+
+    def __getitem__(self, item):
+        return self.shard(item)[item]
+
+    def get(self, item):
+        return self.shard(item).get(item)
+
+    def __setitem__(self, key, value):
+        self.shard(key)[key] = value
+
+    def get_or_lease(self, key, lease_timeout=60):
+        return self.shard(key).get_or_lease(key, lease_timeout)
+
+    def acquire_lease(self, key, lease_timeout=60):
+        return self.shard(key).acquire_lease(key, lease_timeout)
+
+    def fill_lease(self, key, token, value, expiry=(60 * 60 * 24)):
+        return self.shard(key).fill_lease(key, token, value, expiry)
+
+    def release_lease(self, key, token):
+        self.shard(key).release_lease(key, token)
+
+    def get_many(self, keys):
+        """
+        Gets many items from the cache, calling the shards in parallel.
+        :param keys: iterable of keys to get.
+        :return: A dictionary holding the items found; keys not found are left out.
+        """
+        groups = self.ring.partition(keys)
+        found = {}
+        if not self._parallel(groups):
+            for address, group in groups.items():
+                found.update(self.shards[address].get_many(group))
+            return found
+        calls = [(address, 'get_many', (self.namespace, group)) for address, group in groups.items()]
+        for (address, function, args), result in zip(calls, self._execute(calls)):
+            found.update(self.shards[address]._unpack_many(result))
+        return found
+
+    def set_many(self, mapping, expiry=(60 * 60 * 24)):
+        """
+        Sets many items into the cache, calling the shards in parallel.
+        :param mapping: dictionary of key-value pairs.
+        :param expiry: expiry in seconds for these items.
+        """
+        mapping = dict(mapping)
+        groups = self.ring.partition(mapping)
+        if not self._parallel(groups):
+            for address, group in groups.items():
+                self.shards[address].set_many(dict((key, mapping[key]) for key in group), expiry)
+            return
+        calls = []
+        for address, group in groups.items():
+            shard = self.shards[address]
+            calls.append((address, 'put_many',
+                          (self.namespace, dict((key, shard._pack(mapping[key])) for key in group), expiry)))
+        self._execute(calls)
+
+    def delete_many(self, keys):
+        """
+        Removes many items from the cache, calling the shards in parallel.
+        :param keys: iterable of keys to remove.
+        :return: The number of items removed.
+        """
+        groups = self.ring.partition(keys)
+        if not self._parallel(groups):
+            return sum(self.shards[address].delete_many(group) for address, group in groups.items())
+        return sum(self._execute([(address, 'delete_many', (self.namespace, group))
+                                  for address, group in groups.items()]))
+
+    def invalidate(self):
+        """
+        Invalidates the namespace on every shard.
+        """
+        self._execute([(address, 'invalidate', (self.namespace,)) for address in self.shards])
+
+    def get_stats(self):
+        """
+        Retrieves the statistics of the namespace, summed over the shards (refer to `Namespace.get_stats`).
+        """
+        return merge_stats(self._execute([(address, 'get_stats', (self.namespace,)) for address in self.shards]))
+
+    def _parallel(self, groups):
+        """
+        :return: True if the shards of `groups` may be called in parallel: there are several of them, and none
+        serves reads locally (near cache or shared table), which pipelines would bypass.
+        """
+        if len(groups) < 2:
+            return False
+        for address in groups:
+            if self.shards[address].near is not None or self.shards[address].table is not None:
+                return False
+        return True
+
+    def _execute(self, calls):
+        """
+        Calls the shards in parallel.
+        :param calls: list of tuples (address, function, args).
+        :return: The list of the results, in the order of the calls.
+        """
+        pipelines = []
+        for address, function, args in calls:
+            pipeline = self.shards[address].client.pipeline()
+            getattr(pipeline, function)(*args)
+            pipelines.append(pipeline)
+        return [results[0] for results in execute_all(pipelines)]
+
+    def disconnect(self):
+        """
+        Disconnects from every shard.
+        """
+        for shard in self.shards.values():
+            shard.disconnect()
+
+
+def merge_stats(results):
+    """
+    Sums the statistics of a namespace on several servers (refer to `Namespace.get_stats`).
+    :param results: iterable of the results of `SharedCacheServer.get_stats`.
+    """
+    total = {}
+    for stats in results:
+        if stats == u'!___null___':
+            continue
+        for name, value in stats.items():
+            if name == 'evictions':
+                evictions = total.setdefault(name, {})
+                for policy, count in value.items():
+                    evictions[policy] = evictions.get(policy, 0) + count
+            elif name == 'policy':
+                total[name] = value
+            else:
+                total[name] = total.get(name, 0) + value
+    return total
+
+
+def _split(limit, parts):
+    if not limit:
+        return limit
+    return -(-limit // parts)
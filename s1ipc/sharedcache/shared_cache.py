@@ -1,4 +1,9 @@
+import pickle
 from s1ipc import BaseIPCClient
+from s1ipc.compression import pack_value, unpack_value
+from .eviction import check_policy
+from .near_cache import NearCache
+from .shared_table import SharedTable, key_bytes, PICKLE_PROTOCOL
 
 __author__ = 'salvia'
 
@@ -11,15 +16,65 @@ class SharedCache(object):
     """
 
     def __init__(self, namespace, max_items=100, global_expiry=60 * 5,
-                 autoclean=True, unlimited=False, address='/tmp/SharedCacheServer.sock'):
+                 autoclean=True, unlimited=False, address='/tmp/SharedCacheServer.sock', pool=None,
+                 direct_read=False, table_slots=4096, table_slot_size=1024, serializer=None, compression=None,
+                 compress_values=None, compress_threshold=8192, policy=None, max_bytes=None, near_cache=0,
+                 near_ttl=1.0):
         """
         Initializes a new SharedCache object, which is a client for the SharedCacheServer.
         For other parameters please refer to the `Namespace` Class.
-        :param address: The UNIX socket path which the server is listening.
+        :param address: The UNIX socket path which the server is listening, or its (host, port) TCP address, whose
+        authkey is then read from the S1IPC_AUTHKEY environment variable (or given to the clients of a `pool`).
+        :param pool: (optional) a `ClientPool` connected to the server. If given, the cache borrows connections
+        from it instead of opening its own (and `address` is ignored), which makes it safe to share between threads.
+        :param direct_read: (bool) Flag indicating that the namespace should be mirrored in a `SharedTable`, from which
+        this object reads hits directly, without calling the server, which must then run on the same host. Hits
+        served this way do not count in the namespace statistics. Keys must serialize identically in every process,
+        so clients and server must run the same python major version. Once the server shuts down, restarts or dies,
+        the table is dropped within `SharedTable.check_interval` seconds, and reads go to the server.
+        :param table_slots: (int) number of slots of the shared table, if it is created by this object.
+        :param table_slot_size: (int) size in bytes of each slot of the shared table, if it is created by this object;
+        larger entries are served by the server.
+        :param serializer: (optional) name of the serializer of calls and replies, or list of names in order of
+        preference (refer to `BaseIPCClient`). Ignored if `pool` is given, as the pool's clients decide.
+        :param compression: (optional) name of the codec compressing large calls and replies on the wire, or list of
+        names in order of preference (refer to `BaseIPCClient`). Ignored if `pool` is given.
+        :param compress_values: (optional) name of the codec compressing the values this object stores, which then
+        stay compressed at rest in the server and are only decompressed by the clients reading them. Any SharedCache
+        reads compressed values, whatever its own setting.
+        :param compress_threshold: (int) minimum serialized size in bytes of the values compressed by `compress_values`.
+        :param policy: (optional) name of the eviction policy of the namespace, which keeps its current policy (by
+        default 'lru') if None. Hits served by a shared table (refer to `direct_read`) are not seen by the policy.
+        :param max_bytes: (optional) byte budget of the namespace (refer to `Namespace`), unchanged if None.
+        :param near_cache: (int) if not 0, the number of values read from the server which are kept in this process
+        (refer to `NearCache`). Hits served this way do not count in the namespace statistics, and the returned
+        values are shared between callers, which must not mutate them.
+        :param near_ttl: (float) maximum time in seconds a value is kept in the near cache, which bounds how long a
+        value changed on the server may still be served.
+        :raise ValueError: if `policy` is not a known eviction policy.
         """
+        if policy is not None:
+            check_policy(policy)
         self.namespace = namespace
-        self.client = BaseIPCClient(address)
-        self.client.configure_namespace(namespace, max_items, global_expiry, autoclean, unlimited)
+        self.compress_values = compress_values
+        self.compress_threshold = compress_threshold
+        self._owns_client = pool is None
+        if pool is None:
+            self.client = BaseIPCClient(address, serializer=serializer, compression=compression)
+        else:
+            self.client = pool
+        self.client.configure_namespace(namespace, max_items, global_expiry, autoclean, unlimited, policy,
+                                        max_bytes)
+        self.table = None
+        if direct_read:
+            self.table = SharedTable(*self.client.shared_table(namespace, table_slots, table_slot_size))
+        self.near = None
+        if near_cache:
+            if pool is None:
+                self.near = NearCache(address, ('namespace', namespace), near_cache, near_ttl)
+            else:
+                self.near = NearCache(pool.address, ('namespace', namespace), near_cache, near_ttl,
+                                      pool.client_kwargs.get('authkey'))
 
     def __getitem__(self, item):
         """
@@ -29,10 +84,37 @@ class SharedCache(object):
         :return: The value for teh given key.
         :raise KeyError: If the item does not exist.
         """
+        if self.near is None:
+            return self._fetch(item)
+        found, value = self.near.get(item)
+        if found:
+            return value
+        token = self.near.token()
+        value = self._fetch(item)
+        self.near.put(item, value, token)
+        return value
+
+    def _direct(self):
+        """
+        :return: the shared table to read from, or None. A table abandoned by its server (refer to `SharedTable.stale`)
+        is dropped, and the server is asked from then on.
+        """
+        table = self.table
+        if table is not None and table.stale():
+            # left to be unmapped when collected, as other threads may be reading it
+            self.table = table = None
+        return table
+
+    def _fetch(self, item):
+        table = self._direct()
+        if table is not None:
+            vb = table.get(key_bytes(item))
+            if vb is not None:
+                return self._unpack(pickle.loads(vb))
         val = self.client.get(self.namespace, item)
         if val == u'!___null___':
             raise KeyError
-        return val
+        return self._unpack(val)
 
     def get(self, item):
         """
@@ -52,10 +134,151 @@ class SharedCache(object):
         :param key: The key of the item.
         :param value: The value of the Item.
         """
-        self.client.put(self.namespace, key, value)
+        if self.near is not None:
+            self.near.discard([key])
+        self.client.put(self.namespace, key, self._pack(value))
+
+    def get_many(self, keys):
+        """
+        Gets many items from the cache, in a single call to the server.
+        :param keys: iterable of keys to get.
+        :return: A dictionary holding the items found; keys not found are left out.
+        """
+        if self.near is None:
+            return self._fetch_many(list(keys))
+        near = {}
+        missing = []
+        for key in keys:
+            found, value = self.near.get(key)
+            if found:
+                near[key] = value
+            else:
+                missing.append(key)
+        token = self.near.token()
+        fetched = self._fetch_many(missing) if missing else {}
+        for key, value in fetched.items():
+            self.near.put(key, value, token)
+        fetched.update(near)
+        return fetched
+
+    def _fetch_many(self, keys):
+        table = self._direct()
+        if table is None:
+            return self._unpack_many(self.client.get_many(self.namespace, keys))
+        found = {}
+        missing = []
+        for key in keys:
+            vb = table.get(key_bytes(key))
+            if vb is None:
+                missing.append(key)
+            else:
+                found[key] = pickle.loads(vb)
+        if missing:
+            found.update(self.client.get_many(self.namespace, missing))
+        return self._unpack_many(found)
+
+    def set_many(self, mapping, expiry=(60 * 60 * 24)):
+        """
+        Sets many items into the cache, in a single call to the server.
+        :param mapping: dictionary of key-value pairs.
+        :param expiry: expiry in seconds for these items.
+        """
+        mapping = dict(mapping)
+        if self.near is not None:
+            self.near.discard(mapping)
+        if self.compress_values is not None:
+            mapping = dict((key, self._pack(value)) for key, value in mapping.items())
+        self.client.put_many(self.namespace, mapping, expiry)
+
+    def delete_many(self, keys):
+        """
+        Removes many items from the cache, in a single call to the server.
+        :param keys: iterable of keys to remove.
+        :return: The number of items removed.
+        """
+        keys = list(keys)
+        if self.near is not None:
+            self.near.discard(keys)
+        return self.client.delete_many(self.namespace, keys)
+
+    def get_or_lease(self, key, lease_timeout=60):
+        """
+        Gets an item from the cache or, if it is missing, a lease to compute it, so that a single client computes a
+        missing value while the others wait for it (refer to `Namespace.get_or_lease`).
+        :param key: The key to get.
+        :param lease_timeout: (float) seconds after which an unfilled lease is granted to another caller.
+        :return: A tuple ('hit', value), ('lease', token) if the caller must compute the value and store it with
+        `fill_lease` (or give the lease up with `release_lease`), or ('wait', None) if another caller holds the lease.
+        """
+        if self.near is not None:
+            found, value = self.near.get(key)
+            if found:
+                return 'hit', value
+            token = self.near.token()
+        status, value = self.client.get_or_lease(self.namespace, key, lease_timeout)
+        if status == 'hit':
+            value = self._unpack(value)
+            if self.near is not None:
+                self.near.put(key, value, token)
+        return status, value
+
+    def acquire_lease(self, key, lease_timeout=60):
+        """
+        Gets a lease on a key whether or not the item exists, e.g. to refresh a stale value from a single client.
+        :param key: The key of the item.
+        :param lease_timeout: (float) seconds after which an unfilled lease is granted to another caller.
+        :return: The token of the lease, to give to `fill_lease` or `release_lease`, or None if another caller
+        holds it.
+        """
+        return self.client.acquire_lease(self.namespace, key, lease_timeout)
+
+    def fill_lease(self, key, token, value, expiry=(60 * 60 * 24)):
+        """
+        Sets the item computed under a lease.
+        :param key: The key of the item.
+        :param token: The token returned by `get_or_lease`.
+        :param value: The value of the item.
+        :param expiry: expiry in seconds for this item.
+        :return: True if the item was set, False if the lease was lost meanwhile (the key was written or removed, or
+        the lease expired and was granted to another caller).
+        """
+        if self.near is not None:
+            self.near.discard([key])
+        return self.client.fill_lease(self.namespace, key, token, self._pack(value), expiry)
+
+    def release_lease(self, key, token):
+        """
+        Gives up a lease without setting the item, e.g. because computing it failed.
+        """
+        self.client.release_lease(self.namespace, key, token)
+
+    def _pack(self, value):
+        if self.compress_values is None:
+            return value
+        return pack_value(value, self.compress_values, self.compress_threshold, _dumps)
+
+    def _unpack(self, value):
+        return unpack_value(value, pickle.loads)
+
+    def _unpack_many(self, found):
+        for key, value in found.items():
+            found[key] = unpack_value(value, pickle.loads)
+        return found
 
     def disconnect(self):
         """
         Disconnects from the SharedCacheServer.
+        Connections borrowed from a pool are left to the pool.
         """
-        self.client.disconnect()
\ No newline at end of file
+        if self.table is not None:
+            self.table.close()
+            self.table = None
+        if self.near is not None:
+            self.near.close()
+            self.near = None
+        if self._owns_client:
+            self.client.disconnect()
+
+
+def _dumps(value):
+    return pickle.dumps(value, PICKLE_PROTOCOL)
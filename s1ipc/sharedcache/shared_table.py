@@ -0,0 +1,227 @@
+import errno
+import mmap
+import os
+import pickle
+import struct
+import time
+import zlib
+
+__author__ = 'salvia'
+
+
+# magic, version, slots, slot size, pid of the server, epoch (random, drawn when the file is created)
+_FILE_HEADER = struct.Struct('=4sIIIiQ')
+_MAGIC = b'S1TB'
+_VERSION = 2
+_SLOTS_OFFSET = 64
+
+# seq, state, key hash, key length, value length, deadline (0 means never)
+_SLOT_HEADER = struct.Struct('=IIIIId')
+_SLOT_DATA = 32
+
+_EMPTY = 0
+_USED = 1
+_DELETED = 2
+
+# pickle protocol understood by every supported interpreter, as keys must serialize identically in all processes
+PICKLE_PROTOCOL = 2
+
+
+def key_bytes(key):
+    """
+    Serializes a cache key into the bytes used to find it in a `SharedTable`.
+    """
+    if isinstance(key, bytes):
+        return b'b' + key
+    if isinstance(key, type(u'')):
+        return b'u' + key.encode('utf-8')
+    return b'p' + pickle.dumps(key, PICKLE_PROTOCOL)
+
+
+class SharedTable(object):
+    """
+    Open-addressing hash table in a memory-mapped file, mirroring the entries of a `Namespace` so that client
+    processes can read them directly, without a call to the server.
+
+    The table has a fixed number of fixed-size slots, found by linear probing (at most `max_probes` slots per key).
+    Every slot holds a sequence counter used as a seqlock: the server (the only writer, under the namespace lock)
+    makes it odd while writing the slot and even again when done, and readers retry a slot whose counter was odd or
+    changed while they copied it. Entries which do not fit a slot, or whose probe sequence is full, are simply not
+    mirrored: readers miss and fall back to asking the server.
+
+    A reader keeps its mapping when the server goes away, so it checks with `stale` that the table is still served
+    (every `check_interval` seconds): the file must still exist, be the one it mapped (the same inode and epoch, as a
+    new server may have created a table at the same path) and its server process must be alive.
+    """
+
+    max_probes = 16
+    read_retries = 32
+    check_interval = 1.0
+
+    def __init__(self, path, slots, slot_size, create=False):
+        """
+        Maps a table file.
+        :param path: (str) path of the file.
+        :param slots: (int) number of slots.
+        :param slot_size: (int) size in bytes of each slot, including its 32 bytes header.
+        :param create: (bool) Flag indicating the file must be created (or truncated) by this process.
+        """
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        size = _SLOTS_OFFSET + slots * slot_size
+        if create:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        else:
+            fd = os.open(path, os.O_RDWR)
+        try:
+            if create:
+                os.ftruncate(fd, size)
+            self.inode = os.fstat(fd).st_ino
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        if create:
+            self.pid = os.getpid()
+            self.epoch = struct.unpack('=Q', os.urandom(8))[0]
+            _FILE_HEADER.pack_into(self.mm, 0, _MAGIC, _VERSION, slots, slot_size, self.pid, self.epoch)
+        else:
+            magic, version, file_slots, file_slot_size, self.pid, self.epoch = _FILE_HEADER.unpack_from(self.mm, 0)
+            if (magic, version, file_slots, file_slot_size) != (_MAGIC, _VERSION, slots, slot_size):
+                raise ValueError('Not a shared table with this geometry: %s' % path)
+        self._next_check = time.time() + self.check_interval
+
+    def _offset(self, slot):
+        return _SLOTS_OFFSET + slot * self.slot_size
+
+    def _read_slot(self, slot):
+        """
+        Consistent copy of a slot, following the seqlock protocol.
+        :return: a tuple (slot header fields, slot bytes), or None if no stable copy could be made.
+        """
+        offset = self._offset(slot)
+        for i in range(self.read_retries):
+            seq = _SLOT_HEADER.unpack_from(self.mm, offset)[0]
+            if seq & 1:
+                continue
+            data = self.mm[offset:offset + self.slot_size]
+            if _SLOT_HEADER.unpack_from(self.mm, offset)[0] == seq:
+                return _SLOT_HEADER.unpack_from(data, 0), data
+        return None
+
+    def _find(self, kb, h):
+        """
+        Probes for a key (writer side).
+        :return: a tuple (slot holding the key or None, first reusable slot or None).
+        """
+        free = None
+        for i in range(self.max_probes):
+            slot = (h + i) % self.slots
+            offset = self._offset(slot)
+            seq, state, shash, klen, vlen, deadline = _SLOT_HEADER.unpack_from(self.mm, offset)
+            if state == _EMPTY:
+                return None, slot if free is None else free
+            if state == _DELETED:
+                if free is None:
+                    free = slot
+                continue
+            start = offset + _SLOT_DATA
+            if shash == h and klen == len(kb) and self.mm[start:start + klen] == kb:
+                return slot, free
+        return None, free
+
+    def _write_slot(self, slot, state, h, kb, vb, deadline):
+        offset = self._offset(slot)
+        seq = _SLOT_HEADER.unpack_from(self.mm, offset)[0]
+        _SLOT_HEADER.pack_into(self.mm, offset, (seq + 1) & 0xffffffff, _DELETED, 0, 0, 0, 0.0)
+        if state == _USED:
+            start = offset + _SLOT_DATA
+            self.mm[start:start + len(kb) + len(vb)] = kb + vb
+        _SLOT_HEADER.pack_into(self.mm, offset, (seq + 2) & 0xffffffff, state, h, len(kb), len(vb), deadline)
+
+    def put(self, kb, vb, deadline):
+        """
+        Stores an entry (writer side).
+        :param kb: key bytes, as returned by `key_bytes`.
+        :param vb: serialized value.
+        :param deadline: (float) absolute time at which the entry expires, 0 for never.
+        :return: True if the entry was mirrored, False if it did not fit.
+        """
+        h = zlib.crc32(kb) & 0xffffffff
+        slot, free = self._find(kb, h)
+        if _SLOT_DATA + len(kb) + len(vb) > self.slot_size:
+            if slot is not None:
+                self._write_slot(slot, _DELETED, 0, b'', b'', 0.0)
+            return False
+        if slot is None:
+            slot = free
+        if slot is None:
+            return False
+        self._write_slot(slot, _USED, h, kb, vb, deadline)
+        return True
+
+    def delete(self, kb):
+        """
+        Removes an entry (writer side).
+        """
+        h = zlib.crc32(kb) & 0xffffffff
+        slot, free = self._find(kb, h)
+        if slot is not None:
+            self._write_slot(slot, _DELETED, 0, b'', b'', 0.0)
+
+    def clear(self):
+        """
+        Removes every entry (writer side).
+        """
+        for slot in range(self.slots):
+            if _SLOT_HEADER.unpack_from(self.mm, self._offset(slot))[1] != _EMPTY:
+                self._write_slot(slot, _EMPTY, 0, b'', b'', 0.0)
+
+    def get(self, kb):
+        """
+        Looks an entry up (reader side).
+        :param kb: key bytes, as returned by `key_bytes`.
+        :return: the serialized value, or None if the entry is not in the table or expired.
+        """
+        h = zlib.crc32(kb) & 0xffffffff
+        for i in range(self.max_probes):
+            copy = self._read_slot((h + i) % self.slots)
+            if copy is None:
+                return None
+            (seq, state, shash, klen, vlen, deadline), data = copy
+            if state == _EMPTY:
+                return None
+            if state != _USED or shash != h or klen != len(kb) or data[_SLOT_DATA:_SLOT_DATA + klen] != kb:
+                continue
+            if deadline and time.time() >= deadline:
+                return None
+            return data[_SLOT_DATA + klen:_SLOT_DATA + klen + vlen]
+        return None
+
+    def stale(self):
+        """
+        Checks that the table is still served by its server (reader side), at most every `check_interval` seconds.
+        :return: True if the table was abandoned: it was removed or replaced, or its server process died. Its entries
+        may then be out of date forever, so readers must ask the server instead.
+        """
+        now = time.time()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        try:
+            if os.stat(self.path).st_ino != self.inode:
+                return True
+        except OSError:
+            return True
+        return _FILE_HEADER.unpack_from(self.mm, 0)[5] != self.epoch or not _alive(self.pid)
+
+    def close(self):
+        self.mm.close()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
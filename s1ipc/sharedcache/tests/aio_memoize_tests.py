@@ -0,0 +1,122 @@
+# coding=utf-8
+import time
+import unittest
+from unittest import TestCase
+from .. import SharedCacheServer, Memoize
+
+try:
+    import asyncio
+    from s1ipc.aioclient import then
+    from ..aio_memoize import AsyncMemoize, AsyncLocalMemoize, _async_caches
+except ImportError:
+    asyncio = None
+
+__author__ = 'salvia'
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is not available')
+class AsyncMemoizeTests(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_shared(self):
+        server = SharedCacheServer()
+        try:
+            calls = []
+
+            @AsyncMemoize('aio', 60)
+            def double(x):
+                calls.append(x)
+                return then(asyncio.ensure_future(asyncio.sleep(0.05)), lambda _: x * 2)
+
+            # concurrent callers share a single call
+            results = self.loop.run_until_complete(asyncio.gather(*[double(21) for i in range(5)]))
+            assert results == [42] * 5
+            assert calls == [21]
+            assert self.loop.run_until_complete(double(21)) == 42
+            assert calls == [21]
+            stats = self.loop.run_until_complete(double.get_stats())
+            assert stats['gets'] == 2 and stats['hits'] == 1 and stats['puts'] == 1
+            double.disconnect()
+
+            # synchronous memoizers of the same function share the results
+            @Memoize('aio', 60)
+            def double(x):
+                return -1
+
+            assert double(21) == 42
+            double.remove_local_namespaces()
+        finally:
+            server.shutdown()
+
+    def test_closed_loops(self):
+        server = SharedCacheServer()
+        try:
+            @AsyncMemoize('aio_loops', 60)
+            def double(x):
+                return then(asyncio.ensure_future(asyncio.sleep(0)), lambda _: x * 2)
+
+            closed = asyncio.new_event_loop()
+            asyncio.set_event_loop(closed)
+            assert closed.run_until_complete(double(1)) == 2
+            closed.close()
+            asyncio.set_event_loop(self.loop)
+            assert self.loop.run_until_complete(double(1)) == 2
+            # the cache of the closed loop is no longer referenced
+            assert [key[1] for key in _async_caches if key[0] == 'aio_loops'] == [self.loop]
+            double.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_stale_while_revalidate(self):
+        server = SharedCacheServer()
+        try:
+            calls = []
+
+            @AsyncMemoize('aio_swr', soft_ttl=0.1, hard_ttl=60)
+            def pair():
+                calls.append(None)
+                return then(asyncio.ensure_future(asyncio.sleep(0)), lambda _: (len(calls), 'pair'))
+
+            assert self.loop.run_until_complete(pair()) == (1, 'pair')
+            assert self.loop.run_until_complete(pair()) == (1, 'pair')
+            time.sleep(0.15)
+            # the stale result is returned at once, and refreshed by a task of the loop
+            assert self.loop.run_until_complete(pair()) == (1, 'pair')
+            self.loop.run_until_complete(asyncio.sleep(0.1))
+            assert self.loop.run_until_complete(pair()) == (2, 'pair')
+            assert len(calls) == 2
+            pair.disconnect()
+
+            # memoizers of the namespace without a soft TTL return the result, not its cached form
+            @Memoize('aio_swr', 60)
+            def pair():
+                return None
+
+            assert pair() == (2, 'pair')
+            pair.remove_local_namespaces()
+        finally:
+            server.shutdown()
+
+    def test_local(self):
+        calls = []
+
+        @AsyncLocalMemoize('aio', 60)
+        def double(x):
+            calls.append(x)
+            return then(asyncio.ensure_future(asyncio.sleep(0.05)), lambda _: x * 2)
+
+        results = self.loop.run_until_complete(asyncio.gather(double(1), double(1), double(2)))
+        assert results == [2, 2, 4]
+        assert self.loop.run_until_complete(double(1)) == 2
+        assert calls == [1, 2]
+
+
+if __name__ == '__main__':
+    unittest.main()
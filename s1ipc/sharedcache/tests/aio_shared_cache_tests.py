@@ -0,0 +1,40 @@
+# coding=utf-8
+import unittest
+from unittest import TestCase
+from .. import SharedCacheServer
+
+try:
+    import asyncio
+    from ..aio_shared_cache import AsyncSharedCache
+except ImportError:
+    asyncio = None
+
+__author__ = 'salvia'
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is not available')
+class AsyncSharedCacheTests(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_simple_call(self):
+        server = SharedCacheServer()
+        try:
+            cache = self.loop.run_until_complete(AsyncSharedCache('test', loop=self.loop).connect())
+            self.loop.run_until_complete(asyncio.gather(*[cache.set('k%d' % i, i) for i in range(100)]))
+
+            values = self.loop.run_until_complete(asyncio.gather(*[cache.get('k%d' % i) for i in range(100)]))
+            assert values == list(range(100))
+            assert self.loop.run_until_complete(cache.get('missing')) is None
+            self.assertRaises(KeyError, self.loop.run_until_complete, cache['missing'])
+            cache.disconnect()
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
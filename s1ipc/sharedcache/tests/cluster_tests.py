@@ -0,0 +1,60 @@
+# coding=utf-8
+import unittest
+from unittest import TestCase
+from .. import SharedCacheServer, ShardedSharedCacheServer, ClusterSharedCache
+
+__author__ = 'salvia'
+
+
+class ClusterTests(TestCase):
+
+    def test_cluster(self):
+        servers = [SharedCacheServer(('127.0.0.1', 0), authkey=b'secret') for i in range(3)]
+        try:
+            cache = ClusterSharedCache('test', [server.address for server in servers], max_items=0,
+                                       retry_interval=60, authkey=b'secret')
+            mapping = dict(('k%d' % i, i) for i in range(100))
+            cache.set_many(mapping)
+            assert cache.get_many(list(mapping) + ['missing']) == mapping
+            assert cache['k1'] == 1 and cache.get('missing') is None
+            assert cache.get_stats()['puts'] == 100
+
+            down = servers.pop()
+            down.shutdown()
+            # the keys of the node down are misses, the others are still served
+            kept = dict((key, value) for key, value in mapping.items() if cache.node(key) != down.address)
+            assert 0 < len(kept) < 100
+            assert cache.get_many(mapping) == kept
+            lost = next(key for key in mapping if key not in kept)
+            assert cache.get(lost) is None
+            cache[lost] = 1
+            assert cache.get_or_lease(lost) == ('lease', None)
+            assert cache.delete_many(mapping) == len(kept)
+            # only the nodes up are counted
+            assert cache.get_stats()['puts'] == len(kept)
+            cache.disconnect()
+        finally:
+            for server in servers:
+                server.shutdown()
+
+    def test_by_namespace(self):
+        server = ShardedSharedCacheServer(('127.0.0.1', 0), shards=2, authkey=b'secret')
+        try:
+            caches = [ClusterSharedCache('ns%d' % i, server.addresses, by='namespace', authkey=b'secret')
+                      for i in range(10)]
+            for cache in caches:
+                cache.set_many({'a': cache.namespace, 'b': 2})
+                assert cache['a'] == cache.namespace
+            # every namespace lives on a single node
+            for cache in caches:
+                assert cache.get_stats()['puts'] == 2
+                assert len(set(cache.node(key) for key in 'abcdef')) == 1
+            assert len(set(cache.node(None) for cache in caches)) == 2
+            for cache in caches:
+                cache.disconnect()
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
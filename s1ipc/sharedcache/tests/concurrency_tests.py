@@ -0,0 +1,115 @@
+# coding=utf-8
+import threading
+import unittest
+from unittest import TestCase
+from .. import SharedCacheServer
+from ..server import Namespace, _cache
+
+__author__ = 'salvia'
+
+
+def run_threads(target, count=8):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+class ConcurrencyTests(TestCase):
+
+    def test_concurrent_puts(self):
+        ns = Namespace('test', max_items=50, policy='lru')
+
+        def work(n):
+            for i in range(500):
+                ns['k%d-%d' % (n, i)] = (i, 60)
+                ns['k%d-%d' % (n, i // 2)] = (i, 60)
+                try:
+                    ns['k%d-%d' % (n, i // 4)]
+                except KeyError:
+                    pass
+
+        run_threads(work)
+        objects = ns.objects
+        stats = ns.get_stats()
+        assert len(objects) == len(ns) == 50
+        assert ns.bytes == sum(value.size for value in objects.values())
+        assert stats['puts'] == 8000
+        assert stats['gets'] == 4000
+        # the policy knows exactly the keys stored
+        assert sorted(ns.policy.order) == sorted(objects)
+        ns.delete_many(list(objects))
+        assert len(ns) == 0 and ns.bytes == 0
+
+    def test_eviction_locks(self):
+        ns = Namespace('test', max_items=2, policy='lru')
+        ns['a'] = (1, 60)
+        ns['b'] = (2, 60)
+        key = next('k%d' % i for i in range(100) if ns._segment('k%d' % i) is not ns._segment('a'))
+        # a put on the full namespace evicts 'a' without waiting for the lock of its segment
+        done = threading.Event()
+        with ns._segment('a').lock:
+            thread = threading.Thread(target=lambda: (ns.__setitem__(key, (3, 60)), done.set()))
+            thread.start()
+            assert done.wait(5)
+        thread.join()
+        assert sorted(ns.objects) == sorted(['b', key])
+        assert ns.get_stats()['evictions'] == {'lru': 1}
+
+    def test_eviction_during_compaction(self):
+        ns = Namespace('test', max_items=3, policy='fifo')
+        ns['a'] = (1, 60)
+        segment = ns._segment('a')
+        for key in [key for key in ('k%d' % i for i in range(100)) if ns._segment(key) is not segment][:2]:
+            ns[key] = (2, 60)
+        sequence = ns._sequence
+        evicted = []
+
+        def evicting():
+            for n in sequence:
+                if not evicted:
+                    # a put on another segment evicts 'a' (the oldest item) while the heap of its segment is rebuilt
+                    thread = threading.Thread(target=lambda: evicted.append(ns.evict()))
+                    thread.start()
+                    thread.join()
+                yield n
+
+        ns._sequence = evicting()
+        with segment.lock:
+            ns._reschedule(segment)
+        assert evicted == [True]
+        assert 'a' not in ns.objects and len(ns) == 2
+
+    def test_concurrent_leases(self):
+        ns = Namespace('test', max_items=0)
+        granted = []
+
+        def work(n):
+            for i in range(100):
+                status, token = ns.get_or_lease(i, 60)
+                if status == 'lease':
+                    granted.append(i)
+                    assert ns.fill_lease(i, token, n)
+
+        run_threads(work)
+        # every key was leased to a single thread
+        assert sorted(granted) == list(range(100))
+        assert ns.get_stats()['leases'] == 100
+        assert ns.leases == {}
+
+    def test_concurrent_namespace_creation(self):
+        def work(n):
+            for i in range(100):
+                SharedCacheServer.put('race', (n, i), i)
+
+        try:
+            run_threads(work)
+            # no put was lost in a namespace replaced by another thread
+            assert _cache['race'].get_stats()['puts'] == 800
+        finally:
+            _cache.pop('race', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# coding=utf-8
+import unittest
+from unittest import TestCase
+from .. import SharedCacheServer, SharedCache
+from ..eviction import FrequencySketch
+from ..server import Namespace
+
+__author__ = 'salvia'
+
+
+class EvictionTests(TestCase):
+
+    def fill(self, policy, max_items=3):
+        ns = Namespace('test', max_items=max_items, policy=policy)
+        for key in 'abc':
+            ns[key] = (key, 60)
+        return ns
+
+    def test_fifo(self):
+        ns = self.fill('fifo')
+        ns['a']
+        ns['d'] = ('d', 60)
+        assert sorted(ns.objects) == ['b', 'c', 'd']
+        assert ns.get_stats()['evictions'] == {'fifo': 1}
+
+    def test_lru(self):
+        ns = self.fill('lru')
+        ns['a']
+        ns.get_many(['b'])
+        ns['d'] = ('d', 60)
+        assert sorted(ns.objects) == ['a', 'b', 'd']
+        ns['e'] = ('e', 60)
+        assert sorted(ns.objects) == ['b', 'd', 'e']
+
+    def test_lfu(self):
+        ns = self.fill('lfu')
+        for i in range(3):
+            ns['a']
+        ns['c']
+        ns['d'] = ('d', 60)
+        assert sorted(ns.objects) == ['a', 'c', 'd']
+        ns['d']
+        ns['d']
+        ns['e'] = ('e', 60)
+        assert sorted(ns.objects) == ['a', 'd', 'e']
+        ns.delete_many(['a', 'd', 'e'])
+        ns['f'] = ('f', 60)
+        assert sorted(ns.objects) == ['f']
+
+    def test_tinylfu_admission(self):
+        ns = Namespace('test', max_items=100, policy='tinylfu')
+        hot = ['hot%d' % i for i in range(50)]
+        for key in hot:
+            ns[key] = (key, 60)
+            for i in range(5):
+                ns[key]
+        # a scan of one-hit keys does not push the popular keys out (frequencies are estimated, hence the margin)
+        for i in range(1000):
+            ns['scan%d' % i] = (i, 60)
+        assert len(ns.objects) == 100
+        assert sum(key in ns.objects for key in hot) >= 45
+        assert ns.get_stats()['evictions']['tinylfu'] == 950
+
+    def test_sketch_aging(self):
+        sketch = FrequencySketch(16)
+        for i in range(12):
+            sketch.increment('a')
+        assert sketch.frequency('a') == 12
+        sketch.additions = sketch.sample_size - 1
+        sketch.increment('b')
+        # the counters were halved once the sample was full
+        assert sketch.frequency('a') == 6
+        assert sketch.additions == sketch.sample_size // 2
+        assert all(isinstance(row, bytearray) and max(row) <= 15 for row in sketch.rows)
+
+    def test_max_bytes(self):
+        ns = Namespace('test', max_items=0, max_bytes=10000, policy='lru')
+        for i in range(10):
+            ns['k%d' % i] = ('v' * 1000, 60)
+        stats = ns.get_stats()
+        assert stats['bytes'] <= 10000
+        assert sorted(ns.objects) == ['k%d' % i for i in range(1, 10)]
+        # overwrites replace the size of the old value, and values larger than the budget are not stored
+        ns['k9'] = ('v', 60)
+        assert ns.bytes == stats['bytes'] - 999
+        ns['huge'] = ('v' * 20000, 60)
+        assert 'huge' not in ns.objects
+        ns.delete_many(list(ns.objects))
+        assert ns.bytes == 0
+        assert ns.get_stats()['peak_bytes'] == stats['bytes']
+
+    def test_server_budget(self):
+        server = SharedCacheServer(max_bytes=50000)
+        try:
+            big = SharedCache('big', max_items=0)
+            small = SharedCache('small', max_items=0, max_bytes=5000)
+            for i in range(100):
+                big['k%d' % i] = 'v' * 1000
+                small['k%d' % i] = 's' * 100
+            stats = big.client.server_stats()
+            assert stats['bytes'] <= 50000
+            assert stats['namespaces'] == 2
+            assert big.client.get_stats('small')['bytes'] <= 5000
+            assert big.get('k99') == 'v' * 1000 and big.get('k0') is None
+            big.client.configure_namespace('big', max_bytes=10000)
+            assert big.client.get_stats('big')['bytes'] <= 10000
+            big.disconnect()
+            small.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_set_policy(self):
+        server = SharedCacheServer()
+        try:
+            cache = SharedCache('test', max_items=2, policy='fifo')
+            assert cache.client.get_stats('test')['policy'] == 'fifo'
+            cache['a'], cache['b'] = 1, 2
+            other = SharedCache('test', max_items=2, policy='lru')
+            assert other['a'] == 1
+            other['c'] = 3
+            assert cache.get_many(['a', 'b', 'c']) == {'a': 1, 'c': 3}
+            stats = cache.client.get_stats('test')
+            assert stats['policy'] == 'lru'
+            assert stats['evictions'] == {'lru': 1}
+            self.assertRaises(ValueError, SharedCache, 'test', policy='no-such-policy')
+            cache.disconnect()
+            other.disconnect()
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
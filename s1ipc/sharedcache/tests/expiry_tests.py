@@ -0,0 +1,93 @@
+# coding=utf-8
+import gc
+import time
+import unittest
+import weakref
+from unittest import TestCase
+from .. import SharedCacheServer, SharedCache
+from ..server import Namespace, _Reaper
+
+__author__ = 'salvia'
+
+
+class _Blob(object):
+    pass
+
+
+class ExpiryTests(TestCase):
+
+    def test_expire(self):
+        ns = Namespace('test', max_items=0, global_expiry=100)
+        now = time.time()
+        for i in range(10):
+            ns['k%d' % i] = ('v', i + 1)
+        # overwritten items keep a stale heap entry, which must not remove the new value
+        ns['k0'] = ('v', 50)
+        assert ns.expire(now + 0.5) == 0
+        assert ns.expire(now + 5.5) == 4
+        assert sorted(ns.objects) == ['k0'] + ['k%d' % i for i in range(5, 10)]
+        assert ns.expire(now + 30) == 5
+        assert list(ns.objects) == ['k0']
+        assert ns.bytes == ns.objects['k0'].size
+
+    def test_heap_releases_values(self):
+        ns = Namespace('test', max_items=2, global_expiry=100)
+        blobs = [_Blob() for _ in range(3)]
+        refs = list(map(weakref.ref, blobs))
+        ns['a'] = (blobs[0], 50)
+        ns['b'] = (blobs[1], 50)
+        ns['a'] = ('v', 50)
+        ns['c'] = (blobs[2], 50)
+        ns.delete_many(['c'])
+        del blobs[:]
+        gc.collect()
+        # the expiry heaps only keep keys: overwritten, evicted and removed values are freed at once
+        assert [ref() for ref in refs] == [None, None, None]
+        assert all(len(entry) == 3 for segment in ns.segments for entry in segment.deadlines)
+
+    def test_expire_compacts(self):
+        ns = Namespace('test', max_items=0, global_expiry=100)
+        for i in range(1000):
+            ns['k%d' % i] = ('v', 50)
+        for i in range(1000):
+            ns.delete_many(['k%d' % i])
+        ns.expire()
+        assert sum(len(segment.deadlines) for segment in ns.segments) <= 64 * len(ns.segments)
+
+    def test_reschedule(self):
+        ns = Namespace('test', max_items=0, global_expiry=100)
+        now = time.time()
+        ns['a'] = ('v', 1000)
+        assert ns.expire(now + 50) == 0
+        ns.global_expiry = 10
+        ns.reschedule()
+        assert ns.expire(now + 50) == 1
+
+    def test_puts_expire(self):
+        ns = Namespace('test', max_items=0, global_expiry=100)
+        for i in range(10):
+            ns['k%d' % i] = ('v', 0)
+        # every put removes a few of the due items
+        assert len(ns.objects) < 10
+
+    def test_reaper(self):
+        interval = _Reaper.interval
+        _Reaper.interval = 0.05
+        server = SharedCacheServer()
+        try:
+            cache = SharedCache('test', max_items=0)
+            cache.set_many({'a': 1, 'b': 2}, expiry=0.1)
+            cache['c'] = 3
+            time.sleep(0.5)
+            # removed by the reaper, without being read
+            stats = cache.client.get_stats('test')
+            assert stats['gets'] == 0 and 0 < stats['bytes'] < stats['peak_bytes']
+            assert cache.get_many(['a', 'b', 'c']) == {'c': 3}
+            cache.disconnect()
+        finally:
+            _Reaper.interval = interval
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
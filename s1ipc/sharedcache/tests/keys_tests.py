@@ -0,0 +1,63 @@
+# coding=utf-8
+import unittest
+from unittest import TestCase
+from .. import SharedCacheServer, Memoize, KeyBuilder
+
+__author__ = 'salvia'
+
+
+def fun(*args, **kwargs):
+    return args, sorted(kwargs.items())
+
+
+class KeyTests(TestCase):
+
+    def keys(self, builder, calls):
+        prefix = builder.prefix(fun)
+        return [builder.build(prefix, args, kwargs) for args, kwargs in calls]
+
+    def test_keys(self):
+        builder = KeyBuilder()
+        calls = [((1,), {}), ((1.0,), {}), ((True,), {}), ((u'1',), {}), ((b'1',), {}), ((None,), {}),
+                 ((1, 2), {}), ((12,), {}), ((), {'a': 1}), (([1],), {}), ((u'\xe9',), {})]
+        keys = self.keys(builder, calls)
+        assert len(set(keys)) == len(calls)
+        assert keys[0].startswith(builder.prefix(fun))
+        # keyword arguments are ordered by name
+        assert self.keys(builder, [((1,), {'a': 1, 'b': [2]}), ((1,), {'b': [2], 'a': 1})])[0] == \
+            self.keys(builder, [((1,), {'b': [2], 'a': 1})])[0]
+        assert keys == self.keys(KeyBuilder(), calls)
+
+    def test_digest(self):
+        calls = [((i,), {'x': 'y'}) for i in range(100)]
+        for digest in ('blake2b', 'md5'):
+            keys = self.keys(KeyBuilder(digest), calls)
+            assert len(set(keys)) == 100
+            assert set(len(key) for key in keys) == set([16])
+            # the prefix is fed to a copy of the hash for every key
+            assert keys == self.keys(KeyBuilder(digest), calls)
+        self.assertRaises(ValueError, KeyBuilder, 'sha0')
+
+    def test_memoize(self):
+        server = SharedCacheServer()
+        try:
+            calls = []
+
+            @Memoize('keys', 60, key_builder=KeyBuilder('blake2b'))
+            def add(a, b=0):
+                calls.append((a, b))
+                return a + b
+
+            assert add(1, b=2) == 3
+            assert add(1, b=2) == 3
+            assert add(2) == 2
+            assert calls == [(1, 2), (2, 0)]
+            assert add.get_stats()['hits'] == 1
+            add.disconnect()
+            add.remove_local_namespaces()
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
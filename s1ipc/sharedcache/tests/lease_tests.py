@@ -0,0 +1,115 @@
+# coding=utf-8
+from multiprocessing import Process, Value
+import threading
+import time
+import unittest
+from unittest import TestCase
+from .. import SharedCacheServer, SharedCache, Memoize
+from ..server import Namespace
+
+__author__ = 'salvia'
+
+
+class LeaseTests(TestCase):
+
+    def test_namespace_leases(self):
+        ns = Namespace('test', max_items=0)
+        status, token = ns.get_or_lease('a', 60)
+        assert status == 'lease'
+        assert ns.get_or_lease('a', 60) == ('wait', None)
+        assert ns.fill_lease('a', token, 1)
+        assert ns.get_or_lease('a', 60) == ('hit', 1)
+        # a removal revokes the lease: the value computed before it is dropped
+        ns.delete_many(['a'])
+        status, token = ns.get_or_lease('a', 60)
+        ns.delete_many(['a'])
+        assert not ns.fill_lease('a', token, 2)
+        # an expired lease is granted to the next caller, and the former holder can no longer fill it
+        status, token = ns.get_or_lease('b', 0)
+        status, other = ns.get_or_lease('b', 60)
+        assert status == 'lease' and other != token
+        assert not ns.fill_lease('b', token, 1)
+        ns.release_lease('b', other)
+        assert ns.get_or_lease('b', 60)[0] == 'lease'
+        assert ns.get_stats()['leases'] == 5
+        ns.expire(time.time() + 2 * ns.lease_retention)
+        assert ns.leases == {}
+
+    def test_single_flight(self):
+        server = SharedCacheServer()
+        try:
+            calls = Value('i', 0)
+
+            @Memoize('lease', 60)
+            def slow(x):
+                with calls.get_lock():
+                    calls.value += 1
+                time.sleep(0.3)
+                return x * 2
+
+            # the namespace is created before the processes race for it
+            slow.get_stats()
+
+            def call():
+                assert slow(21) == 42
+
+            processes = [Process(target=call) for i in range(4)]
+            for p in processes:
+                p.start()
+            for p in processes:
+                p.join()
+                assert p.exitcode == 0
+            assert calls.value == 1
+            assert slow(21) == 42
+            assert calls.value == 1
+            stats = slow.get_stats()
+            assert stats['puts'] == 1 and stats['leases'] == 1
+            slow.remove_local_namespaces()
+        finally:
+            server.shutdown()
+
+    def test_failure_releases_lease(self):
+        server = SharedCacheServer()
+        try:
+            cache = SharedCache('lease')
+
+            @Memoize('lease', 60, lease_wait=0.1)
+            def failing():
+                raise ValueError()
+
+            self.assertRaises(ValueError, failing)
+            assert cache.client.get_stats('lease')['leases'] == 1
+            self.assertRaises(ValueError, failing)
+            # the second call got a lease at once, instead of waiting for the first one
+            assert cache.client.get_stats('lease')['leases'] == 2
+            failing.remove_local_namespaces()
+            cache.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_default_memoize(self):
+        server = SharedCacheServer()
+        try:
+            # results expire at once by default: concurrent callers must not wait for each other's lease
+            @Memoize('lease')
+            def slow(x):
+                time.sleep(0.3)
+                return x * 2
+
+            assert slow.memo.lease_timeout == 0
+            assert slow(1) == 2
+            threads = [threading.Thread(target=slow, args=(21,)) for i in range(4)]
+            start = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert time.time() - start < 0.9
+            assert slow.get_stats()['leases'] == 0
+            slow.remove_local_namespaces()
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
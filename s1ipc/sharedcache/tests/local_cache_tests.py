@@ -2,7 +2,8 @@
 from multiprocessing import Process
 import unittest
 from unittest import TestCase
-from .. import SharedCacheServer, SharedCache
+from .. import SharedCacheServer, EventLoopSharedCacheServer, SharedCache
+from ...compression import Compressed
 
 __author__ = 'matheus2740'
 
@@ -39,6 +40,75 @@ class LocalCacheTests(TestCase):
         p.join()
         server.shutdown()
 
+    def test_large_value(self):
+        server = SharedCacheServer()
+        try:
+            cache = SharedCache('test')
+            value = 'v' * (4 * 1024 * 1024)
+            cache['large'] = value
+            assert cache['large'] == value
+        finally:
+            server.shutdown()
+
+    def test_bulk_operations(self):
+        server = SharedCacheServer()
+        try:
+            cache = SharedCache('test', max_items=1000)
+            cache.set_many(dict(('k%d' % i, i) for i in range(500)))
+
+            found = cache.get_many(['k%d' % i for i in range(400, 600)])
+            assert found == dict(('k%d' % i, i) for i in range(400, 500))
+
+            assert cache.delete_many(['k%d' % i for i in range(450, 550)]) == 50
+            assert cache.get_many(['k449', 'k450']) == {'k449': 449}
+
+            stats = cache.client.get_stats('test')
+            assert stats['puts'] == 500
+            assert stats['gets'] == 202
+            assert stats['hits'] == 101
+            cache.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_event_loop_server(self):
+        server = EventLoopSharedCacheServer()
+        try:
+            cache = SharedCache('test')
+            cache['testk'] = 'testv'
+            assert cache['testk'] == 'testv'
+            assert cache.get('missing') is None
+            cache.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_serializer(self):
+        server = SharedCacheServer()
+        try:
+            cache = SharedCache('test', serializer='marshal')
+            assert cache.client.serializer.name == 'marshal'
+            cache['testk'] = {'a': [1, 2.5, 'x']}
+            assert cache['testk'] == {'a': [1, 2.5, 'x']}
+            cache.set_many({'k1': 1, 'k2': 2})
+            assert cache.get_many(['k1', 'k2', 'k3']) == {'k1': 1, 'k2': 2}
+            cache.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_compressed_values(self):
+        server = SharedCacheServer()
+        try:
+            cache = SharedCache('test', compress_values='zlib', compression='zlib')
+            value = '<div>fragment</div>' * 5000
+            cache['large'] = value
+            cache.set_many({'k1': value, 'k2': 'small'})
+            assert isinstance(cache.client.get('test', 'large'), Compressed)
+            assert cache.client.get('test', 'k2') == 'small'
+            assert cache['large'] == value
+            assert cache.get_many(['k1', 'k2']) == {'k1': value, 'k2': 'small'}
+            cache.disconnect()
+        finally:
+            server.shutdown()
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -50,6 +50,31 @@ class MemoizeTests(TestCase):
         #time.sleep(0.5)
         server.shutdown()
 
+    def test_stale_while_revalidate(self):
+        server = SharedCacheServer()
+        try:
+            calls = []
+
+            @Memoize('swr', soft_ttl=0.1, hard_ttl=60)
+            def counter():
+                calls.append(None)
+                return len(calls)
+
+            assert counter() == 1
+            assert counter() == 1
+            time.sleep(0.15)
+            # the stale result is returned at once, and refreshed in the background
+            assert counter() == 1
+            deadline = time.time() + 2
+            while counter() != 2 and time.time() < deadline:
+                time.sleep(0.01)
+            assert counter() == 2
+            assert len(calls) == 2
+            assert Memoize('swr', 10, refresh_ahead=0.8).soft_ttl == 8
+            counter.remove_local_namespaces()
+        finally:
+            server.shutdown()
+
 
 @Memoize('test', 60)
 def fun(*args):
@@ -0,0 +1,85 @@
+# coding=utf-8
+import time
+import unittest
+from unittest import TestCase
+from s1ipc import Subscription
+from .. import SharedCacheServer, EventLoopSharedCacheServer, SharedCache
+
+__author__ = 'salvia'
+
+
+def eventually(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class NearCacheTests(TestCase):
+
+    def test_invalidation(self):
+        for server_class in (SharedCacheServer, EventLoopSharedCacheServer):
+            server = server_class()
+            try:
+                cache = SharedCache('near', near_cache=100, near_ttl=60)
+                writer = SharedCache('near')
+                writer['a'], writer['b'] = 1, 2
+                assert cache['a'] == 1
+                assert cache.get_many(['a', 'b', 'c']) == {'a': 1, 'b': 2}
+                assert cache['a'] == 1
+                # only the first reads of each key reached the server
+                assert writer.client.get_stats('near')['gets'] == 3
+                assert cache.near.hits == 2
+
+                writer['a'] = 10
+                assert eventually(lambda: cache['a'] == 10)
+                writer.delete_many(['b'])
+                assert eventually(lambda: cache.get('b') is None)
+                cache['c'] = 3
+                writer.client.invalidate('near')
+                assert eventually(lambda: cache.get('a') is None)
+                cache.disconnect()
+                writer.disconnect()
+            finally:
+                server.shutdown()
+
+    def test_batch_events(self):
+        for server_class in (SharedCacheServer, EventLoopSharedCacheServer):
+            server = server_class()
+            try:
+                events = []
+                cache = SharedCache('near', max_items=0)
+                keys = ['k%d' % i for i in range(70000)]
+                cache.set_many(dict.fromkeys(keys, 1))
+                subscription = Subscription(server.address, ('namespace', 'near'), events.append)
+                # a single event for the whole batch, however many keys it overwrites
+                cache.set_many(dict.fromkeys(keys, 2))
+                cache.delete_many(keys[:10])
+                assert eventually(lambda: len(events) == 2)
+                assert sorted(events[0][1]) == sorted(keys) and sorted(events[1][1]) == sorted(keys[:10])
+                subscription.close()
+                cache.disconnect()
+            finally:
+                server.shutdown()
+
+    def test_ttl(self):
+        server = SharedCacheServer()
+        try:
+            cache = SharedCache('near', near_cache=1, near_ttl=0.05)
+            cache['a'], cache['b'] = 1, 2
+            assert cache['a'] == 1 and cache['b'] == 2
+            # 'a' was pushed out by 'b'
+            assert cache['a'] == 1
+            assert cache.near.hits == 0
+            time.sleep(0.1)
+            assert cache['a'] == 1
+            assert cache.near.hits == 0
+            cache.disconnect()
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# coding=utf-8
+import os
+import shutil
+import signal
+import tempfile
+import time
+import unittest
+from unittest import TestCase
+from s1ipc import BaseIPCClient
+from .. import SharedCacheServer, SharedCache
+from ..persistence import Journal, read_records, log_generations
+
+__author__ = 'salvia'
+
+
+class PersistenceTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def restart(self, server, kill=False, **kwargs):
+        if kill:
+            os.kill(server.process.pid, signal.SIGKILL)
+            server.process.join()
+        server.shutdown()
+        return SharedCacheServer(snapshot_path=self.path, **kwargs)
+
+    def test_snapshot(self):
+        server = SharedCacheServer(snapshot_path=self.path, snapshot_interval=0)
+        try:
+            cache = SharedCache('persist', max_items=50, global_expiry=60, policy='lfu')
+            cache['a'], cache['b'] = 1, [2]
+            cache.set_many({'c': 3}, expiry=0.2)
+            assert cache.client.snapshot() == 3
+            cache.disconnect()
+            time.sleep(0.3)
+            server = self.restart(server)
+            # a plain client, as a SharedCache would configure the namespace again
+            client = BaseIPCClient('/tmp/SharedCacheServer.sock')
+            stats = client.get_stats('persist')
+            assert stats['puts'] == 3 and stats['policy'] == 'lfu'
+            # the item which expired while the server was down is left out
+            assert client.get_many('persist', ['a', 'b', 'c']) == {'a': 1, 'b': [2]}
+            client.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_log(self):
+        server = SharedCacheServer(snapshot_path=self.path, snapshot_interval=0, append_log=True)
+        try:
+            cache = SharedCache('persist', max_items=0)
+            cache['a'] = 1
+            cache.client.snapshot()
+            cache.set_many({'b': 2, 'c': 3})
+            cache.delete_many(['a'])
+            cache.disconnect()
+            # killed without a last snapshot: the writes since the last one are replayed from the log
+            server = self.restart(server, kill=True, snapshot_interval=0, append_log=True)
+            cache = SharedCache('persist', max_items=0)
+            assert cache.get_many(['a', 'b', 'c']) == {'b': 2, 'c': 3}
+            cache.client.invalidate('persist')
+            cache.disconnect()
+            server = self.restart(server, snapshot_interval=0, append_log=True)
+            cache = SharedCache('persist', max_items=0)
+            assert cache.get_many(['a', 'b', 'c']) == {}
+            cache.client.snapshot()
+            # logs older than the snapshot are removed
+            assert len(log_generations(self.path)) == 1
+            cache.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_shutdown_snapshot(self):
+        server = SharedCacheServer(snapshot_path=self.path, snapshot_interval=0)
+        try:
+            cache = SharedCache('persist', max_items=0)
+            cache.set_many({'a': 1, 'b': 2})
+            cache.disconnect()
+            # shutdown takes a last snapshot
+            server = self.restart(server)
+            client = BaseIPCClient('/tmp/SharedCacheServer.sock')
+            assert client.get_many('persist', ['a', 'b']) == {'a': 1, 'b': 2}
+            client.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_truncated_log(self):
+        path = os.path.join(self.directory, 'log')
+        journal = Journal(path)
+        for i in range(3):
+            journal.append(('put', 'ns', [(i, i, 0, 0)]))
+        journal.close()
+        with open(path, 'ab') as f:
+            f.write(b'\x00\x00\x01\x00partial')
+        assert [record[2][0][0] for record in read_records(path)] == [0, 1, 2]
+        assert list(read_records(os.path.join(self.directory, 'missing'))) == []
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+# coding=utf-8
+import unittest
+from unittest import TestCase
+from .. import ShardedSharedCacheServer, ShardedSharedCache, HashRing
+
+__author__ = 'salvia'
+
+
+class ShardedTests(TestCase):
+
+    def test_ring(self):
+        keys = ['k%d' % i for i in range(5000)]
+        ring = HashRing(['a', 'b', 'c', 'd'])
+        before = dict((key, ring.node(key)) for key in keys)
+        assert set(before.values()) == set('abcd')
+        ring.add('e')
+        after = dict((key, ring.node(key)) for key in keys)
+        moved = [key for key in keys if before[key] != after[key]]
+        # only the keys of the new node moved, about 1/5 of them
+        assert all(after[key] == 'e' for key in moved)
+        assert 0.1 < float(len(moved)) / len(keys) < 0.3
+        ring.remove('e')
+        assert dict((key, ring.node(key)) for key in keys) == before
+
+    def test_sharded_cache(self):
+        server = ShardedSharedCacheServer('/tmp/ShardedSharedCacheServer.sock', shards=3)
+        try:
+            cache = ShardedSharedCache('test', server.addresses, max_items=0)
+            mapping = dict(('k%d' % i, i) for i in range(100))
+            cache.set_many(mapping)
+            assert cache.get_many(list(mapping) + ['missing']) == mapping
+            assert cache['k1'] == 1 and cache.get('missing') is None
+            cache['k1'] = 10
+            assert cache.shard('k1')['k1'] == 10
+            for shard in cache.shards.values():
+                assert 0 < shard.client.get_stats('test')['puts'] < 100
+            assert cache.delete_many(['k%d' % i for i in range(50)]) == 50
+            assert len(cache.get_many(mapping)) == 50
+            stats = cache.get_stats()
+            assert stats['puts'] == 101 and stats['policy'] == 'lru'
+            cache.invalidate()
+            assert cache.get_many(mapping) == {}
+            cache.disconnect()
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# coding=utf-8
+from multiprocessing import Process, Value
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+from s1ipc import ClientPool
+from .. import SharedCacheServer, SharedCache
+from ..shared_table import SharedTable, key_bytes
+
+__author__ = 'salvia'
+
+
+class SharedTableTests(TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.table = SharedTable(self.path, 64, 128, create=True)
+
+    def tearDown(self):
+        self.table.close()
+        os.remove(self.path)
+
+    def test_put_get_delete(self):
+        reader = SharedTable(self.path, 64, 128)
+        self.table.put(key_bytes('k'), b'value', 0.0)
+        assert reader.get(key_bytes('k')) == b'value'
+        self.table.put(key_bytes('k'), b'other', 0.0)
+        assert reader.get(key_bytes('k')) == b'other'
+        self.table.delete(key_bytes('k'))
+        assert reader.get(key_bytes('k')) is None
+        reader.close()
+
+    def test_collisions(self):
+        # more keys than slots: every key is either found with its own value, or missing
+        for i in range(100):
+            self.table.put(key_bytes(i), str(i).encode('ascii'), 0.0)
+        found = [i for i in range(100) if self.table.get(key_bytes(i)) is not None]
+        assert len(found) == 64
+        assert all(self.table.get(key_bytes(i)) == str(i).encode('ascii') for i in found)
+
+    def test_too_large_and_expired(self):
+        self.table.put(key_bytes('k'), b'small', 0.0)
+        self.table.put(key_bytes('k'), b'x' * 200, 0.0)
+        assert self.table.get(key_bytes('k')) is None
+        self.table.put(key_bytes('e'), b'v', 1.0)
+        assert self.table.get(key_bytes('e')) is None
+
+    def test_stale(self):
+        interval = SharedTable.check_interval
+        SharedTable.check_interval = 0
+        try:
+            reader = SharedTable(self.path, 64, 128)
+            assert not reader.stale()
+            # a table created again at the same path, e.g. by a new server
+            SharedTable(self.path, 64, 128, create=True).close()
+            assert reader.stale()
+            reader.close()
+            reader = SharedTable(self.path, 64, 128)
+            os.remove(self.path)
+            assert reader.stale()
+            reader.close()
+
+            # a table left behind by a dead process
+            p = Process(target=lambda: SharedTable(self.path, 64, 128, create=True).close())
+            p.start()
+            p.join()
+            reader = SharedTable(self.path, 64, 128)
+            assert reader.stale()
+            reader.close()
+        finally:
+            SharedTable.check_interval = interval
+
+
+class DirectReadTests(TestCase):
+
+    def test_direct_read(self):
+        server = SharedCacheServer()
+        try:
+            cache = SharedCache('direct', max_items=3, direct_read=True)
+            cache['a'] = 'va'
+            hits = Value('i', 0)
+
+            def verify():
+                other = SharedCache('direct', max_items=3, direct_read=True)
+                hits.value = int(other['a'] == 'va')
+
+            p = Process(target=verify)
+            p.start()
+            p.join()
+            assert hits.value == 1
+            # served from the table, without calling the server
+            assert cache.client.get_stats('direct')['gets'] == 0
+
+            # evictions, overwrites and invalidation are mirrored
+            cache['b'], cache['c'], cache['d'] = 'vb', 'vc', 'vd'
+            self.assertRaises(KeyError, cache.__getitem__, 'a')
+            cache['b'] = 'vb2'
+            assert cache.get_many(['b', 'c', 'x']) == {'b': 'vb2', 'c': 'vc'}
+            cache.client.invalidate('direct')
+            assert cache.get('b') is None
+            cache.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_server_restart(self):
+        interval = SharedTable.check_interval
+        SharedTable.check_interval = 0
+        server = SharedCacheServer()
+        pool = ClientPool('/tmp/SharedCacheServer.sock')
+        try:
+            cache = SharedCache('direct', unlimited=True, direct_read=True, pool=pool)
+            cache['a'] = 'va'
+            assert cache['a'] == 'va'
+            server.shutdown()
+            server = SharedCacheServer()
+            # the table of the former server is no longer read: the new server does not have the item
+            assert cache.get('a') is None
+            assert cache.table is None
+            assert cache.get_many(['a']) == {}
+            cache.disconnect()
+        finally:
+            SharedTable.check_interval = interval
+            pool.close()
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,263 @@
+import errno
+from multiprocessing import cpu_count
+import mmap
+import os
+import select
+import socket
+import struct
+import sys
+import tempfile
+import time
+
+__author__ = 'matheus2740'
+
+
+_COUNTER = struct.Struct('=Q')
+_FLAG = struct.Struct('=I')
+
+# Layout of the ring header. Each field sits on its own cache line, so the producer and the consumer
+# never write to the same line.
+_HEAD = 0
+_TAIL = 64
+_CONSUMER_WAITING = 128
+_PRODUCER_WAITING = 192
+_CLOSED = 256
+_DATA = 512
+
+_PY3 = sys.version_info[0] >= 3
+
+
+class RingBuffer(object):
+    """
+    Single-producer/single-consumer byte ring over a memory-mapped file.
+    The producer only writes `head` (total bytes written) and the consumer only writes `tail` (total bytes read),
+    so no lock is needed. Each side sets its "waiting" flag before going to sleep, and the other side only rings
+    the doorbell (a system call) when it sees that flag.
+    """
+
+    def __init__(self, fd, capacity):
+        self.capacity = capacity
+        self.mm = mmap.mmap(fd, _DATA + capacity)
+        self.view = memoryview(self.mm) if _PY3 else None
+
+    @classmethod
+    def create(cls, capacity, directory=None):
+        """
+        Creates a new ring backed by a new file.
+        :return: a tuple (ring, file path).
+        """
+        if directory is None and os.path.isdir('/dev/shm'):
+            directory = '/dev/shm'
+        fd, path = tempfile.mkstemp(prefix='s1ipc-', suffix='.ring', dir=directory)
+        try:
+            os.ftruncate(fd, _DATA + capacity)
+            return cls(fd, capacity), path
+        finally:
+            os.close(fd)
+
+    @classmethod
+    def attach(cls, path, capacity):
+        """
+        Maps a ring created by another process.
+        """
+        fd = os.open(path, os.O_RDWR)
+        try:
+            return cls(fd, capacity)
+        finally:
+            os.close(fd)
+
+    def get(self, offset, field=_COUNTER):
+        return field.unpack_from(self.mm, offset)[0]
+
+    def set(self, offset, value, field=_COUNTER):
+        field.pack_into(self.mm, offset, value)
+
+    def write(self, head, data, start, n):
+        """
+        Copies `n` bytes of `data`, from `start`, into the ring at the position of counter `head`.
+        The copied region must not wrap around the end of the ring.
+        """
+        pos = _DATA + head % self.capacity
+        chunk = data[start:start + n]
+        if _PY3:
+            self.view[pos:pos + n] = chunk
+        else:
+            self.mm[pos:pos + n] = chunk.tobytes() if isinstance(chunk, memoryview) else bytes(chunk)
+
+    def read(self, tail, view, n):
+        """
+        Copies `n` bytes from the ring at the position of counter `tail` into `view`.
+        The copied region must not wrap around the end of the ring.
+        """
+        pos = _DATA + tail % self.capacity
+        if _PY3:
+            view[:n] = self.view[pos:pos + n]
+        else:
+            view[:n] = self.mm[pos:pos + n]
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        self.mm.close()
+
+
+class ShmChannel(object):
+    """
+    Socket-like object exchanging data through two shared-memory `RingBuffer`s (one per direction) instead of
+    through the kernel. The connection's original socket stays open as a doorbell: a single byte is sent over it
+    only when the peer announced it is going to sleep, and its closing tells the peer the connection is over.
+
+    Waiting uses a spin-then-block policy: a side that finds its ring empty (or full) polls it for `spin_time`
+    seconds before sleeping on the doorbell. Sleeps are bounded by `block_timeout`, as the waiting flag and the
+    ring counters are plain memory writes, without a memory fence between them. On a single CPU spinning would
+    only delay the peer, so `spin_time` defaults to 0 there.
+
+    This transport is experimental: without a fence, a wakeup can be missed and the peer then only notices the data
+    after `block_timeout`, and its pure-python ring accesses make it slower than the UNIX socket it replaces on
+    machines with few CPUs, while every idle connection wakes its server every `block_timeout`. It is therefore
+    opt-in for servers (refer to `BaseIPCServer.shm_transport`) and clients, and left out of the default benchmark
+    matrix.
+
+    It implements the subset of the socket interface used by the protocols, so it can replace a client socket
+    or a handler request transparently.
+    """
+
+    spin_time = 50e-6 if cpu_count() > 1 else 0
+    block_timeout = 0.001
+
+    def __init__(self, sock, tx, rx):
+        """
+        :param sock: the connected socket, used as doorbell.
+        :param tx: the ring this side writes to.
+        :param rx: the ring this side reads from.
+        """
+        self.sock = sock
+        self.tx = tx
+        self.rx = rx
+        self._head = tx.get(_HEAD)
+        self._tail = rx.get(_TAIL)
+        self._eof = False
+
+    @classmethod
+    def create(cls, sock, capacity):
+        """
+        Creates the rings of a new channel (server side).
+        :return: a tuple (channel, path of the client to server ring, path of the server to client ring).
+        """
+        rx, rx_path = RingBuffer.create(capacity)
+        tx, tx_path = RingBuffer.create(capacity)
+        return cls(sock, tx, rx), rx_path, tx_path
+
+    @classmethod
+    def attach(cls, sock, tx_path, rx_path, capacity):
+        """
+        Maps the rings of a channel created by the peer (client side), and removes their files,
+        as both processes have them mapped by then.
+        """
+        try:
+            return cls(sock, RingBuffer.attach(tx_path, capacity), RingBuffer.attach(rx_path, capacity))
+        finally:
+            for path in (tx_path, rx_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _ring(self):
+        try:
+            self.sock.send(b'\0')
+        except socket.error as e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def _wait(self, ready, ring, flag):
+        """
+        Waits until `ready()` is true: spins for `spin_time`, then sleeps on the doorbell.
+        :return: False if the peer closed the connection.
+        """
+        deadline = time.time() + self.spin_time
+        while time.time() < deadline:
+            if ready():
+                return True
+        while True:
+            ring.set(flag, 1, _FLAG)
+            try:
+                if ready():
+                    return True
+                if ring.get(_CLOSED, _FLAG):
+                    return False
+                r, w, e = select.select([self.sock], [], [], self.block_timeout)
+                if r:
+                    try:
+                        if not self.sock.recv(4096):
+                            return False
+                    except socket.error as e:
+                        if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                            return False
+            finally:
+                ring.set(flag, 0, _FLAG)
+
+    def send(self, data):
+        """
+        Writes as much of `data` as fits in the ring, waiting for room if the ring is full.
+        :return: the number of bytes written.
+        """
+        tx = self.tx
+        n = len(data)
+        if not n:
+            return 0
+        if not self._wait(lambda: self._head - tx.get(_TAIL) < tx.capacity, tx, _PRODUCER_WAITING):
+            raise socket.error(errno.EPIPE, 'Broken pipe')
+        free = tx.capacity - (self._head - tx.get(_TAIL))
+        n = min(n, free, tx.capacity - self._head % tx.capacity)
+        tx.write(self._head, data, 0, n)
+        self._head += n
+        tx.set(_HEAD, self._head)
+        if tx.get(_CONSUMER_WAITING, _FLAG):
+            self._ring()
+        return n
+
+    def sendall(self, data):
+        view = memoryview(data)
+        while len(view):
+            view = view[self.send(view):]
+
+    def recv_into(self, buf, nbytes=0):
+        """
+        Reads up to `nbytes` (or len(buf)) bytes into `buf`, waiting for data if the ring is empty.
+        :return: the number of bytes read, 0 if the peer closed the connection.
+        """
+        rx = self.rx
+        view = memoryview(buf)
+        nbytes = nbytes or len(view)
+        if self._eof or not nbytes:
+            return 0
+        if not self._wait(lambda: rx.get(_HEAD) != self._tail, rx, _CONSUMER_WAITING):
+            self._eof = True
+            return 0
+        available = rx.get(_HEAD) - self._tail
+        n = min(nbytes, available, rx.capacity - self._tail % rx.capacity)
+        rx.read(self._tail, view, n)
+        self._tail += n
+        rx.set(_TAIL, self._tail)
+        if rx.get(_PRODUCER_WAITING, _FLAG):
+            self._ring()
+        return n
+
+    def recv(self, bufsize):
+        buf = bytearray(bufsize)
+        n = self.recv_into(buf, bufsize)
+        return bytes(buf[:n])
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        for ring in (self.tx, self.rx):
+            try:
+                ring.set(_CLOSED, 1, _FLAG)
+                ring.close()
+            except (ValueError, BufferError):
+                pass
+        self.sock.close()
@@ -0,0 +1,41 @@
+# coding=utf-8
+import unittest
+from unittest import TestCase
+from .. import BaseIPCServer
+from .base_server_tests import mhash
+
+try:
+    import asyncio
+    from ..aioclient import AsyncIPCClient
+except ImportError:
+    asyncio = None
+
+__author__ = 'matheus2740'
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is not available')
+class AsyncIPCClientTests(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_concurrent_calls(self):
+        server = BaseIPCServer()
+        try:
+            client = AsyncIPCClient(loop=self.loop)
+            self.loop.run_until_complete(client.connect())
+            data = ["string %d" % i for i in range(300)]
+
+            received = self.loop.run_until_complete(asyncio.gather(*[client.mhash(d) for d in data]))
+
+            assert received == [mhash(d) for d in data]
+            client.disconnect()
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
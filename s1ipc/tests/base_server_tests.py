@@ -1,9 +1,10 @@
 # coding=utf-8
+from __future__ import print_function
 import hashlib
 from multiprocessing import Pool
 import unittest
 from unittest import TestCase
-from echoback_server import EchobackIPCServer, EchobackIPCClient
+from .echoback_server import EchobackIPCServer, EchobackIPCClient
 from .. import IPCAvailable
 
 __author__ = 'matheus2740'
@@ -41,10 +42,10 @@ class IPCServerTests(TestCase):
         for i in range(1000):
             pool.apply_async(echoback_client_call, args=(i,))
 
-        print 'applyed'
+        print('applyed')
         pool.close()
         pool.join()
-        print "pool is dead"
+        print("pool is dead")
 
         server.shutdown()
 
@@ -57,15 +58,32 @@ class IPCServerTests(TestCase):
             client = BaseIPCClient()
 
             received = client.mhash(data)
-            print 'received:', received
+            print('received:', received)
             assert received == mhash(data)
         finally:
             server.shutdown()
 
+    def test_pipeline(self):
+        server = BaseIPCServer()
+
+        try:
+            client = BaseIPCClient()
+            data = ["string %d" % i for i in range(100)]
+
+            with client.pipeline() as pipe:
+                for d in data:
+                    pipe.mhash(d)
+
+            assert pipe.results == [mhash(d) for d in data]
+            # the client still works normally after a pipeline
+            assert client.mhash(data[0]) == mhash(data[0])
+        finally:
+            server.shutdown()
+
 
 @IPCAvailable(BaseIPCServer)
 def mhash(string):
-    return hashlib.md5(string).hexdigest()
+    return hashlib.md5(string.encode('utf-8')).hexdigest()
 
 
 def echoback_client_call(arg):
@@ -74,7 +92,7 @@ def echoback_client_call(arg):
     received = client.teste(arg)
 
     assert received['a'][0] == arg
-    print "successfull:", arg
+    print("successfull:", arg)
     client.disconnect()
 
 if __name__ == '__main__':
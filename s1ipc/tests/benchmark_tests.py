@@ -0,0 +1,42 @@
+# coding=utf-8
+import json
+import unittest
+from unittest import TestCase
+from ..benchmark import KeyChooser, run, run_matrix
+
+__author__ = 'matheus2740'
+
+
+class BenchmarkTests(TestCase):
+
+    def test_key_chooser(self):
+        uniform = KeyChooser(100, seed=1)
+        zipf = KeyChooser(100, 'zipf', seed=1)
+        uniform_draws = [uniform() for i in range(10000)]
+        zipf_draws = [zipf() for i in range(10000)]
+        assert 0 <= min(uniform_draws + zipf_draws) and max(uniform_draws + zipf_draws) < 100
+        # with s = 1.1 about a fifth of the draws are the first key
+        assert uniform_draws.count(0) < 300 and zipf_draws.count(0) > 1500
+        self.assertRaises(ValueError, KeyChooser, 100, 'gaussian')
+
+    def test_run(self):
+        document = run_matrix(clients=(2,), keys=100, duration=0.1, engines=('threaded', 'eventloop'))
+        assert len(document['results']) == 8
+        # the experimental shm transport is only benchmarked on request
+        assert set(result['transport'] for result in document['results']) == {'unix'}
+        for result in document['results']:
+            assert result['errors'] == []
+            assert result['operations'] > 0 and result['throughput'] > 0
+            assert 0 < result['latency']['p50'] <= result['latency']['p99'] <= result['latency']['max']
+        memoize = [result for result in document['results'] if result['workload'] == 'memoize']
+        assert all(0 < result['hit_ratio'] < 1 for result in memoize)
+        json.dumps(document)
+
+    def test_transports(self):
+        for transport in ('shm', 'tcp'):
+            result = run('get', clients=1, keys=10, duration=0.1, transport=transport, serializer='pickle')
+            assert result['errors'] == [] and result['operations'] > 0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+# coding=utf-8
+import os
+import pickle
+import unittest
+from unittest import TestCase
+from .. import BaseIPCClient, BaseIPCServer, EventLoopIPCServer
+from ..compression import Compressed, pack_value, unpack_value, get_codec
+from ..protocol import BinaryIPCProtocol
+from .base_server_tests import mhash
+
+__author__ = 'matheus2740'
+
+
+class CompressionTests(TestCase):
+
+    def test_threshold(self):
+        small = 'x' * 100
+        large = 'x' * (BinaryIPCProtocol.COMPRESS_THRESHOLD + 1)
+        for data, compressed in ((small, False), (large, True)):
+            header, payload = BinaryIPCProtocol.pack_frames(data, codec='zlib')
+            length, flags = BinaryIPCProtocol.HEADER.unpack(header)
+            codec = (flags & BinaryIPCProtocol.COMPRESSION_MASK) >> BinaryIPCProtocol.COMPRESSION_SHIFT
+            assert codec == (get_codec('zlib').id if compressed else 0)
+            assert BinaryIPCProtocol.loads(flags, bytearray(payload)) == data
+
+    def test_incompressible(self):
+        data = os.urandom(BinaryIPCProtocol.COMPRESS_THRESHOLD * 2)
+        header, payload = BinaryIPCProtocol.pack_frames(data, codec='zlib')
+        length, flags = BinaryIPCProtocol.HEADER.unpack(header)
+        assert not flags & BinaryIPCProtocol.COMPRESSION_MASK
+        assert BinaryIPCProtocol.loads(flags, bytearray(payload)) == data
+
+    def test_pack_value(self):
+        value = {'html': '<div>fragment</div>' * 1000}
+        packed = pack_value(value, 'zlib', 1024, pickle.dumps)
+        assert isinstance(packed, Compressed)
+        assert unpack_value(pickle.loads(pickle.dumps(packed)), pickle.loads) == value
+        assert pack_value('small', 'zlib', 1024, pickle.dumps) == 'small'
+
+    def test_client_negotiation(self):
+        data = "large string " * 10000
+        for server_class in (BaseIPCServer, EventLoopIPCServer):
+            server = server_class()
+            try:
+                client = BaseIPCClient(compression=['no-such-codec', 'zlib'])
+                assert client.codec.name == 'zlib'
+                assert client.serializer.name == 'pickle'
+                assert client.mhash(data) == mhash(data)
+                client.disconnect()
+            finally:
+                server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,7 +11,7 @@ class EchobackIPCHandler(BaseIPCHandler):
     def handle(self):
         self.data = self.server.protocol.recover_message(self.request)
 
-        BaseIPCProtocol.send_message(self.request, self.data)
+        self.server.protocol.send_message(self.request, self.data)
 
 class EchobackIPCServer(BaseIPCServer):
     handler = EchobackIPCHandler
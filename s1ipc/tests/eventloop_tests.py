@@ -0,0 +1,99 @@
+# coding=utf-8
+from multiprocessing import Pool
+import threading
+import unittest
+from unittest import TestCase
+from .. import BaseIPCClient, EventLoopIPCServer, Subscription
+from ..server import publish
+from .base_server_tests import mhash
+
+__author__ = 'matheus2740'
+
+
+class PooledEventLoopIPCServer(EventLoopIPCServer):
+    workers = 4
+
+
+def flood(count):
+    for i in range(count):
+        publish('flood', i)
+    return count
+
+
+EventLoopIPCServer.register_functor(flood, 'eventloop_flood')
+
+
+class EventLoopServerTests(TestCase):
+
+    def test_hash_server(self):
+        server = EventLoopIPCServer()
+        try:
+            client = BaseIPCClient()
+            assert client.mhash("my test string") == mhash("my test string")
+            client.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_pipeline(self):
+        for server_class in (EventLoopIPCServer, PooledEventLoopIPCServer):
+            server = server_class()
+            try:
+                client = BaseIPCClient()
+                data = ["string %d" % i for i in range(100)]
+                with client.pipeline() as pipe:
+                    for d in data:
+                        pipe.mhash(d)
+                assert pipe.results == [mhash(d) for d in data]
+                client.disconnect()
+            finally:
+                server.shutdown()
+
+    def test_publish_flood(self):
+        # events published by an inline dispatch, far more than the wakeup pipe and the subscriber's limit hold
+        server = EventLoopIPCServer()
+        try:
+            ended = threading.Event()
+            subscription = Subscription(server.address, 'flood', lambda event: event is None and ended.set())
+            client = BaseIPCClient(socket_timeout=20)
+            assert client.eventloop_flood(70000) == 70000
+            # the subscriber did not keep up: its connection was closed
+            assert ended.wait(5)
+            assert client.eventloop_flood(10) == 10
+            client.disconnect()
+            subscription.close()
+        finally:
+            server.shutdown()
+
+    def test_large_message(self):
+        server = EventLoopIPCServer()
+        try:
+            client = BaseIPCClient()
+            data = "x" * (4 * 1024 * 1024)
+            assert client.mhash(data) == mhash(data)
+            client.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_many_clients(self):
+        for server_class in (EventLoopIPCServer, PooledEventLoopIPCServer):
+            server = server_class()
+            try:
+                pool = Pool(10)
+                results = [pool.apply_async(hash_client_call, args=(i,)) for i in range(200)]
+                pool.close()
+                pool.join()
+                assert all(r.get() for r in results)
+            finally:
+                server.shutdown()
+
+
+def hash_client_call(arg):
+    client = BaseIPCClient()
+    data = "string %d" % arg
+    received = client.mhash(data)
+    client.disconnect()
+    return received == mhash(data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# coding=utf-8
+import threading
+import unittest
+from unittest import TestCase
+from .. import BaseIPCServer, BaseIPCClient, EventLoopIPCServer
+from ..metrics import Counters, Histogram, Metrics, prometheus_text
+from .base_server_tests import mhash
+
+__author__ = 'matheus2740'
+
+
+class PooledEventLoopIPCServer(EventLoopIPCServer):
+    workers = 2
+
+
+class MetricsTests(TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for value in range(1, 100001):
+            histogram.record(value)
+        assert histogram.count == 100000 and histogram.max == 100000
+        for p in (50, 90, 99):
+            exact = p * 1000
+            assert exact <= histogram.percentile(p) <= exact * 1.04
+        # buckets are contiguous, and each value falls in its own
+        for i in range(1, 5000):
+            assert Histogram.upper(i - 1) <= Histogram.upper(i)
+            assert Histogram.index(Histogram.upper(i) - 1) == i
+        assert len(histogram.counts) < 500
+
+    def test_threads(self):
+        metrics = Metrics()
+
+        def work():
+            for i in range(1000):
+                metrics.observe('call', 'f', 0.001)
+                metrics.count('messages')
+            metrics.retire()
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        metrics.count('errors', 'f')
+        snapshot = metrics.snapshot()
+        assert snapshot['histograms']['call']['f']['count'] == 4000
+        assert snapshot['counters'] == {'messages': 4000, 'errors': {'f': 1}}
+        text = prometheus_text(snapshot)
+        assert 's1ipc_call_seconds_bucket{name="f",le="+Inf"} 4000' in text
+        assert 's1ipc_call_seconds_bucket{name="f",le="0.001024"} 4000' in text
+        assert 's1ipc_call_seconds_bucket{name="f",le="0.000512"} 0' in text
+        assert 's1ipc_errors_total{name="f"} 1' in text
+
+    def test_counters(self):
+        counters = Counters('gets', 'hits')
+
+        def work():
+            for i in range(1000):
+                counters.add('gets')
+            counters.add('hits', 10)
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert counters.totals() == {'gets': 4000, 'hits': 40}
+        counters.reset({'gets': 5})
+        counters.add('hits')
+        assert counters.totals() == {'gets': 5, 'hits': 1}
+
+    def test_server_stats(self):
+        for server_class in (BaseIPCServer, EventLoopIPCServer, PooledEventLoopIPCServer):
+            server = server_class()
+            try:
+                client = BaseIPCClient()
+                for i in range(20):
+                    assert client.mhash(str(i)) == mhash(str(i))
+                with client.pipeline() as pipe:
+                    pipe.mhash('a')
+                    pipe.mhash('b')
+                stats = client.telemetry()
+                assert stats['histograms']['call']['mhash']['count'] == 22
+                # the request for the stats was decoded too
+                assert stats['histograms']['phase']['decode']['count'] == 22
+                assert stats['counters']['messages'] == 22
+                assert stats['counters']['bytes_received'] > 0 and stats['counters']['bytes_sent'] > 0
+                assert stats['gauges']['connections'] == 1
+                if server_class is PooledEventLoopIPCServer:
+                    assert stats['histograms']['phase']['queue']['count'] == 21
+                text = client.telemetry(prometheus=True)
+                assert 's1ipc_call_seconds_count{name="mhash"} 22' in text
+                assert 's1ipc_connections 1' in text
+                client.disconnect()
+            finally:
+                server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# coding=utf-8
+from multiprocessing import Process, Value
+import threading
+import unittest
+from unittest import TestCase
+from .. import BaseIPCServer, ClientPool
+from ..client import IPCCLientException
+from .base_server_tests import mhash
+
+__author__ = 'matheus2740'
+
+
+class ClientPoolTests(TestCase):
+
+    def test_threads(self):
+        server = BaseIPCServer()
+        try:
+            pool = ClientPool(max_size=3)
+            errors = []
+
+            def work(n):
+                for i in range(50):
+                    data = "thread %d call %d" % (n, i)
+                    if pool.mhash(data) != mhash(data):
+                        errors.append(data)
+
+            threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            assert not errors
+            assert pool._size <= 3
+            pool.close()
+        finally:
+            server.shutdown()
+
+    def test_timeout(self):
+        server = BaseIPCServer()
+        try:
+            pool = ClientPool(max_size=1, timeout=0.05)
+            client = pool.acquire()
+            self.assertRaises(IPCCLientException, pool.acquire)
+            pool.release(client)
+            assert pool.mhash("abc") == mhash("abc")
+            pool.close()
+        finally:
+            server.shutdown()
+
+    def test_reconnect(self):
+        server = BaseIPCServer()
+        pool = ClientPool()
+        try:
+            assert pool.mhash("abc") == mhash("abc")
+        finally:
+            server.shutdown()
+        # the idle connection is broken by the restart, the call must go through a new one
+        server = BaseIPCServer()
+        try:
+            assert pool.mhash("abc") == mhash("abc")
+            pool.close()
+        finally:
+            server.shutdown()
+
+    def test_fork(self):
+        server = BaseIPCServer()
+        try:
+            pool = ClientPool()
+            assert pool.mhash("abc") == mhash("abc")
+            ok = Value('i', 0)
+
+            def verify():
+                ok.value = int(pool.mhash("def") == mhash("def"))
+
+            p = Process(target=verify)
+            p.start()
+            p.join()
+            assert ok.value == 1
+            # the parent connection was not disturbed by the child
+            assert pool.mhash("ghi") == mhash("ghi")
+            pool.close()
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# coding=utf-8
+import os
+import pstats
+import sys
+import tempfile
+import time
+import unittest
+from unittest import TestCase
+from .. import BaseIPCServer, BaseIPCClient, EventLoopIPCServer, IPCAvailable
+from ..client import IPCCLientException
+from .base_server_tests import mhash
+
+__author__ = 'matheus2740'
+
+
+@IPCAvailable(BaseIPCServer)
+def busy(seconds):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        pass
+    return True
+
+
+class ProfilerTests(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mktemp()
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_cprofile(self):
+        for server_class in (BaseIPCServer, EventLoopIPCServer):
+            server = server_class()
+            try:
+                client = BaseIPCClient()
+                report = client.profiling('start', fraction=1.0)
+                assert report['active'] and report['mode'] == 'cprofile'
+                for i in range(10):
+                    assert client.mhash(str(i)) == mhash(str(i))
+                assert client.profiling('report')['dispatches'] == {'mhash': 10}
+                report = client.profiling('stop', path=self.path, limit=5)
+                assert not report['active'] and report['dispatches'] == {'mhash': 10}
+                assert 'mhash' in report['text']
+                assert 'mhash' in str(pstats.Stats(self.path).stats)
+                # stopped: dispatches are not profiled anymore
+                client.mhash('a')
+                assert client.profiling('report')['dispatches'] == {'mhash': 10}
+                client.disconnect()
+            finally:
+                server.shutdown()
+
+    def test_sample(self):
+        server = BaseIPCServer()
+        try:
+            client = BaseIPCClient()
+            client.profiling('start', mode='sample', fraction=0.5, interval=0.001)
+            for i in range(20):
+                client.busy(0.01)
+            report = client.profiling('stop', path=self.path)
+            assert 0 < report['dispatches']['busy'] < 20
+            if sys.version_info[0] > 2:
+                # python 2 may not find the stacks of threads whose id was used in the parent process
+                assert report['samples'] > 0
+            for stack, count in report['stacks']:
+                assert stack.startswith('busy;busy (profiler_tests.py:')
+            with open(self.path) as f:
+                assert sum(int(line.rsplit(' ', 1)[1]) for line in f) == report['samples']
+            client.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_errors(self):
+        server = BaseIPCServer()
+        try:
+            client = BaseIPCClient()
+            self.assertRaises(IPCCLientException, client.profiling, 'start', mode='strace')
+            self.assertRaises(IPCCLientException, client.profiling, 'start', fraction=2)
+            self.assertRaises(IPCCLientException, client.profiling, 'restart')
+            assert not client.profiling('report')['active']
+            assert client.mhash('a') == mhash('a')
+            client.disconnect()
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
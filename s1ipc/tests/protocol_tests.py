@@ -0,0 +1,45 @@
+# coding=utf-8
+import socket
+import threading
+import unittest
+from unittest import TestCase
+from ..protocol import BinaryIPCProtocol
+
+__author__ = 'matheus2740'
+
+
+class BinaryProtocolTests(TestCase):
+
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+
+    def tearDown(self):
+        self.a.close()
+        self.b.close()
+
+    def test_roundtrip(self):
+        data = {'f': 'get', 'a': ('ns', 'key'), 'kw': {}}
+        BinaryIPCProtocol.send_message(self.a, data)
+        assert BinaryIPCProtocol.recover_message(self.b) == data
+
+    def test_large_message(self):
+        # much larger than any kernel socket buffer, so it can only arrive through several reads
+        data = 'x' * (8 * 1024 * 1024)
+        sender = threading.Thread(target=BinaryIPCProtocol.send_message, args=(self.a, data))
+        sender.start()
+        received = BinaryIPCProtocol.recover_message(self.b)
+        sender.join()
+        assert received == data
+
+    def test_header(self):
+        header, payload = BinaryIPCProtocol.pack_frames('abc')
+        assert len(header) == BinaryIPCProtocol.HEADER_SIZE
+        assert BinaryIPCProtocol.HEADER.unpack(header) == (len(payload), 0)
+
+    def test_closed_connection(self):
+        self.a.close()
+        assert BinaryIPCProtocol.recover_message(self.b) is None
+
+
+if __name__ == '__main__':
+    unittest.main()
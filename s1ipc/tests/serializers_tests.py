@@ -0,0 +1,62 @@
+# coding=utf-8
+import unittest
+from unittest import TestCase
+from .. import BaseIPCClient, BaseIPCServer, EventLoopIPCServer
+from ..protocol import BinaryIPCProtocol
+from ..serializers import available_serializers, get_serializer, negotiate, DEFAULT_SERIALIZER
+from .base_server_tests import mhash
+
+__author__ = 'matheus2740'
+
+
+class Unmarshallable(object):
+
+    def __eq__(self, other):
+        return isinstance(other, Unmarshallable)
+
+
+class SerializerTests(TestCase):
+
+    def test_roundtrip(self):
+        data = {'f': 'get', 'a': ['ns', 'key', 1, 2.5, None], 'kw': {}}
+        for name in available_serializers():
+            if name == 'raw':
+                continue
+            header, payload = BinaryIPCProtocol.pack_frames(data, serializer=name)
+            length, flags = BinaryIPCProtocol.HEADER.unpack(header)
+            assert flags & BinaryIPCProtocol.SERIALIZER_MASK == get_serializer(name).id
+            assert BinaryIPCProtocol.loads(flags, bytearray(payload)) == data
+
+    def test_fallback(self):
+        header, payload = BinaryIPCProtocol.pack_frames([Unmarshallable()], serializer='marshal')
+        length, flags = BinaryIPCProtocol.HEADER.unpack(header)
+        assert flags & BinaryIPCProtocol.SERIALIZER_MASK == DEFAULT_SERIALIZER.id
+        assert BinaryIPCProtocol.loads(flags, bytearray(payload)) == [Unmarshallable()]
+
+    def test_raw(self):
+        header, payload = BinaryIPCProtocol.pack_frames(b'abc', serializer='raw')
+        assert payload == b'abc'
+        assert BinaryIPCProtocol.loads(BinaryIPCProtocol.HEADER.unpack(header)[1], bytearray(payload)) == b'abc'
+
+    def test_negotiate(self):
+        assert negotiate(['no-such-serializer', 'marshal']).name == 'marshal'
+        assert negotiate(['no-such-serializer']) is DEFAULT_SERIALIZER
+
+    def test_client_negotiation(self):
+        for server_class in (BaseIPCServer, EventLoopIPCServer):
+            server = server_class()
+            try:
+                client = BaseIPCClient(serializer=['no-such-serializer', 'marshal'])
+                assert client.serializer.name == 'marshal'
+                assert client.mhash("my test string") == mhash("my test string")
+                with client.pipeline() as pipe:
+                    for i in range(10):
+                        pipe.mhash("string %d" % i)
+                assert pipe.results == [mhash("string %d" % i) for i in range(10)]
+                client.disconnect()
+            finally:
+                server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
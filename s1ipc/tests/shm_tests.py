@@ -0,0 +1,57 @@
+# coding=utf-8
+import unittest
+from unittest import TestCase
+from .. import BaseIPCServer, BaseIPCClient, EventLoopIPCServer
+from ..shm import ShmChannel
+from .base_server_tests import mhash
+
+__author__ = 'matheus2740'
+
+
+class ShmServer(BaseIPCServer):
+    shm_transport = True
+
+
+class ShmTransportTests(TestCase):
+
+    def test_hash_server(self):
+        server = ShmServer()
+        try:
+            client = BaseIPCClient(transport='shm')
+            assert isinstance(client.sock, ShmChannel)
+            for i in range(100):
+                data = "string %d" % i
+                assert client.mhash(data) == mhash(data)
+            client.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_message_larger_than_ring(self):
+        server = ShmServer()
+        try:
+            client = BaseIPCClient(transport='shm', shm_capacity=64 * 1024)
+            data = "x" * (4 * 1024 * 1024)
+            assert client.mhash(data) == mhash(data)
+            with client.pipeline() as pipe:
+                for i in range(1000):
+                    pipe.mhash("string %d" % i)
+            assert pipe.results == [mhash("string %d" % i) for i in range(1000)]
+            client.disconnect()
+        finally:
+            server.shutdown()
+
+    def test_fallback_to_socket(self):
+        # the transport is opt-in for threaded servers, and the event loop keeps its connections on the socket
+        for server_class in (BaseIPCServer, EventLoopIPCServer):
+            server = server_class()
+            try:
+                client = BaseIPCClient(transport='shm')
+                assert not isinstance(client.sock, ShmChannel)
+                assert client.mhash("abc") == mhash("abc")
+                client.disconnect()
+            finally:
+                server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# coding=utf-8
+import os
+import socket
+import unittest
+from unittest import TestCase
+from .. import AuthenticationError, BaseIPCServer, BaseIPCClient, BinaryIPCProtocol, ClientPool, EventLoopIPCServer
+from ..client import IPCCLientException
+from ..sharedcache import SharedCache, SharedCacheServer
+from ..transport import AUTHKEY_ENV
+from .base_server_tests import mhash
+from .shm_tests import ShmServer
+
+try:
+    import asyncio
+    from ..aioclient import AsyncIPCClient
+except ImportError:
+    asyncio = None
+
+__author__ = 'matheus2740'
+
+AUTHKEY = b'secret'
+
+
+class TCPTests(TestCase):
+
+    def test_client(self):
+        for server_class in (BaseIPCServer, EventLoopIPCServer):
+            server = server_class(('127.0.0.1', 0), authkey=AUTHKEY)
+            try:
+                assert server.address[1] != 0
+                client = BaseIPCClient(server.address, socket_timeout=5, authkey=AUTHKEY)
+                assert client.sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+                assert client.sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+                data = 'x' * 100000
+                assert client.mhash(data) == mhash(data)
+                with client.pipeline() as pipe:
+                    for i in range(10):
+                        pipe.mhash(str(i))
+                assert pipe.results == [mhash(str(i)) for i in range(10)]
+                client.disconnect()
+
+                pool = ClientPool(server.address, max_size=2, authkey=AUTHKEY)
+                assert pool.mhash('pooled') == mhash('pooled')
+                pool.close()
+            finally:
+                server.shutdown()
+
+    def test_shm_refused(self):
+        server = ShmServer(('127.0.0.1', 0), authkey=AUTHKEY)
+        try:
+            # even if enabled, the server cannot share memory with a remote client: the connection stays on TCP
+            client = BaseIPCClient(server.address, transport='shm', authkey=AUTHKEY)
+            assert isinstance(client.sock, socket.socket)
+            assert client.mhash('data') == mhash('data')
+            client.disconnect()
+        finally:
+            server.shutdown()
+
+    @unittest.skipIf(asyncio is None, 'asyncio is not available')
+    def test_async_client(self):
+        server = BaseIPCServer(('127.0.0.1', 0), authkey=AUTHKEY)
+        loop = asyncio.new_event_loop()
+        try:
+            client = AsyncIPCClient(server.address, loop=loop, authkey=AUTHKEY)
+            loop.run_until_complete(client.connect())
+            data = ["string %d" % i for i in range(100)]
+            received = loop.run_until_complete(asyncio.gather(*[client.mhash(d) for d in data]))
+            assert received == [mhash(d) for d in data]
+            client.disconnect()
+            # a wrong authkey fails the handshake, without a message being decoded
+            client = AsyncIPCClient(server.address, loop=loop, authkey=b'wrong')
+            self.assertRaises(AuthenticationError, loop.run_until_complete, client.connect())
+        finally:
+            loop.close()
+            server.shutdown()
+
+    def test_authkey(self):
+        self.assertRaises(ValueError, BaseIPCServer, ('127.0.0.1', 0))
+        for server_class in (BaseIPCServer, EventLoopIPCServer):
+            server = server_class(('127.0.0.1', 0), authkey=AUTHKEY)
+            try:
+                self.assertRaises(AuthenticationError, BaseIPCClient, server.address, authkey=b'wrong')
+                # anything but the answer to the challenge closes the connection before it is decoded
+                sock = socket.create_connection(server.address, 5)
+                assert BinaryIPCProtocol.recv_frame(sock) is not None
+                BinaryIPCProtocol.send_message(sock, {'f': 'mhash', 'a': ('data',), 'kw': {}})
+                assert BinaryIPCProtocol.recover_frame(sock) is None
+                sock.close()
+                client = BaseIPCClient(server.address, socket_timeout=5, authkey=AUTHKEY)
+                assert client.mhash('data') == mhash('data')
+                client.disconnect()
+            finally:
+                server.shutdown()
+
+    def test_remote_restrictions(self):
+        for server_class in (BaseIPCServer, EventLoopIPCServer):
+            server = server_class(('127.0.0.1', 0), authkey=AUTHKEY)
+            try:
+                client = BaseIPCClient(server.address, socket_timeout=5, authkey=AUTHKEY)
+                self.assertRaises(IPCCLientException, client.profiling, 'report', path='/tmp/s1ipc-tcp.stacks')
+                client.shutdown()
+                # the server refused to shut down
+                client = BaseIPCClient(server.address, socket_timeout=5, authkey=AUTHKEY)
+                assert client.ping()
+                client.disconnect()
+            finally:
+                server.shutdown()
+
+    def test_near_cache(self):
+        assert AUTHKEY_ENV not in os.environ
+        server = SharedCacheServer(('127.0.0.1', 0), authkey=AUTHKEY)
+        pool = ClientPool(server.address, authkey=AUTHKEY)
+        try:
+            # the subscription of the near cache authenticates with the authkey of the pool
+            cache = SharedCache('near', pool=pool, near_cache=10, near_ttl=60)
+            assert cache.near._subscription is not None
+            cache['a'] = 1
+            assert cache['a'] == 1
+            assert cache['a'] == 1
+            assert cache.near.hits == 1
+            cache.disconnect()
+        finally:
+            pool.close()
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
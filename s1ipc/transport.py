@@ -0,0 +1,157 @@
+import hashlib
+import hmac
+import os
+import socket
+
+__author__ = 'matheus2740'
+
+# keepalive probes, where the platform allows tuning them: first probe after KEEPALIVE_IDLE seconds of silence, then
+# every KEEPALIVE_INTERVAL seconds, the connection being dropped after KEEPALIVE_COUNT unanswered probes
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 5
+
+# environment variable holding the shared secret of TCP connections, when it is not given explicitly
+AUTHKEY_ENV = 'S1IPC_AUTHKEY'
+CHALLENGE_SIZE = 20
+DIGEST_SIZE = hashlib.sha256().digest_size
+# the tokens of the handshake are raw frames (refer to `RawSerializer`) of at most MAX_TOKEN_SIZE bytes: any other
+# frame sent before the peer is authenticated fails the handshake without being decoded
+TOKEN_FLAGS = 2
+MAX_TOKEN_SIZE = 64
+# seconds a server waits for the handshake of a new connection
+HANDSHAKE_TIMEOUT = 10.0
+
+
+class AuthenticationError(Exception):
+    """
+    Raised when the peer of a TCP connection does not prove it knows the shared secret.
+    """
+    pass
+
+
+def is_tcp(address):
+    """
+    :return: True if the address is a TCP (host, port) tuple, False if it is a UNIX socket path.
+    """
+    return isinstance(address, tuple)
+
+
+def tune_tcp(sock):
+    """
+    Disables Nagle's algorithm, as calls and replies are small messages which must leave at once, and enables
+    keepalive probes, so that connections to a dead host are eventually dropped.
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (('TCP_KEEPIDLE', KEEPALIVE_IDLE), ('TCP_KEEPINTVL', KEEPALIVE_INTERVAL),
+                          ('TCP_KEEPCNT', KEEPALIVE_COUNT)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+def get_authkey(authkey=None):
+    """
+    :param authkey: (optional) the shared secret, as bytes or str.
+    :return: the shared secret authenticating TCP connections, as bytes: `authkey` if given, else the value of the
+    S1IPC_AUTHKEY environment variable, or None if neither is set.
+    """
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV) or None
+    if authkey is not None and not isinstance(authkey, bytes):
+        authkey = authkey.encode('utf-8')
+    return authkey
+
+
+def _digest(authkey, message):
+    return hmac.new(authkey, message, hashlib.sha256).digest()
+
+
+def new_challenge():
+    return os.urandom(CHALLENGE_SIZE)
+
+
+def is_token(length, flags):
+    """
+    :return: True if a frame header announces a token of the handshake.
+    """
+    return flags == TOKEN_FLAGS and length <= MAX_TOKEN_SIZE
+
+
+def check_answer(authkey, challenge, answer):
+    """
+    Server side of the handshake: checks the answer of a client to the challenge it was sent.
+    :param answer: (bytes) the token of the client, the digest of `challenge` followed by the challenge of the client.
+    :return: the token to send back, proving the server knows the secret too, or None if the client failed.
+    """
+    if len(answer) != DIGEST_SIZE + CHALLENGE_SIZE or not hmac.compare_digest(answer[:DIGEST_SIZE],
+                                                                             _digest(authkey, challenge)):
+        return None
+    return _digest(authkey, answer[DIGEST_SIZE:])
+
+
+def answer_challenge(authkey, challenge):
+    """
+    Client side of the handshake: answers the challenge sent by the server, challenging it in return.
+    :return: a tuple (token to send, challenge of the client, to check the proof of the server with `check_proof`).
+    """
+    own = new_challenge()
+    return _digest(authkey, challenge) + own, own
+
+
+def check_proof(authkey, challenge, proof):
+    """
+    :param challenge: the challenge the client sent.
+    :param proof: (bytes) the last token of the handshake, sent by the server, or None if it closed the connection.
+    :raise AuthenticationError: if the server refused the client, or does not know the secret.
+    """
+    if proof is None:
+        raise AuthenticationError('The IPC server refused the authkey.')
+    if not hmac.compare_digest(proof, _digest(authkey, challenge)):
+        raise AuthenticationError('The IPC server does not know the authkey.')
+
+
+def send_token(protocol, sock, token):
+    protocol.send_buffers(sock, [protocol.HEADER.pack(len(token), TOKEN_FLAGS), token])
+
+
+def recv_token(protocol, sock):
+    """
+    :return: the token read from the socket, or None if the connection was closed or the frame is not a token.
+    """
+    header = protocol.recv_exactly(sock, protocol.HEADER_SIZE)
+    if header is None:
+        return None
+    length, flags = protocol.HEADER.unpack_from(header)
+    if not is_token(length, flags):
+        return None
+    token = protocol.recv_exactly(sock, length)
+    return None if token is None else bytes(token)
+
+
+def deliver_challenge(protocol, sock, authkey):
+    """
+    Authenticates the client of a new connection (blocking).
+    :return: True if the client proved it knows the secret.
+    """
+    challenge = new_challenge()
+    send_token(protocol, sock, challenge)
+    answer = recv_token(protocol, sock)
+    proof = None if answer is None else check_answer(authkey, challenge, answer)
+    if proof is None:
+        return False
+    send_token(protocol, sock, proof)
+    return True
+
+
+def authenticate(protocol, sock, authkey):
+    """
+    Authenticates a new connection to a server (blocking): both ends prove they know the secret, without sending it.
+    :raise AuthenticationError: if the server refused the client, or does not know the secret.
+    """
+    challenge = recv_token(protocol, sock)
+    if challenge is None:
+        raise AuthenticationError('The IPC server did not send a challenge.')
+    answer, own = answer_challenge(authkey, challenge)
+    send_token(protocol, sock, answer)
+    check_proof(authkey, own, recv_token(protocol, sock))